@@ -0,0 +1,162 @@
+"""
+File: memory.py
+Description: Memory benchmark for holding and formatting large numbers of Quotes
+
+@author Derek Garcia
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+ROOT = Path(__file__).resolve().parents[1]
+# quotebot modules use flat imports
+sys.path.insert(0, str(ROOT / "quotebot"))
+
+import suite  # noqa: E402
+from quote import Quote, format_quotee  # noqa: E402
+
+DEFAULT_SIZE = 1_000_000
+
+
+class DictQuote:
+    def __init__(self, quote: str, quotee: str, pre_context: str = None, post_context: str = None):
+        """
+        Quote stored the way it was before slots, kept as a reference point
+
+        :param quote: Quote message
+        :param quotee: Quotee
+        :param pre_context: Optional pre context to quote
+        :param post_context: Option post context to quote
+        """
+        self.pre_context = pre_context
+        self.quote = quote
+        self.post_context = post_context
+        self.quotee = quotee
+
+    def __str__(self):
+        pre_context = f"({self.pre_context}) " if self.pre_context is not None else ""
+        post_context = f" ({self.post_context})" if self.post_context is not None else ""
+        return f'{pre_context}"{self.quote}"{post_context} - {format_quotee(self.quotee)}'
+
+
+def allocated(func: Callable) -> tuple[object, int, int, float]:
+    """
+    Measure memory allocated by a function
+
+    :param func: Function to measure
+    :return: Result of the function, bytes still allocated after, peak bytes allocated during and seconds taken
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, seconds
+
+
+def per_quote(size: int, current: int, peak: int, seconds: float) -> dict:
+    """
+    :return: Measurement summary per quote
+    """
+    return {
+        "bytes_per_quote": round(current / size, 1),
+        "peak_bytes_per_quote": round(peak / size, 1),
+        "total_mb": round(current / 2 ** 20, 1),
+        "seconds": round(seconds, 3),
+    }
+
+
+def bench_objects(size: int) -> dict:
+    """
+    Measure the cost of building Quotes from rows and formatting them, against a plain __dict__ class
+
+    :param size: Number of quotes
+    :return: Measurements per case
+    """
+    # row strings are shared by every case so only the objects themselves are measured
+    rows = [(q.quote, q.quotee, q.pre_context, q.post_context) for q, _, _ in suite.synthetic_records(size)]
+    results = {}
+
+    quotes, current, peak, seconds = allocated(lambda: [DictQuote(*row) for row in rows])
+    results["dict_quote"] = per_quote(size, current, peak, seconds)
+    _, current, peak, seconds = allocated(lambda: [str(q) for q in quotes])
+    results["dict_quote[str]"] = per_quote(size, current, peak, seconds)
+    del quotes
+
+    quotes, current, peak, seconds = allocated(lambda: [Quote.from_row(None, row) for row in rows])
+    results["quote"] = per_quote(size, current, peak, seconds)
+    # first pass builds and caches the display strings, second only reads them
+    format_quotee.cache_clear()
+    _, current, peak, seconds = allocated(lambda: [str(q) for q in quotes])
+    results["quote[str]"] = per_quote(size, current, peak, seconds)
+    _, current, peak, seconds = allocated(lambda: [str(q) for q in quotes])
+    results["quote[str, cached]"] = per_quote(size, current, peak, seconds)
+    return results
+
+
+def bench_database(size: int, work_dir: Path) -> dict:
+    """
+    Measure loading every quote from a synthetic database
+
+    :param size: Number of quotes in the database
+    :param work_dir: Directory to keep generated databases in
+    :return: Measurements per case
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        database = suite.get_database(size, work_dir)
+    try:
+        database.cache.invalidate_where(lambda key: True)
+        _, current, peak, seconds = allocated(database.get_all_quotes)
+        return {"get_all_quotes": per_quote(size, current, peak, seconds)}
+    finally:
+        database.close()
+
+
+def main() -> None:
+    """
+    Run the memory benchmark and write JSON results
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="Number of quotes to hold")
+    parser.add_argument("--work-dir", type=Path, default=suite.DEFAULT_WORK_DIR,
+                        help="Where to keep generated databases")
+    parser.add_argument("--skip-database", action="store_true", help="Only measure Quote objects")
+    parser.add_argument("-o", "--output", type=Path, help="File to write JSON results to, defaults to stdout")
+    args = parser.parse_args()
+
+    # ddl path is relative to the repo root
+    os.chdir(ROOT)
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "size": args.size,
+        },
+        "memory": bench_objects(args.size),
+    }
+    if not args.skip_database:
+        results["memory"].update(bench_database(args.size, args.work_dir))
+
+    output = json.dumps(results, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        args.output.write_text(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+File: quote_parser.py
+Description: Micro-benchmark of the single pass quote parser against the original regex on adversarial message sizes
+
+@author Derek Garcia
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+# quotebot modules use flat imports
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "quotebot"))
+
+from quote import QUOTE_REGEX, match_quote  # noqa: E402
+
+DEFAULT_SIZES = [8, 16, 32, 64, 256, 1024, 4096]
+DEFAULT_REPEAT = 5
+DEFAULT_REGEX_BUDGET = 2.0  # seconds, regex runs are killed after this and larger sizes are skipped
+
+# name -> function that builds a message of about the given size
+CASES: dict[str, Callable[[int], str]] = {
+    "quote": lambda n: f'(context) "{"word " * n}" (more context) -Frank Reynolds',
+    "chatter": lambda n: "just talking about nothing in particular " * n,
+    "many_quotes": lambda n: '"a" ' * n + "-bob",
+    "parens_no_dash": lambda n: "(" + '"(a)' * n,
+    "nested_no_dash": lambda n: '("' + 'a) (b "' * n,
+}
+
+
+def regex_parse(message: str):
+    """
+    Original is_quote then parse_quote path, matches the regex twice
+
+    :param message: Message to parse
+    :return: Match or None
+    """
+    if QUOTE_REGEX.search(message.strip()) is None:
+        return None
+    return QUOTE_REGEX.match(message.strip())
+
+
+def time_call(func: Callable, message: str, repeat: int, budget: float = None) -> float:
+    """
+    Time a parser on a message
+
+    :param func: Parser to time
+    :param message: Message to parse
+    :param repeat: Number of runs, fastest is kept
+    :param budget: Optional seconds after which no more runs are started
+    :return: Fastest run in seconds
+    """
+    best = float("inf")
+    total = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(message)
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        total += elapsed
+        if budget is not None and total > budget:
+            break
+    return best
+
+
+def _time_in_child(message: str, repeat: int, budget: float, results: multiprocessing.Queue) -> None:
+    """
+    Time the regex parser and report back to the parent process
+
+    :param message: Message to parse
+    :param repeat: Number of runs, fastest is kept
+    :param budget: Seconds after which no more runs are started
+    :param results: Queue to put the result on
+    """
+    results.put(time_call(regex_parse, message, repeat, budget))
+
+
+def time_regex(message: str, repeat: int, budget: float) -> float | None:
+    """
+    Time the regex parser in a child process so catastrophic backtracking can be killed
+
+    :param message: Message to parse
+    :param repeat: Number of runs, fastest is kept
+    :param budget: Seconds to wait before giving up
+    :return: Fastest run in seconds or None if over budget
+    """
+    results = multiprocessing.Queue()
+    child = multiprocessing.Process(target=_time_in_child, args=(message, repeat, budget, results), daemon=True)
+    child.start()
+    child.join(budget)
+    if child.is_alive():
+        child.terminate()
+        child.join()
+        return None
+    return results.get()
+
+
+def run(sizes: list[int], repeat: int = DEFAULT_REPEAT, regex_budget: float | None = DEFAULT_REGEX_BUDGET) -> list[dict]:
+    """
+    Run every case at every size
+
+    :param sizes: Message size multipliers to run
+    :param repeat: Number of runs per measurement
+    :param regex_budget: Max seconds to time the regex before skipping larger sizes of that case, None to skip it
+    :return: List of results
+    """
+    results = []
+    for case, build in CASES.items():
+        regex_over_budget = regex_budget is None  # None skips the regex entirely
+        for size in sizes:
+            message = build(size)
+            single_pass = time_call(match_quote, message, repeat)
+            regex = None
+            if not regex_over_budget:
+                regex = time_regex(message, repeat, regex_budget)
+                regex_over_budget = regex is None
+            results.append({
+                "case": case,
+                "size": size,
+                "chars": len(message),
+                "single_pass_us": round(single_pass * 1e6, 3),
+                "regex_us": None if regex is None else round(regex * 1e6, 3),
+            })
+    return results
+
+
+def main() -> None:
+    """
+    Run the benchmark and print a table
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Message size multipliers")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Runs per measurement")
+    parser.add_argument("--regex-budget", type=float, default=DEFAULT_REGEX_BUDGET,
+                        help="Seconds before the regex is killed and skipped for larger sizes")
+    args = parser.parse_args()
+
+    print(f"{'case':<16}{'size':>6}{'chars':>8}{'single pass us':>16}{'regex us':>16}")
+    for r in run(args.sizes, args.repeat, args.regex_budget):
+        regex = "over budget" if r["regex_us"] is None else r["regex_us"]
+        print(f"{r['case']:<16}{r['size']:>6}{r['chars']:>8}{r['single_pass_us']:>16}{regex:>16}")
+
+
+if __name__ == '__main__':
+    main()
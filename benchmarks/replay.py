@@ -0,0 +1,391 @@
+"""
+File: replay.py
+Description: Replay a message stream through QuoteBot offline to measure throughput, handler latency and event loop
+blocking without a Discord token
+
+@author Derek Garcia
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterator
+
+ROOT = Path(__file__).resolve().parents[1]
+# quotebot modules use flat imports
+sys.path.insert(0, str(ROOT / "quotebot"))
+
+import suite  # noqa: E402
+from database import Database  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from quotebot import QuoteBot  # noqa: E402
+
+DEFAULT_SIZE = 10_000
+DEFAULT_MESSAGES = 5_000
+DEFAULT_RATE = 0.0  # messages per second, 0 replays as fast as possible
+DEFAULT_COMMAND_RATIO = 0.2
+DEFAULT_QUOTE_RATIO = 0.05
+LAG_INTERVAL = 0.01  # seconds between event loop lag probes
+SKIPPED_COMMANDS = {"qkill"}  # would exit the harness
+
+WORDS = suite.WORDS
+CHATTER = ("anyone want to get lunch later?", "lol", "did you see the game last night",
+           "I'm (probably) going to be late", "ok", "that's what she said - me, just now")
+
+
+class Author:
+    def __init__(self, author_id: int, name: str, bot: bool = False):
+        """
+        Stub discord author
+
+        :param author_id: ID of the author
+        :param name: Display name of the author
+        :param bot: True if the author is a bot
+        """
+        self.id = author_id
+        self.name = name
+        self.bot = bot
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class Channel:
+    def __init__(self, channel_id: int):
+        """
+        Stub discord channel that counts what the bot sends instead of sending it
+
+        :param channel_id: ID of the channel
+        """
+        self.id = channel_id
+        self.sent = 0
+        self.sent_chars = 0
+
+    async def send(self, content) -> None:
+        """
+        Record a message sent by the bot
+
+        :param content: Content of the message
+        """
+        self.sent += 1
+        self.sent_chars += len(str(content))
+
+
+class Guild:
+    def __init__(self, guild_id: int):
+        """
+        Stub discord guild
+
+        :param guild_id: ID of the guild
+        """
+        self.id = guild_id
+
+
+class Message:
+    def __init__(self, content: str, author: Author, channel: Channel, guild: Guild = None):
+        """
+        Stub discord message
+
+        :param content: Text of the message
+        :param author: Author of the message
+        :param channel: Channel the message was sent in
+        :param guild: Optional guild the message was sent in, None for direct messages
+        """
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = guild
+
+
+class Context:
+    def __init__(self, message: Message):
+        """
+        Stub command context
+
+        :param message: Message that invoked the command
+        """
+        self.message = message
+        self.author = message.author
+        self.channel = message.channel
+        self.guild = message.guild
+        self.command = None
+        self.command_failed = False
+
+
+class ReplayBot(QuoteBot):
+    """
+    QuoteBot that dispatches commands from stub messages and never connects to the gateway
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.presence_updates = 0
+        self.command_errors = 0
+
+    async def change_presence(self, **kwargs) -> None:
+        """
+        Count presence updates instead of sending them to the gateway
+
+        :param kwargs: Ignored change_presence args
+        """
+        self.presence_updates += 1
+
+    async def process_commands(self, message: Message) -> None:
+        """
+        Minimal stand in for discord.py command dispatch, calls the command callback with the rest of the message
+
+        :param message: Message to check for a command
+        """
+        if not message.content.startswith(self.command_prefix) or message.author.bot:
+            return
+        name, _, rest = message.content[len(self.command_prefix):].partition(" ")
+        command = self.get_command(name)
+        if command is None or command.name in SKIPPED_COMMANDS:
+            return
+
+        # commands take at most one keyword only arg that consumes the rest of the message
+        kwargs = {param: rest.strip() or None for param in command.clean_params}
+        ctx = Context(message)
+        ctx.command = command
+        await self.start_command_timer(ctx)
+        try:
+            await command.callback(ctx, **kwargs)
+        except Exception as e:
+            ctx.command_failed = True
+            self.command_errors += 1
+            print(f"{name} failed: {e!r}", file=sys.stderr)
+        finally:
+            await self.record_command_time(ctx)
+
+
+def synthetic_stream(count: int, quotees: list[str], command_ratio: float, quote_ratio: float,
+                     seed: int = suite.SEED) -> Iterator[dict]:
+    """
+    Generate a deterministic mix of commands, quote-like messages and chatter
+
+    :param count: Number of messages to generate
+    :param quotees: Quotees in the database to use in commands
+    :param command_ratio: Fraction of messages that are commands
+    :param quote_ratio: Fraction of messages that are quote-like
+    :param seed: Random seed
+    :return: Iterator of message records
+    """
+    rng = random.Random(seed)
+    words = lambda n: " ".join(rng.choice(WORDS) for _ in range(n))  # noqa: E731
+    commands = (
+        lambda: f"!q {rng.choice(quotees)}",
+        lambda: f"!q {words(2)}",  # miss, lists similar
+        lambda: f"!qall {rng.choice(quotees)}",
+        lambda: f"!qall {rng.choice(quotees)} page 2",
+        lambda: "!qrand",
+        lambda: "!qsearch",
+        lambda: f"!qsearch {rng.choice(quotees)[:5]}",
+        lambda: f"!qfind {words(2)}",
+        lambda: "!qstat",
+        lambda: f"!qstat {rng.choice(quotees)}",
+        lambda: "!qhelp",
+        lambda: f'!qadd "{words(6)}" -{rng.choice(quotees)}',
+    )
+    for i in range(count):
+        roll = rng.random()
+        if roll < command_ratio:
+            content = rng.choice(commands)()
+        elif roll < command_ratio + quote_ratio:
+            content = f'"{words(rng.randint(3, 12))}" -{rng.choice(quotees)}'
+        else:
+            content = rng.choice(CHATTER) if rng.random() < 0.5 else words(rng.randint(1, 25))
+        yield {"content": content, "author": f"user {rng.randrange(50)}", "channel": rng.randrange(5)}
+
+
+def read_stream(path: Path) -> Iterator[dict]:
+    """
+    Read a recorded message stream, one JSON object per line with content and optional author, channel, guild and bot
+
+    :param path: Path to the recording
+    :return: Iterator of message records
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """
+    Get a percentile of sorted values
+
+    :param values: Sorted values
+    :param fraction: Percentile as a fraction, e.g. 0.99
+    :return: Value at the percentile
+    """
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def summarize(metrics: Metrics, kind: str) -> dict:
+    """
+    Get the latency of each command or query recorded by the bot in milliseconds
+
+    :param metrics: Metrics recorded by the bot
+    :param kind: Kind of call to summarize
+    :return: Summary per command or query
+    """
+    return {s["name"]: {"count": s["count"], "errors": s["errors"], "avg_ms": round(s["avg"] * 1e3, 3),
+                        "p50_ms": round(s["p50"] * 1e3, 3), "p99_ms": round(s["p99"] * 1e3, 3)}
+            for s in metrics.summary(kind)}
+
+
+async def probe_lag(lags: list[float]) -> None:
+    """
+    Record how late the event loop wakes up a sleeping task, anything well over zero means the loop was blocked
+
+    :param lags: List to append lag in seconds to
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        lags.append(loop.time() - start - LAG_INTERVAL)
+
+
+async def replay(bot: ReplayBot, records: list[dict], rate: float) -> dict:
+    """
+    Feed messages to the bot's on_message and time each handler
+
+    :param bot: Bot to replay messages through
+    :param records: Message records to replay
+    :param rate: Messages per second to send at, 0 sends each message as soon as the last one is handled
+    :return: Replay report
+    """
+    channels: dict[int, Channel] = {}
+    authors: dict[str, Author] = {}
+    guilds: dict[int, Guild] = {}
+    latencies: list[float] = []
+    lags: list[float] = []
+
+    async def handle(message: Message) -> None:
+        start = time.perf_counter()
+        await bot.on_message(message)
+        latencies.append(time.perf_counter() - start)
+
+    messages = []
+    for record in records:
+        channel = channels.setdefault(record.get("channel", 0), Channel(record.get("channel", 0)))
+        name = record.get("author", "user")
+        author = authors.get(name)
+        if author is None:
+            author = authors[name] = Author(len(authors), name, record.get("bot", False))
+        guild = None if record.get("guild") is None else guilds.setdefault(record["guild"], Guild(record["guild"]))
+        messages.append(Message(record["content"], author, channel, guild))
+
+    bot.presence.start()
+    prober = asyncio.create_task(probe_lag(lags))
+    start = time.perf_counter()
+    if rate > 0:
+        # open loop, messages arrive on schedule whether or not earlier ones are done like the real gateway
+        tasks = []
+        for i, message in enumerate(messages):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(handle(message)))
+        await asyncio.gather(*tasks)
+    else:
+        for message in messages:
+            await handle(message)
+    elapsed = time.perf_counter() - start
+    # quote-like adds still queued are written after the handlers return, not counted in elapsed
+    await bot.ingest.close()
+    prober.cancel()
+    bot.presence.stop()
+    await bot.database.flush_logs()
+
+    latencies.sort()
+    lags.sort()
+    return {
+        "messages": len(messages),
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(len(messages) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1e3, 3),
+            "p99": round(percentile(latencies, 0.99) * 1e3, 3),
+            "max": round(latencies[-1] * 1e3, 3) if latencies else 0.0,
+        },
+        "loop_lag_ms": {
+            "p50": round(percentile(lags, 0.50) * 1e3, 3),
+            "p99": round(percentile(lags, 0.99) * 1e3, 3),
+            "max": round(lags[-1] * 1e3, 3) if lags else 0.0,
+        },
+        "sent": sum(c.sent for c in channels.values()),
+        "sent_chars": sum(c.sent_chars for c in channels.values()),
+        "presence_updates": bot.presence_updates,
+        "command_errors": bot.command_errors,
+        "throttled": bot.metrics.counts("throttled"),
+        "ingest": bot.ingest.stats(),
+        "quotes": bot.database.database.get_quote_total_all_guilds(),
+        "commands": summarize(bot.metrics, "command"),
+        "queries": summarize(bot.metrics, "query"),
+    }
+
+
+def main() -> None:
+    """
+    Build a scratch database, replay a message stream and print a JSON report
+    """
+    parser = argparse.ArgumentParser(description="Replay messages through QuoteBot without connecting to Discord")
+    parser.add_argument("-i", "--input", type=Path, help="Recorded JSONL message stream, defaults to synthetic")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="Quotes in the scratch database")
+    parser.add_argument("-n", "--messages", type=int, default=DEFAULT_MESSAGES, help="Synthetic messages to replay")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                        help="Messages per second, 0 replays as fast as possible")
+    parser.add_argument("--command-ratio", type=float, default=DEFAULT_COMMAND_RATIO,
+                        help="Fraction of synthetic messages that are commands")
+    parser.add_argument("--quote-ratio", type=float, default=DEFAULT_QUOTE_RATIO,
+                        help="Fraction of synthetic messages that are quote-like")
+    parser.add_argument("--presence-interval", type=float, default=1.0, help="Min seconds between presence updates")
+    parser.add_argument("--throttle", action="store_true",
+                        help="Apply the default command throttle, off by default so every message is handled")
+    parser.add_argument("--work-dir", type=Path, default=suite.DEFAULT_WORK_DIR,
+                        help="Where to keep generated databases")
+    parser.add_argument("-o", "--output", type=Path, help="File to write the JSON report to, defaults to stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # replay adds quotes, work on a copy so the cached database stays the same between runs
+        with contextlib.redirect_stdout(io.StringIO()):
+            suite.get_database(args.size, args.work_dir).close()
+        path = Path(scratch) / "replay.db"
+        shutil.copy(args.work_dir / f"quotes-{args.size}.db", path)
+
+        # ddl path is relative to the repo root
+        with contextlib.chdir(ROOT), contextlib.redirect_stdout(io.StringIO()):
+            database = Database(str(path))
+            bot = ReplayBot(database, presence_interval=args.presence_interval,
+                            throttle_limits=None if args.throttle else {})
+            try:
+                if args.input is not None:
+                    records = list(read_stream(args.input))
+                else:
+                    records = list(synthetic_stream(args.messages, database.get_all_quotees(),
+                                                    args.command_ratio, args.quote_ratio))
+                report = asyncio.run(replay(bot, records, args.rate))
+            finally:
+                bot.database.close()
+
+    report["size"] = args.size
+    report["rate"] = args.rate
+    output = json.dumps(report, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        args.output.write_text(output)
+
+
+if __name__ == '__main__':
+    main()
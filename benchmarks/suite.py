@@ -0,0 +1,254 @@
+"""
+File: suite.py
+Description: Benchmark suite for Database methods and quote parsing on synthetic databases of increasing size
+
+@author Derek Garcia
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterator
+
+ROOT = Path(__file__).resolve().parents[1]
+# quotebot modules use flat imports
+sys.path.insert(0, str(ROOT / "quotebot"))
+
+import quote_parser  # noqa: E402
+from database import Database  # noqa: E402
+from quote import Quote, match_quote  # noqa: E402
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_REPEAT = 50
+DEFAULT_WORK_DIR = ROOT / "benchmarks" / "data"
+DEFAULT_THRESHOLD = 1.25  # fastest run slower than baseline by this factor is a regression
+PARSER_SIZES = [16, 256, 4096]
+PARSER_INNER = 1000
+WARMUP = 3
+MIN_DELTA_US = 1.0  # ignore slowdowns smaller than timer noise
+SEED = 1206
+
+WORDS = ("the", "golden", "god", "trash", "man", "ring", "calculator", "school", "supreme", "bird", "law", "cat",
+         "nightman", "cometh", "dayman", "fighter", "champion", "sun", "kitten", "mittens", "green", "rum", "ham")
+PARSER_MESSAGES = {
+    "realistic_quote": '(holding a calculator) "What are you?" (smashes it) -Charlie Kelly',
+    "realistic_chatter": "anyone want to get lunch later? I was thinking about the place downtown",
+    "adversarial_parens": "(" + '"(a)' * 512,
+    "adversarial_chatter": "just talking about nothing in particular " * 256,
+}
+
+
+def synthetic_records(size: int) -> Iterator[tuple[Quote, str, None]]:
+    """
+    Generate deterministic quotes with a long tail of quotees, a few people are quoted far more than others
+
+    :param size: Number of quotes to generate
+    :return: Iterator of (quote, contributor, time)
+    """
+    rng = random.Random(SEED)
+    quotees = [f"person {i} {rng.choice(WORDS)}" for i in range(max(10, size // 50))]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(quotees))))
+    for i in range(size):
+        quotee = rng.choices(quotees, cum_weights=cum_weights)[0]
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 20)))
+        pre_context = " ".join(rng.choice(WORDS) for _ in range(3)) if i % 4 == 0 else None
+        yield Quote(f"{text} {i}", quotee, pre_context), f"contributor {i % 100}", None
+
+
+def get_database(size: int, work_dir: Path) -> Database:
+    """
+    Open a synthetic database of the given size, generating it if it doesn't exist yet
+
+    :param size: Number of quotes in the database
+    :param work_dir: Directory to keep generated databases in
+    :return: Database
+    """
+    work_dir.mkdir(parents=True, exist_ok=True)
+    path = work_dir / f"quotes-{size}.db"
+    complete = work_dir / f"quotes-{size}.done"
+    # regenerate if a previous run was interrupted
+    if path.exists() and not complete.exists():
+        for file in work_dir.glob(f"quotes-{size}.db*"):
+            file.unlink()
+
+    start = time.perf_counter()
+    database = Database(str(path))
+    if not complete.exists():
+        database.import_quotes(synthetic_records(size))
+        complete.touch()
+        print(f"generated {size} quotes in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return database
+
+
+def measure(func: Callable, repeat: int, setup: Callable = None, inner: int = 1) -> dict:
+    """
+    Time a function
+
+    :param func: Function to time, gets the result of setup as its argument if given
+    :param repeat: Number of runs
+    :param setup: Optional untimed function to run before each run
+    :param inner: Number of calls per run for functions too fast to time one call at a time
+    :return: Timing summary in microseconds per call
+    """
+    # warm caches and connections so the first runs aren't outliers
+    for _ in range(min(WARMUP, repeat)):
+        func(setup()) if setup is not None else func()
+
+    runs = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        for _ in range(inner):
+            func(arg) if setup is not None else func()
+        runs.append((time.perf_counter() - start) * 1e6 / inner)
+    runs.sort()
+    return {
+        "runs": repeat,
+        "min_us": round(runs[0], 3),
+        "median_us": round(statistics.median(runs), 3),
+        "p95_us": round(runs[min(len(runs) - 1, int(len(runs) * 0.95))], 3),
+    }
+
+
+def bench_database(database: Database, repeat: int) -> dict:
+    """
+    Time each Database method
+
+    :param database: Database to benchmark
+    :param repeat: Number of runs per method
+    :return: Timing summary per method
+    """
+    rng = random.Random(SEED)
+    quotees = database.get_all_quotees()
+    top = max(quotees, key=database.get_quote_total)  # most quoted, worst case for per quotee lookups
+    clear_cache = lambda: database.cache.invalidate_where(lambda key: True)  # noqa: E731
+    added = itertools.count()  # unique text so added quotes aren't rejected as duplicates
+
+    results = {
+        "get_rand_quote": measure(database.get_rand_quote, repeat),
+        "get_rand_quote[quotee]": measure(lambda: database.get_rand_quote(rng.choice(quotees)), repeat),
+        "get_quote_total": measure(database.get_quote_total, repeat),
+        "get_quote_total[quotee]": measure(lambda: database.get_quote_total(rng.choice(quotees)), repeat),
+        "get_all_quotes[top quotee]": measure(lambda _: database.get_all_quotes(top), repeat, clear_cache),
+        "get_all_quotes[top quotee, cached]": measure(lambda: database.get_all_quotes(top), repeat),
+        "get_quote_page[top quotee]": measure(lambda: database.get_quote_page(top, 1), repeat),
+        "find_similar_quotee": measure(lambda _: database.find_similar_quotee("persn 12"), repeat, clear_cache),
+        "find_similar_quotee[cached]": measure(lambda: database.find_similar_quotee("persn 12"), repeat),
+        "search_quotes": measure(lambda: database.search_quotes("golden god"), repeat),
+        "add_quote": measure(
+            lambda: database.add_quote(Quote(f"benchmark quote {next(added)}", rng.choice(quotees)), "benchmark"),
+            repeat),
+    }
+    # full table reads are slow on large databases, run them fewer times
+    results["get_all_quotes"] = measure(lambda _: database.get_all_quotes(), max(1, repeat // 10), clear_cache)
+
+    # remove added quotes so the database is the same for the next run
+    with database.pool.write() as conn:
+        conn.execute("DELETE FROM quote WHERE contributor = 'benchmark';")
+    return results
+
+
+def bench_parser(repeat: int) -> dict:
+    """
+    Time the quote parser on realistic and adversarial messages
+
+    :param repeat: Number of runs per message
+    :return: Timing summary per message
+    """
+    results = {}
+    messages = dict(PARSER_MESSAGES)
+    # scaling of the parser by message size
+    for case, build in quote_parser.CASES.items():
+        for size in PARSER_SIZES:
+            message = build(size)
+            messages[f"{case}[{len(message)} chars]"] = message
+    for name, message in messages.items():
+        results[name] = measure(lambda m=message: match_quote(m), repeat, inner=PARSER_INNER)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Find benchmarks that got slower than the baseline
+
+    :param results: Results of this run
+    :param baseline: Results of a previous run
+    :param threshold: Slowdown factor that counts as a regression
+    :return: List of regression descriptions
+    """
+    regressions = []
+    # compare fastest runs, medians swing too much with other load on the machine
+    for group, benchmarks in results["benchmarks"].items():
+        for name, timing in benchmarks.items():
+            old = baseline.get("benchmarks", {}).get(group, {}).get(name)
+            if old is None or not old.get("min_us"):
+                continue
+            ratio = timing["min_us"] / old["min_us"]
+            if ratio > threshold and timing["min_us"] - old["min_us"] > MIN_DELTA_US:
+                regressions.append(f"{group} {name}: {old['min_us']}us -> {timing['min_us']}us ({ratio:.2f}x)")
+    return regressions
+
+
+def main() -> None:
+    """
+    Run the suite, write JSON results and optionally compare against a baseline
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Database sizes to benchmark")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Runs per benchmark")
+    parser.add_argument("--work-dir", type=Path, default=DEFAULT_WORK_DIR, help="Where to keep generated databases")
+    parser.add_argument("-o", "--output", type=Path, help="File to write JSON results to, defaults to stdout")
+    parser.add_argument("--baseline", type=Path, help="Previous JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Slowdown factor that counts as a regression")
+    args = parser.parse_args()
+
+    # ddl path is relative to the repo root
+    os.chdir(ROOT)
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "benchmarks": {"parser": bench_parser(args.repeat)},
+    }
+    for size in args.sizes:
+        # silence the console logging done by the database
+        with contextlib.redirect_stdout(io.StringIO()):
+            database = get_database(size, args.work_dir)
+            try:
+                results["benchmarks"][f"database[{size}]"] = bench_database(database, args.repeat)
+            finally:
+                database.close()
+        print(f"benchmarked {size} quotes", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        args.output.write_text(output)
+
+    if args.baseline is not None:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()
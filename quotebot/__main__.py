@@ -4,6 +4,12 @@ Description: Main Program that loads env vars and launches bot
 
 @author Derek Garcia
 """
+from startup import StartupTimer, warm_up_in_background
+
+TIMER = StartupTimer()  # first so every import is timed
+
+# the timer has to start before anything else is imported or the import time it reports would miss most of it
+# pylint: disable=wrong-import-position,wrong-import-order
 import argparse
 import os
 import sys
@@ -11,17 +17,74 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 
-from database import Database
-from quotebot import QuoteBot
+from backends import DEFAULT_BACKEND, open_storage
+from backup import DEFAULT_BACKUP_INTERVAL, DEFAULT_BACKUP_KEEP
+from ingest import DEFAULT_BATCH_SIZE
+from logger import Status, log
+from metrics import DEFAULT_METRICS_INTERVAL
+from presence import DEFAULT_PRESENCE_INTERVAL
+from throttle import DEFAULT_LIMITS, DEFAULT_MAX_BUCKETS, SCOPES, parse_limit
+# pylint: enable=wrong-import-position,wrong-import-order
+
+TIMER.lap("imports")
 
 
 def main() -> None:
     """
     Init quote database and launch bot
     """
-    database = Database(os.getenv("DATABASE_PATH"))
-    bot = QuoteBot(database, os.getenv("BLACKLIST"))
-    bot.run(os.getenv("TOKEN"))
+    # open without loading indexes or snapshots, that runs in the background while discord.py imports and connects
+    database = open_storage(os.getenv("STORAGE", DEFAULT_BACKEND), os.getenv("DATABASE_PATH"), warm=False)
+    TIMER.lap("storage")
+    warm_up = warm_up_in_background(database, TIMER)
+    from quotebot import QuoteBot, ShardedQuoteBot  # discord.py is the slowest import by far
+    TIMER.lap("discord import")
+
+    metrics_port = os.getenv("METRICS_PORT")
+    log_retention_days = os.getenv("LOG_RETENTION_DAYS")
+
+    # run as an auto sharded bot if any shard settings are given, optionally only a subset of shards in this process
+    shard_count = os.getenv("SHARD_COUNT")
+    shard_ids = os.getenv("SHARD_IDS")
+    sharded = os.getenv("SHARDED", "false").lower() == "true" or shard_count or shard_ids
+    options = {}
+    if shard_count:
+        options["shard_count"] = int(shard_count)
+    if shard_ids:
+        options["shard_ids"] = [int(i) for i in shard_ids.split(",")]
+
+    # THROTTLE_USER, THROTTLE_CHANNEL and THROTTLE_GUILD
+    throttle_limits = {scope: parse_limit(os.getenv(f"THROTTLE_{scope.upper()}", DEFAULT_LIMITS[scope]))
+                       for scope in SCOPES}
+
+    bot = (ShardedQuoteBot if sharded else QuoteBot)(
+        database, os.getenv("BLACKLIST"),
+        float(os.getenv("PRESENCE_INTERVAL", str(DEFAULT_PRESENCE_INTERVAL))),
+        int(metrics_port) if metrics_port else None,
+        os.getenv("METRICS_FILE") or None,
+        float(os.getenv("METRICS_INTERVAL", str(DEFAULT_METRICS_INTERVAL))),
+        int(log_retention_days) if log_retention_days else None,
+        guild_partitions=os.getenv("GUILD_PARTITIONS", "false").lower() == "true",
+        guild_db_path=os.getenv("GUILD_DB_PATH") or None,
+        throttle_limits=throttle_limits,
+        throttle_max_buckets=int(os.getenv("THROTTLE_MAX_BUCKETS", str(DEFAULT_MAX_BUCKETS))),
+        ingest_batch_size=int(os.getenv("INGEST_BATCH_SIZE", str(DEFAULT_BATCH_SIZE))),
+        backup_path=os.getenv("BACKUP_PATH") or None,
+        backup_keep=int(os.getenv("BACKUP_KEEP", str(DEFAULT_BACKUP_KEEP))),
+        backup_interval=float(os.getenv("BACKUP_INTERVAL", str(DEFAULT_BACKUP_INTERVAL))),
+        startup=TIMER,
+        warm_up=warm_up,
+        **options
+    )
+    TIMER.lap("bot")
+    try:
+        bot.run(os.getenv("TOKEN"))
+    finally:
+        for name, stats in database.get_stats().items():
+            log("admin", "stop", Status.INFO, f"{name}: {stats}")
+        log("admin", "stop", Status.INFO, f"throttle: {bot.throttle.stats()}")
+        log("admin", "stop", Status.INFO, f"ingest: {bot.ingest.stats()}")
+        bot.partitions.close()  # drain pending queries before closing connections
 
 
 if __name__ == '__main__':
@@ -37,6 +100,7 @@ if __name__ == '__main__':
         load_dotenv()
     else:
         load_dotenv(dotenv_path=Path(args.environment))
+    TIMER.lap("environment")
 
     try:
         assert os.getenv("TOKEN") is not None
@@ -0,0 +1,231 @@
+"""
+File: async_database.py
+Description: Async wrapper that runs storage queries off the event loop
+
+@author Derek Garcia
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import DEFAULT_GUILD_ID, DEFAULT_PAGE_SIZE, DEFAULT_SEARCH_LIMIT, Storage
+from metrics import Metrics
+from quote import Quote
+from quotee_index import DEFAULT_SUGGESTION_LIMIT, Suggestion
+
+
+class AsyncDatabase:
+    def __init__(self, database: Storage, executor: ThreadPoolExecutor = None):
+        """
+        Wrap a storage backend so queries are run on executor threads instead of the event loop
+
+        :param database: Storage backend to wrap
+        :param executor: Optional executor shared with other databases, the owner shuts it down. Defaults to a new
+        executor sized to the backend
+        """
+        self.database = database
+        # backends that never block run inline
+        self.executor = None
+        self._owns_executor = False
+        if database.concurrency > 0:
+            self.executor = executor
+            if executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=database.concurrency, thread_name_prefix="quotebot-db")
+                self._owns_executor = True
+
+    @property
+    def db_location(self) -> str:
+        """
+        :return: Location of the wrapped storage backend
+        """
+        return self.database.db_location
+
+    @property
+    def metrics(self) -> Metrics:
+        """
+        :return: Query metrics of the wrapped database
+        """
+        return self.database.metrics
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run a blocking function on the database executor, or inline if the backend has none
+
+        :param func: Function to run
+        :param args: Function args
+        :param kwargs: Function keyword args
+        :return: Result of the function
+        """
+        if self.executor is None:
+            return func(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def add_quote(self, quote: Quote, contributor: str, guild_id: int = DEFAULT_GUILD_ID) -> int:
+        """
+        Add a quote to the database
+
+        :param quote: Quote to add
+        :param contributor: Contributor who added the quote
+        :param guild_id: Guild the quote was added in
+        :return: Quote ID in database
+        """
+        return await self.run(self.database.add_quote, quote, contributor, guild_id)
+
+    async def add_quotes(self, records: list[tuple[Quote, str]], guild_id: int = DEFAULT_GUILD_ID) -> list[int]:
+        """
+        Add a batch of quotes to the database at once
+
+        :param records: List of (quote, contributor) to add
+        :param guild_id: Guild the quotes were added in
+        :return: Quote ID of each record in order
+        """
+        return await self.run(self.database.add_quotes, records, guild_id)
+
+    async def find_similar_quotee(self, quotee: str, limit: int = DEFAULT_SUGGESTION_LIMIT,
+                                  guild_id: int = DEFAULT_GUILD_ID) -> list[Suggestion]:
+        """
+        Get list of quotees that a similar to the given quotee
+
+        :param quotee: Quotee to attempt to match
+        :param limit: Max number of quotees to return
+        :param guild_id: Guild to search quotees of
+        :return: List of similar quotees ordered by most similar, with the spans of each name that matched
+        """
+        return await self.run(self.database.find_similar_quotee, quotee, limit, guild_id)
+
+    async def get_all_quotees(self, guild_id: int = DEFAULT_GUILD_ID) -> list[str]:
+        """
+        Get all quotees of a guild
+
+        :param guild_id: Guild to get quotees of
+        :return: List of quotees
+        """
+        return await self.run(self.database.get_all_quotees, guild_id)
+
+    async def get_all_quotes(self, quotee: str = None, guild_id: int = DEFAULT_GUILD_ID) -> list[Quote]:
+        """
+        Get all quotes of a guild or for specific quotee
+
+        :param quotee: Optional quotee to get all quotes for
+        :param guild_id: Guild to get quotes of
+        :return: List of Quotes
+        """
+        return await self.run(self.database.get_all_quotes, quotee, guild_id)
+
+    async def get_quote_page(self, quotee: str, page: int = 1, page_size: int = DEFAULT_PAGE_SIZE,
+                             guild_id: int = DEFAULT_GUILD_ID) -> list[Quote]:
+        """
+        Get one page of a quotee's quotes in the order they were added
+
+        :param quotee: Quotee to get quotes for
+        :param page: Page number, starting at 1
+        :param page_size: Number of quotes per page
+        :param guild_id: Guild of the quotee
+        :return: List of at most page size Quotes, empty if the page is out of range
+        """
+        return await self.run(self.database.get_quote_page, quotee, page, page_size, guild_id)
+
+    async def get_rand_quote(self, quotee: str = None, guild_id: int = DEFAULT_GUILD_ID) -> Quote | None:
+        """
+        Get a random quote from a guild or specific quotee
+
+        :param quotee: Optional quotee to get a random quote from
+        :param guild_id: Guild to get a random quote from
+        :return: Quote or None if no quotes from quotee
+        """
+        return await self.run(self.database.get_rand_quote, quotee, guild_id)
+
+    async def search_quotes(self, keywords: str, limit: int = DEFAULT_SEARCH_LIMIT,
+                            guild_id: int = DEFAULT_GUILD_ID) -> list[Quote]:
+        """
+        Full text search the quote and context text of a guild's quotes
+
+        :param keywords: Words to search for, all must be present
+        :param limit: Max number of quotes to return
+        :param guild_id: Guild to search quotes of
+        :return: List of Quotes ordered by relevance
+        """
+        return await self.run(self.database.search_quotes, keywords, limit, guild_id)
+
+    async def get_quote_total(self, quotee: str = None, guild_id: int = DEFAULT_GUILD_ID) -> int:
+        """
+        Get the total number of quotes of a guild or for a quotee
+
+        :param quotee: Optional quotee to get a total quotes from
+        :param guild_id: Guild to count quotes of
+        :return: Number of quotes
+        """
+        return await self.run(self.database.get_quote_total, quotee, guild_id)
+
+    async def get_quote_total_all_guilds(self) -> int:
+        """
+        Get the total number of quotes in the database across every guild
+
+        :return: Number of quotes
+        """
+        return await self.run(self.database.get_quote_total_all_guilds)
+
+    async def get_quotee_total(self, guild_id: int = DEFAULT_GUILD_ID) -> int:
+        """
+        Get the total number of quotees of a guild
+
+        :param guild_id: Guild to count quotees of
+        :return: Number of quotees in the guild
+        """
+        return await self.run(self.database.get_quotee_total, guild_id)
+
+    def log(self, user: str, action: str, status: str, add_info=None, guild_id: int = DEFAULT_GUILD_ID) -> None:
+        """
+        Queue log message to be saved to the database. Does not block so it can be used by the sync logger
+
+        :param user: User who performed the action
+        :param action: Action performed
+        :param status: Status / result of action
+        :param add_info: Optional additional details to add
+        :param guild_id: Guild the action was performed in
+        """
+        self.database.log(user, action, status, add_info, guild_id)
+
+    async def apply_log_retention(self, days: int) -> dict:
+        """
+        Roll up and delete log rows older than the retention period
+
+        :param days: Number of days of raw log rows to keep
+        :return: Dictionary of rows deleted and pages freed
+        """
+        return await self.run(self.database.apply_log_retention, days)
+
+    async def backup(self, location: str) -> dict:
+        """
+        Write a consistent copy of the database without stopping queries
+
+        :param location: File to write the copy to
+        :return: Dictionary of the size of the copy in bytes and the steps taken to copy it
+        """
+        return await self.run(self.database.backup, location)
+
+    async def flush_logs(self) -> int:
+        """
+        Write all buffered log messages now
+
+        :return: Number of log messages written
+        """
+        return await self.run(self.database.flush_logs)
+
+    def get_stats(self) -> dict[str, dict]:
+        """
+        Get backend specific usage stats
+
+        :return: Dictionary of stat group name to stats
+        """
+        return self.database.get_stats()
+
+    def close(self) -> None:
+        """
+        Wait for pending queries to finish then close the database, a shared executor must be shut down by its owner
+        first
+        """
+        if self._owns_executor:
+            self.executor.shutdown(wait=True)
+        self.database.close()
@@ -0,0 +1,30 @@
+"""
+File: backends.py
+Description: Open a quote storage backend by name
+
+@author Derek Garcia
+"""
+import importlib
+
+from storage import Storage
+
+DEFAULT_BACKEND = "sqlite"
+BACKENDS = {
+    "sqlite": ("database", "Database"),
+    "memory": ("memory_storage", "MemoryStorage")
+}  # name -> (module, class), only the backend in use is imported
+
+
+def open_storage(backend: str = DEFAULT_BACKEND, location: str = None, warm: bool = True) -> Storage:
+    """
+    Open a storage backend
+
+    :param backend: Name of the backend, one of BACKENDS
+    :param location: Where the backend keeps its data, uses the backend default if None
+    :param warm: Load in-memory indexes now, else warm_up must be called before querying
+    :return: Storage
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    module, name = BACKENDS[backend]
+    return getattr(importlib.import_module(module), name)(location, warm=warm)
@@ -0,0 +1,177 @@
+"""
+File: backup.py
+Description: Periodically copies every open database to timestamped backups and deletes the oldest
+
+@author Derek Garcia
+"""
+import asyncio
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from async_database import AsyncDatabase
+from guilds import GuildRouter
+from logger import Status, log
+from metrics import Metrics
+
+DEFAULT_BACKUP_INTERVAL = 24 * 60 * 60.0  # seconds
+DEFAULT_BACKUP_KEEP = 7
+BACKUP_TIME_FORMAT = "%Y%m%dT%H%M%SZ"
+BACKUP_TIME_REGEX = r"\d{8}T\d{6}Z"  # Matches: BACKUP_TIME_FORMAT timestamps
+NAME_REGEX = re.compile(r"[^\w.-]+")  # Matches: anything not safe in a file name
+
+
+def backup_name(db_location: str) -> str:
+    """
+    Get a file name prefix unique to a database, per guild files can share a base name in different directories
+
+    :param db_location: Location of the database
+    :return: Name to prefix the database's backups with, e.g. data_db_quotes for data/db/quotes.db
+    """
+    return NAME_REGEX.sub("_", os.path.splitext(os.path.normpath(db_location))[0]).strip("_.")
+
+
+class Backups:
+    def __init__(self, database: GuildRouter, metrics: Metrics, directory: str = None,
+                 keep: int = DEFAULT_BACKUP_KEEP, interval: float = DEFAULT_BACKUP_INTERVAL):
+        """
+        Create a new backup task, does nothing if no directory is given
+
+        :param database: Guild databases to back up
+        :param metrics: Metrics registry to record backup duration and size in
+        :param directory: Directory to write backups to, backups are off if None
+        :param keep: Number of backups to keep per database, older ones are deleted
+        :param interval: Seconds between backups
+        """
+        self.database = database
+        self.metrics = metrics
+        self.directory = directory
+        self.keep = max(1, keep)
+        self.interval = interval
+        self.last: dict[str, dict] = {}  # backup name -> result of the last backup
+        self._task = None
+
+    def start(self) -> None:
+        """
+        Start backing up in the background if enabled and not already running
+        """
+        if self.directory is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run(), name="quotebot-backup")
+
+    def stop(self) -> None:
+        """
+        Stop backing up
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def backups(self, name: str) -> list[str]:
+        """
+        Get the backups of a database
+
+        :param name: Backup name of the database
+        :return: List of backup paths, oldest first
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        # exact match so quotes-1 backups are never mistaken for backups of quotes
+        pattern = re.compile(rf"^{re.escape(name)}-{BACKUP_TIME_REGEX}(\.\w+)?$")
+        # timestamps sort in time order
+        return [os.path.join(self.directory, f) for f in sorted(os.listdir(self.directory)) if pattern.match(f)]
+
+    def rotate(self, name: str) -> int:
+        """
+        Delete the oldest backups of a database past the number to keep
+
+        :param name: Backup name of the database
+        :return: Number of backups deleted
+        """
+        stale = self.backups(name)[:-self.keep]
+        for path in stale:
+            os.remove(path)
+        return len(stale)
+
+    async def backup(self, database: AsyncDatabase) -> dict:
+        """
+        Back up a database and delete its oldest backups
+
+        :param database: Database to back up
+        :return: Dictionary of the backup path, size in bytes, steps, seconds taken and old backups deleted
+        """
+        name = backup_name(database.db_location)
+        extension = os.path.splitext(database.db_location)[1]
+        timestamp = datetime.now(timezone.utc).strftime(BACKUP_TIME_FORMAT)
+        path = os.path.join(self.directory, f"{name}-{timestamp}{extension}")
+
+        start = time.perf_counter()
+        result = await database.backup(path)
+        result = {"path": path, **result, "seconds": round(time.perf_counter() - start, 3),
+                  "deleted": self.rotate(name)}
+
+        self.last[name] = result
+        self.metrics.set_gauge("backup_seconds", name, result["seconds"])
+        self.metrics.set_gauge("backup_bytes", name, result["bytes"])
+        self.metrics.set_gauge("backup_time", name, time.time())
+        return result
+
+    async def backup_all(self) -> list[dict]:
+        """
+        Back up every open database, a failed backup does not stop the rest
+
+        :return: List of results of the backups that succeeded
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        results = []
+        for database in self.database.databases():
+            try:
+                result = await self.backup(database)
+            except (sqlite3.Error, OSError) as e:
+                # try again next interval
+                self.metrics.count("backups", "error")
+                log("admin", "backup", Status.ERROR, f"{database.db_location}: {e}")
+                continue
+            self.metrics.count("backups", "success")
+            log("admin", "backup", Status.SUCCESS,
+                f"{database.db_location} to {result['path']}, {result['bytes']} bytes in {result['seconds']}s "
+                f"({result['steps']} steps), deleted {result['deleted']} old backups")
+            results.append(result)
+        return results
+
+    def next_delay(self) -> float:
+        """
+        Get the seconds until the next backup is due, so restarts don't back up again before the interval is up
+
+        :return: Seconds until the next backup, 0 if one is due now
+        """
+        backups = self.backups(backup_name(self.database.database.db_location))
+        if len(backups) == 0:
+            return 0.0
+        try:
+            age = time.time() - os.path.getmtime(backups[-1])
+        except OSError:
+            return 0.0
+        return max(0.0, self.interval - age)
+
+    def stats(self) -> dict:
+        """
+        Get backup stats
+
+        :return: Dictionary of backup stats
+        """
+        return {
+            "directory": self.directory,
+            "backups": self.metrics.counts("backups"),
+            "last": {name: {k: v for k, v in result.items() if k != "path"} for name, result in self.last.items()},
+        }
+
+    async def _run(self) -> None:
+        """
+        Back up once the interval since the last backup is up, then every interval
+        """
+        await asyncio.sleep(self.next_delay())
+        while True:
+            await self.backup_all()
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,172 @@
+"""
+File: bulk.py
+Description: Bulk import and export quotes as JSONL or CSV, and offline database maintenance
+
+@author Derek Garcia
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Iterator, TextIO
+
+from dotenv import load_dotenv
+
+from backends import DEFAULT_BACKEND, open_storage
+from logger import Status, log
+from quote import Quote
+from storage import DEFAULT_GUILD_ID, DEFAULT_IMPORT_BATCH_SIZE, EXPORT_FIELDS, Storage
+
+FORMATS = ("jsonl", "csv")
+
+
+def get_format(path: str, fmt: str = None) -> str:
+    """
+    Get the file format from the explicit format or the file extension
+
+    :param path: Path to the file
+    :param fmt: Optional explicit format
+    :return: File format
+    """
+    fmt = fmt or Path(path).suffix.lstrip(".").lower()
+    if fmt == "json":
+        fmt = "jsonl"
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}', expected one of {', '.join(FORMATS)}")
+    return fmt
+
+
+def read_records(file: TextIO, fmt: str, contributor: str) -> Iterator[tuple[Quote, str, str | None]]:
+    """
+    Stream quote records from a file one line at a time
+
+    :param file: File to read from
+    :param fmt: File format
+    :param contributor: Contributor to use if a record doesn't have one
+    :return: Iterator of (quote, contributor, optional time)
+    """
+    rows = csv.DictReader(file) if fmt == "csv" else (json.loads(line) for line in file if line.strip())
+    for row in rows:
+        yield (
+            Quote(row["quote"], row["quotee"], row.get("pre_context") or None, row.get("post_context") or None),
+            row.get("contributor") or contributor,
+            row.get("time") or None
+        )
+
+
+def import_quotes(database: Storage, path: str, fmt: str, contributor: str, batch_size: int,
+                  guild_id: int = DEFAULT_GUILD_ID) -> None:
+    """
+    Import quotes from a file
+
+    :param database: Database to import into
+    :param path: Path to the file
+    :param fmt: File format
+    :param contributor: Contributor to use if a record doesn't have one
+    :param batch_size: Number of quotes to write per transaction
+    :param guild_id: Guild to import the quotes into
+    """
+    start = time.perf_counter()
+    with open(path, 'r', newline='', encoding='utf-8') as file:
+        total = database.import_quotes(read_records(file, fmt, contributor), batch_size, guild_id)
+    log("admin", "bulk import", Status.SUCCESS, f"Imported {total} quotes in {time.perf_counter() - start:.2f}s")
+
+
+def export_quotes(database: Storage, path: str, fmt: str, guild_id: int = DEFAULT_GUILD_ID) -> None:
+    """
+    Export all quotes of a guild to a file
+
+    :param database: Database to export from
+    :param path: Path to the file
+    :param fmt: File format
+    :param guild_id: Guild to export the quotes of
+    """
+    start = time.perf_counter()
+    total = 0
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, EXPORT_FIELDS) if fmt == "csv" else None
+        if writer is not None:
+            writer.writeheader()
+        for record in database.export_quotes(guild_id):
+            if writer is not None:
+                writer.writerow(record)
+            else:
+                file.write(json.dumps(record) + "\n")
+            total += 1
+    log("admin", "bulk export", Status.SUCCESS, f"Exported {total} quotes in {time.perf_counter() - start:.2f}s")
+
+
+def vacuum(path: str) -> None:
+    """
+    Switch a sqlite database created before incremental auto vacuum over with a one time full vacuum
+
+    :param path: Path to the database
+    """
+    database = open_storage("sqlite", path, warm=False)
+    try:
+        database.enable_incremental_vacuum(vacuum=True)
+    finally:
+        database.close()
+
+
+def main() -> None:
+    """
+    Parse args and run the import, export or vacuum
+    """
+    parser = argparse.ArgumentParser(description="Bulk import and export quotes")
+    parser.add_argument('-e', '--environment', help="Environment file with database connection details")
+    parser.add_argument('-f', '--format', choices=FORMATS, help="File format, defaults to the file extension")
+    parser.add_argument('-g', '--guild', type=int, default=DEFAULT_GUILD_ID,
+                        help="Guild to import into or export from, defaults to the unpartitioned quotes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Import quotes from a file")
+    import_parser.add_argument("path", help="File to import")
+    import_parser.add_argument('-c', '--contributor', default="bulk import",
+                               help="Contributor for records that don't have one")
+    import_parser.add_argument('-b', '--batch-size', type=int, default=DEFAULT_IMPORT_BATCH_SIZE,
+                               help="Quotes to write per transaction")
+
+    export_parser = subparsers.add_parser("export", help="Export all quotes to a file")
+    export_parser.add_argument("path", help="File to export to")
+
+    vacuum_parser = subparsers.add_parser("vacuum", help="Enable incremental auto vacuum on an existing sqlite "
+                                                         "database, run while the bot is stopped")
+    vacuum_parser.add_argument("path", nargs="?", help="Database to vacuum, defaults to DATABASE_PATH")
+
+    args = parser.parse_args()
+
+    if args.environment is None:
+        load_dotenv()
+    else:
+        load_dotenv(dotenv_path=Path(args.environment))
+
+    # the full vacuum rewrites the file in one transaction, nothing else can use it meanwhile
+    if args.command == "vacuum":
+        if args.path is None and os.getenv("STORAGE", DEFAULT_BACKEND) != "sqlite":
+            print("Only sqlite databases can be vacuumed", file=sys.stderr)
+            exit(1)
+        vacuum(args.path or os.getenv("DATABASE_PATH"))
+        return
+
+    try:
+        fmt = get_format(args.path, args.format)
+        database = open_storage(os.getenv("STORAGE", DEFAULT_BACKEND), os.getenv("DATABASE_PATH"))
+    except ValueError as ve:
+        print(ve, file=sys.stderr)
+        exit(1)
+
+    try:
+        if args.command == "import":
+            import_quotes(database, args.path, fmt, args.contributor, args.batch_size, args.guild)
+        else:
+            export_quotes(database, args.path, fmt, args.guild)
+    finally:
+        database.close()
+
+
+if __name__ == '__main__':
+    main()
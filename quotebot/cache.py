@@ -0,0 +1,95 @@
+"""
+File: cache.py
+Description: Bounded LRU read-through cache for database lookups
+
+@author Derek Garcia
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+DEFAULT_CACHE_SIZE = 1024
+
+
+class LRUCache:
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE):
+        """
+        Create a new empty cache
+
+        :param max_size: Max number of entries before the least recently used is evicted
+        """
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0  # bumped on every invalidation so in flight loads don't cache stale values
+
+        # stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key: Hashable, loader: Callable):
+        """
+        Get a cached value, loading and caching it on a miss
+
+        :param key: Key of the value
+        :param loader: Function to load the value if not cached
+        :return: Cached or loaded value
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+
+        with self._lock:
+            # skip if invalidated while loading, the value may be stale
+            if generation == self._generation and self.max_size > 0:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def invalidate(self, *keys: Hashable) -> None:
+        """
+        Remove entries from the cache
+
+        :param keys: Keys of the entries to remove
+        """
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        """
+        Remove all entries whose key matches a predicate
+
+        :param predicate: Function that returns True if the key should be removed
+        """
+        with self._lock:
+            self._generation += 1
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        """
+        Get cache usage stats
+
+        :return: Dictionary of cache stats
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
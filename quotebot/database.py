@@ -5,55 +5,303 @@ Description: Sqlite database interface for managing quotes
 @author Derek Garcia
 """
 import os
-import random
+import re
 import sqlite3
+import threading
+import time
 from contextlib import contextmanager
+from itertools import batched, groupby
+from operator import itemgetter
+from typing import Iterable, Iterator
 
+from cache import DEFAULT_CACHE_SIZE, LRUCache
+from log_sink import LogSink
 from logger import Status, log
-from quote import Quote
+from metrics import Metrics, timed
+from pool import DEFAULT_READERS, DEFAULT_STATEMENT_CACHE, ConnectionPool
+from quote import Quote, content_hash
+from quote_index import QuoteIndex
+from quotee_index import DEFAULT_SUGGESTION_LIMIT, QuoteeIndex, Suggestion
+from storage import (DEFAULT_GUILD_ID, DEFAULT_IMPORT_BATCH_SIZE, DEFAULT_PAGE_SIZE, DEFAULT_SEARCH_LIMIT,
+                     DUPLICATE_QUOTE, EXPORT_FIELDS, Storage)
 
 DEFAULT_DB_PATH = "data/db/quotes.db"
 DEFAULT_DDL_PATH = "quotebot/ddl"
-
-
-class Database:
-    def __init__(self, db_location: str = DEFAULT_DB_PATH):
+PARTITION_READERS = 1  # per guild files see a fraction of the traffic, keep their pools small
+DEFAULT_RETENTION_BATCH_SIZE = 1000  # keeps each write transaction to a few tens of ms
+RETENTION_PAUSE = 0.01  # seconds between retention transactions so waiting writers get the lock
+DEFAULT_VACUUM_PAGES = 1000  # ~4MB freed per write transaction with the default page size
+DEFAULT_BACKFILL_BATCH_SIZE = 5000  # quotes hashed per write transaction
+DEFAULT_BACKUP_PAGES = 256  # ~1MB copied per step with the default page size
+BACKUP_PAUSE = 0.005  # seconds between backup steps so waiting writers get the lock
+WARM_UP_GUILDS = 100  # guilds to cache quotee lists for on start, the rest are cached on first use
+MIGRATION_REGEX = re.compile(r"^(\d+)_.*\.sql$")  # Matches: <version>_<name>.sql
+
+
+class Database(Storage):
+    def __init__(self, db_location: str = DEFAULT_DB_PATH, readers: int = DEFAULT_READERS,
+                 statement_cache: int = DEFAULT_STATEMENT_CACHE, cache_size: int = DEFAULT_CACHE_SIZE,
+                 metrics: Metrics = None, warm: bool = True):
         """
         Create new SQLite instance if it does not exist
 
         :param db_location: Location of the sqlite database
+        :param readers: Max number of pooled reader connections
+        :param statement_cache: Number of prepared statements to cache per connection
+        :param cache_size: Max number of lookups to cache
+        :param metrics: Optional metrics registry to share with other databases
+        :param warm: Build the in-memory indexes now, else warm_up must be called before querying
         """
         # use defaults if empty or none
         self.db_location = DEFAULT_DB_PATH if db_location is None or not db_location else db_location
         self.ddl_location = DEFAULT_DDL_PATH
 
-        # build db
-        with self.open_connection() as conn:
+        self.pool = ConnectionPool(self.db_location, readers, statement_cache)
+        self.concurrency = self.pool.max_readers + 1  # one thread per pooled reader plus one for the writer
+
+        # latency of each query method
+        self.metrics = Metrics() if metrics is None else metrics
+
+        # build or upgrade db
+        self.migrate()
+        self.enable_incremental_vacuum()
+        self.backfill_content_hashes()
+
+        # buffer audit logs and write them in batches
+        self.log_sink = LogSink(self._write_logs)
+
+        # cache lookups until invalidated by a new quote
+        self.cache = LRUCache(cache_size)
+
+        # index quote ids for random selection and counts, and quotee names per guild for fuzzy matching
+        self.quote_index = QuoteIndex()
+        self.quotee_indexes: dict[int, QuoteeIndex] = {}
+        self.warmed = False
+        self._warm_lock = threading.Lock()
+        if warm:
+            self.warm_up()
+
+    def warm_up(self) -> None:
+        """
+        Build the in-memory indexes and cache the quotee lists of the first guilds. Only the first call does anything
+        """
+        with self._warm_lock:
+            if self.warmed:
+                return
+            self.load_indexes()
+            for guild_id in list(self.quotee_indexes)[:WARM_UP_GUILDS]:
+                self.get_all_quotees(guild_id)
+            self.warmed = True
+
+    def load_indexes(self) -> None:
+        """
+        Rebuild the in-memory indexes from the database
+        """
+        with self.pool.read() as conn:
             with self.get_cursor(conn) as cur:
+                cur.execute("SELECT guild_id, COUNT(*) FROM quotee GROUP BY guild_id;")
+                quotee_totals = cur.fetchall()
+                # duplicates kept by the backfill have no hash, leave them out of the counts and picks
+                cur.execute("SELECT ROWID, guild_id, quotee FROM quote WHERE content_hash IS NOT NULL ORDER BY ROWID;")
+                self.quote_index.load(cur, quotee_totals)  # stream rows instead of fetching all
+
+                cur.execute("SELECT guild_id, name FROM quotee ORDER BY guild_id;")
+                quotee_indexes = {}
+                for guild_id, rows in groupby(cur, key=itemgetter(0)):
+                    quotee_indexes[guild_id] = QuoteeIndex()
+                    quotee_indexes[guild_id].load(q[1] for q in rows)
+                self.quotee_indexes = quotee_indexes
+
+    def get_quotee_index(self, guild_id: int) -> QuoteeIndex:
+        """
+        Get the quotee name index of a guild, creating it if the guild has no quotees yet
 
-                for file in os.scandir(self.ddl_location):
-                    # skip any non sql files
-                    if not (file.is_file() and file.name.endswith(".sql")):
-                        continue
-                    # Execute sql file
-                    with open(file, 'r') as sql_file:
-                        cur.executescript(sql_file.read())
+        :param guild_id: Guild to get the index for
+        :return: Quotee index
+        """
+        index = self.quotee_indexes.get(guild_id)
+        if index is None:
+            index = self.quotee_indexes.setdefault(guild_id, QuoteeIndex())
+        return index
 
+    def get_migrations(self) -> list[tuple[int, str]]:
+        """
+        Get all numbered migrations in the ddl directory
 
-    @contextmanager
-    def open_connection(self) -> sqlite3.Connection:
+        :return: List of (version, path) sorted by version
+        """
+        migrations = []
+        for file in os.scandir(self.ddl_location):
+            # skip any non migration files
+            match = MIGRATION_REGEX.match(file.name)
+            if not (file.is_file() and match):
+                continue
+            migrations.append((int(match.group(1)), file.path))
+        return sorted(migrations)
+
+    def migrate(self) -> int:
+        """
+        Apply any migrations newer than the database schema version. Each is applied once in its own transaction
+
+        :return: Schema version of the database
+        """
+        with self.pool.write() as conn:
+            with self.get_cursor(conn) as cur:
+                cur.execute("PRAGMA user_version;")
+                version = cur.fetchone()[0]
+
+        # fast path, schema is current so skip all ddl
+        pending = [(v, path) for v, path in self.get_migrations() if v > version]
+        if len(pending) == 0:
+            return version
+
+        for version, path in pending:
+            with open(path, 'r') as sql_file:
+                sql = sql_file.read()
+            with self.pool.write() as conn:
+                with self.get_cursor(conn) as cur:
+                    # version is bumped in the same transaction so a failed migration is retried next start
+                    cur.executescript(f"BEGIN;\n{sql}\nPRAGMA user_version = {version};\nCOMMIT;")
+            log("database", "migrate", Status.INFO, f"Applied {os.path.basename(path)}")
+
+        return version
+
+    def backfill_content_hashes(self, batch_size: int = DEFAULT_BACKFILL_BATCH_SIZE) -> int:
+        """
+        Hash quotes stored before duplicate detection. Later copies of a quotee's quote are kept without a hash and
+        reported, nothing is deleted, and reads leave them out. Done in batches so large databases don't hold the
+        write lock for long, and picks up where it left off if interrupted
+
+        :param batch_size: Number of quotes to hash per transaction
+        :return: Number of duplicate quotes left without a hash
+        """
+        unhashed = 0
+        guild_id, qid = -1, 0  # last quote checked, quotes left without a hash are never selected again
+        while True:
+            with self.pool.write() as conn:
+                with self.get_cursor(conn) as cur:
+                    # walks the partial index, so once every quote is hashed this only finds the duplicates
+                    cur.execute(
+                        "SELECT guild_id, ROWID, pre_context, quote, post_context FROM quote "
+                        "WHERE content_hash IS NULL AND (guild_id, ROWID) > (?, ?) ORDER BY guild_id, ROWID LIMIT ?;",
+                        (guild_id, qid, batch_size)
+                    )
+                    rows = cur.fetchall()
+                    if len(rows) == 0:
+                        break
+                    # in id order within each guild so the unique index keeps the first copy, later copies are
+                    # ignored and left without a hash
+                    cur.executemany(
+                        "UPDATE OR IGNORE quote SET content_hash = ? WHERE ROWID = ?;",
+                        ((content_hash(q, pre, post), rowid) for _, rowid, pre, q, post in rows)
+                    )
+                    unhashed += len(rows) - cur.rowcount
+                    guild_id, qid = rows[-1][:2]
+
+        if unhashed > 0:
+            log("database", "dedupe", Status.WARN,
+                f"Kept {unhashed} duplicate quotes from before duplicate detection, they are not indexed")
+        return unhashed
+
+    def enable_incremental_vacuum(self, vacuum: bool = False) -> bool:
+        """
+        Switch the database to incremental auto vacuum so freed pages can be returned to the file system in small
+        steps. New databases are created with it, older ones need a one time full vacuum that rewrites the whole file
+        and blocks every other query, so it only runs when asked for
+
+        :param vacuum: Run the full vacuum if the database needs one to switch
+        :return: True if incremental auto vacuum is enabled
+        """
+        with self.pool.write() as conn:
+            with self.get_cursor(conn) as cur:
+                cur.execute("PRAGMA auto_vacuum;")
+                if cur.fetchone()[0] == 2:  # already incremental
+                    return True
+
+                if not vacuum:
+                    log("database", "vacuum", Status.WARN,
+                        f"Incremental auto vacuum is off for {self.db_location}, freed space is not returned to the "
+                        f"file system. Run 'python3 quotebot/bulk.py vacuum' while the bot is stopped to switch")
+                    return False
+
+                log("database", "vacuum", Status.INFO,
+                    f"Running a full vacuum of {self.db_location} to enable incremental auto vacuum, "
+                    f"this can take minutes on large databases")
+                start = time.perf_counter()
+                cur.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+                cur.execute("VACUUM;")
+        log("database", "vacuum", Status.INFO,
+            f"Enabled incremental auto vacuum in {time.perf_counter() - start:.2f}s")
+        return True
+
+    def close(self) -> None:
+        """
+        Flush pending logs and close all open database connections
+        """
+        self.log_sink.close()
+        self.pool.close()
+
+    def flush_logs(self) -> int:
+        """
+        Write all buffered log messages now
+
+        :return: Number of log messages written
+        """
+        return self.log_sink.flush()
+
+    def get_log_stats(self) -> dict:
+        """
+        Get buffered log writer stats
+
+        :return: Dictionary of log sink stats
+        """
+        return self.log_sink.stats()
+
+    def get_stats(self) -> dict[str, dict]:
         """
-        Open a connection that can be closed on exit
+        Get connection pool, log writer and lookup cache stats
 
-        :return: Database connection
+        :return: Dictionary of stat group name to stats
         """
+        return {
+            "database pool": self.get_pool_stats(),
+            "log writer": self.get_log_stats(),
+            "lookup cache": self.get_cache_stats()
+        }
+
+    def open_partition(self, location: str) -> "Database":
+        """
+        Open another database file for a guild partition, sharing this database's metrics
+
+        :param location: Location of the sqlite database
+        :return: Database for the partition
+        """
+        return Database(location, readers=PARTITION_READERS, metrics=self.metrics)
+
+    def count_partition(self, location: str) -> int:
+        """
+        Count the quotes of a guild database file without opening a pool or loading its indexes
+
+        :param location: Location of the sqlite database
+        :return: Number of quotes in the partition, 0 if it can't be read
+        """
+        conn = sqlite3.connect(location)
         try:
-            conn = sqlite3.connect(self.db_location)
-            yield conn
+            return conn.execute("SELECT COUNT(*) FROM quote;").fetchone()[0]
+        except sqlite3.Error as e:
+            log("database", "count partition", Status.ERROR, f"{location}: {e}")
+            return 0
         finally:
-            conn.commit()
             conn.close()
 
+    def get_pool_stats(self) -> dict:
+        """
+        Get connection pool usage stats
+
+        :return: Dictionary of pool stats
+        """
+        return self.pool.stats()
+
     @contextmanager
     def get_cursor(self, connection: sqlite3.Connection) -> sqlite3.Cursor:
         """
@@ -68,150 +316,491 @@ class Database:
         finally:
             cur.close()
 
-    def add_quote(self, quote: Quote, contributor: str) -> int:
+    @timed
+    def add_quote(self, quote: Quote, contributor: str, guild_id: int = DEFAULT_GUILD_ID) -> int:
         """
         Add a quote to the database
 
         :param quote: Quote to add
         :param contributor: Contributor who added the quote
-        :return: Quote ID in database
+        :param guild_id: Guild the quote was added in
+        :return: Quote ID in database, DUPLICATE_QUOTE if the quotee already has the same quote
         """
-        with self.open_connection() as conn:
+        # quotee, contributor and quote are added in a single transaction, logs wait until it is committed
+        warnings = []
+        with self.pool.write() as conn:
             with self.get_cursor(conn) as cur:
                 # Add new quotee if does not exist
+                new_quotee = True
                 try:
-                    cur.execute("INSERT INTO quotee VALUES (?);", (quote.quotee.lower(),))
-                    conn.commit()
+                    cur.execute("INSERT INTO quotee (guild_id, name) VALUES (?, ?);", (guild_id, quote.quotee.lower()))
                 except sqlite3.IntegrityError as ie:
-                    conn.commit()
-                    log("database", "add quotee", Status.WARN, f'{str(ie)} "{quote.quotee}"', database=self)
+                    new_quotee = False
+                    warnings.append(("add quotee", f'{str(ie)} "{quote.quotee}"'))
 
                 # Add new contributor if does not exist
                 try:
                     cur.execute("INSERT INTO contributor VALUES (?);", (contributor,))
-                    conn.commit()
                 except sqlite3.IntegrityError as ie:
-                    conn.commit()
-                    log("database", "add contributor", Status.WARN, f'{str(ie)} "{contributor}"', database=self)
+                    warnings.append(("add contributor", f'{str(ie)} "{contributor}"'))
 
-                # Upload quote
+                # Upload quote, the unique hash index skips it if the quotee already has it
                 cur.execute(
-                    "INSERT INTO quote (pre_context, quote, post_context, quotee, contributor) VALUES (?, ?, ?, ?, ?);",
-                    (quote.pre_context, quote.quote, quote.post_context, quote.quotee.lower(), contributor)
+                    "INSERT OR IGNORE INTO quote "
+                    "(guild_id, pre_context, quote, post_context, quotee, contributor, content_hash) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?);",
+                    (guild_id, quote.pre_context, quote.quote, quote.post_context, quote.quotee.lower(), contributor,
+                     quote.content_hash())
                 )
+                # Get new ID
+                qid = DUPLICATE_QUOTE if cur.rowcount == 0 else cur.lastrowid
+
+            # index while still holding the writer lock so ids are appended in the order they were assigned
+            if qid != DUPLICATE_QUOTE:
                 conn.commit()
+                self._index_quote(qid, quote.quotee.lower(), new_quotee, guild_id)
 
-                # Get new ID
-                cur.execute("SELECT MAX(ROWID) FROM quote")
-                return cur.fetchall()[0][0]
+        for action, message in warnings:
+            log("database", action, Status.WARN, message, database=self)
+        return qid
+
+    @timed
+    def add_quotes(self, records: list[tuple[Quote, str]], guild_id: int = DEFAULT_GUILD_ID) -> list[int]:
+        """
+        Add a batch of quotes in a single transaction
+
+        :param records: List of (quote, contributor) to add
+        :param guild_id: Guild the quotes were added in
+        :return: Quote ID of each record in order, DUPLICATE_QUOTE for each the quotee already has
+        """
+        qids = []
+        new_quotees = set()
+        with self.pool.write() as conn:
+            with self.get_cursor(conn) as cur:
+                cur.executemany("INSERT OR IGNORE INTO contributor VALUES (?);", {(c,) for _, c in records})
+                for quotee in {q.quotee.lower() for q, _ in records}:
+                    cur.execute("INSERT OR IGNORE INTO quotee (guild_id, name) VALUES (?, ?);", (guild_id, quotee))
+                    if cur.rowcount > 0:
+                        new_quotees.add(quotee)
+
+                # one statement per quote for its id, still only one commit for the batch
+                for quote, contributor in records:
+                    cur.execute(
+                        "INSERT OR IGNORE INTO quote "
+                        "(guild_id, pre_context, quote, post_context, quotee, contributor, content_hash) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?);",
+                        (guild_id, quote.pre_context, quote.quote, quote.post_context, quote.quotee.lower(),
+                         contributor, quote.content_hash())
+                    )
+                    qids.append(DUPLICATE_QUOTE if cur.rowcount == 0 else cur.lastrowid)
+
+            # index once committed, while still holding the writer lock so ids are appended in the order assigned
+            conn.commit()
+            for qid, (quote, _) in zip(qids, records):
+                if qid == DUPLICATE_QUOTE:
+                    continue
+                quotee = quote.quotee.lower()
+                new_quotee = quotee in new_quotees
+                new_quotees.discard(quotee)  # only the first quote of a new quotee adds the name
+                self._index_quote(qid, quotee, new_quotee, guild_id)
+        return qids
+
+    def _index_quote(self, qid: int, quotee: str, new_quotee: bool, guild_id: int) -> None:
+        """
+        Add a committed quote to the in-memory indexes and drop the cached lookups it changes. Must hold the writer
+        lock so ids are added in ascending order
 
-    def find_similar_quotee(self, quotee: str) -> list[str]:
+        :param qid: ID of the new quote
+        :param quotee: Lowercase quotee of the new quote
+        :param new_quotee: True if the quotee was not in the database before
+        :param guild_id: Guild of the new quote
+        """
+        self.quote_index.add(qid, quotee, new_quotee, guild_id)
+        if new_quotee:
+            self.get_quotee_index(guild_id).add(quotee)
+        self._invalidate_cache(quotee, new_quotee, guild_id)
+
+    def _invalidate_cache(self, quotee: str, new_quotee: bool, guild_id: int) -> None:
+        """
+        Remove cached lookups affected by a new quote
+
+        :param quotee: Quotee of the new quote
+        :param new_quotee: True if the quotee was not in the database before
+        :param guild_id: Guild of the new quote
+        """
+        self.cache.invalidate(("quotes", guild_id, quotee))
+        if not new_quotee:
+            return
+        # new name changes the quotee list and may rank in any cached search of the guild
+        self.cache.invalidate(("quotees", guild_id))
+        self.cache.invalidate_where(lambda key: key[0] == "similar" and key[1] == guild_id)
+
+    def get_cache_stats(self) -> dict:
+        """
+        Get lookup cache stats
+
+        :return: Dictionary of cache stats
+        """
+        return self.cache.stats()
+
+    @timed
+    def import_quotes(self, records: Iterable[tuple[Quote, str, str | None]],
+                      batch_size: int = DEFAULT_IMPORT_BATCH_SIZE, guild_id: int = DEFAULT_GUILD_ID) -> int:
+        """
+        Bulk add quotes, skipping duplicates. Records are streamed and written in large batches, one transaction per
+        batch
+
+        :param records: Iterable of (quote, contributor, optional time) to add
+        :param batch_size: Number of quotes to write per transaction
+        :param guild_id: Guild to add the quotes to
+        :return: Number of quotes added
+        """
+        total = 0
+        for batch in batched(records, batch_size):
+            # dedupe names before inserting
+            quotees = {(guild_id, q.quotee.lower()) for q, _, _ in batch}
+            contributors = {(c,) for _, c, _ in batch}
+            with self.pool.write() as conn:
+                with self.get_cursor(conn) as cur:
+                    # ddl is not in a transaction by default, start one so the trigger is restored on failure
+                    if not conn.in_transaction:
+                        cur.execute("BEGIN;")
+                    cur.executemany("INSERT OR IGNORE INTO quotee (guild_id, name) VALUES (?, ?);", quotees)
+                    cur.executemany("INSERT OR IGNORE INTO contributor VALUES (?);", contributors)
+
+                    # the per row search index trigger is much slower than indexing the batch in one statement
+                    cur.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'quote_fts_insert';")
+                    fts_trigger = cur.fetchone()
+                    cur.execute("DROP TRIGGER IF EXISTS quote_fts_insert;")
+                    cur.execute("SELECT IFNULL(MAX(ROWID), 0) FROM quote;")
+                    last_id = cur.fetchone()[0]
+
+                    cur.executemany(
+                        "INSERT OR IGNORE INTO quote "
+                        "(time, guild_id, pre_context, quote, post_context, quotee, contributor, content_hash) "
+                        "VALUES (COALESCE(?, CURRENT_TIMESTAMP), ?, ?, ?, ?, ?, ?, ?);",
+                        ((t, guild_id, q.pre_context, q.quote, q.post_context, q.quotee.lower(), c, q.content_hash())
+                         for q, c, t in batch)
+                    )
+                    added = cur.rowcount
+
+                    cur.execute(
+                        "INSERT INTO quote_fts (rowid, pre_context, quote, post_context) "
+                        "SELECT ROWID, pre_context, quote, post_context FROM quote WHERE ROWID > ?;",
+                        (last_id,)
+                    )
+                    if fts_trigger is not None:
+                        cur.execute(fts_trigger[0])
+            total += added
+
+        # too many changes to update incrementally
+        self.load_indexes()
+        self.cache.invalidate_where(lambda key: True)
+        return total
+
+    def export_quotes(self, guild_id: int = DEFAULT_GUILD_ID) -> Iterator[dict]:
+        """
+        Stream every quote of a guild from a cursor without loading them all into memory
+
+        :param guild_id: Guild to export quotes from
+        :return: Iterator of quote records
+        """
+        with self.pool.read() as conn:
+            with self.get_cursor(conn) as cur:
+                cur.execute(
+                    "SELECT time, pre_context, quote, post_context, quotee, contributor FROM quote "
+                    "WHERE guild_id = ? ORDER BY ROWID;",
+                    (guild_id,)
+                )
+                for row in cur:
+                    yield dict(zip(EXPORT_FIELDS, row))
+
+    @timed
+    def find_similar_quotee(self, quotee: str, limit: int = DEFAULT_SUGGESTION_LIMIT,
+                            guild_id: int = DEFAULT_GUILD_ID) -> list[Suggestion]:
         """
         Get list of quotees that a similar to the given quotee
 
         :param quotee: Quotee to attempt to match
-        :return: List of similar quotees
+        :param limit: Max number of quotees to return
+        :param guild_id: Guild to search quotees of
+        :return: List of similar quotees ordered by most similar, with the spans of each name that matched
         """
-        with self.open_connection() as conn:
-            with self.get_cursor(conn) as cur:
-                # Find similar quotees
-                cur.execute("SELECT name FROM quotee WHERE name LIKE ?;", (f"%{quotee.lower()}%",))
-                data = cur.fetchall()
-                conn.commit()
-                return [q[0] for q in data]  # convert list of tuples for list of strings
+        quotee = quotee.lower()
+        return list(self.cache.get_or_load(("similar", guild_id, quotee, limit),
+                                           lambda: tuple(self.get_quotee_index(guild_id).search(quotee, limit))))
 
-    def get_all_quotees(self) -> list[str]:
+    @timed
+    def get_all_quotees(self, guild_id: int = DEFAULT_GUILD_ID) -> list[str]:
         """
-        Get all quotees in the database
+        Get all quotees of a guild
 
+        :param guild_id: Guild to get quotees of
         :return: List of quotees
         """
-        with self.open_connection() as conn:
-            with self.get_cursor(conn) as cur:
-                # Get all quotees
-                cur.execute("SELECT name FROM quotee;")
-                data = cur.fetchall()
-                conn.commit()
-                return [q[0] for q in data]  # convert list of tuples for list of strings
 
-    def get_all_quotes(self, quotee: str = None) -> list[Quote]:
+        def load() -> tuple[str, ...]:
+            with self.pool.read() as conn:
+                with self.get_cursor(conn) as cur:
+                    # Get all quotees
+                    cur.execute("SELECT name FROM quotee WHERE guild_id = ?;", (guild_id,))
+                    return tuple(q[0] for q in cur)  # convert tuples to strings
+
+        return list(self.cache.get_or_load(("quotees", guild_id), load))
+
+    @timed
+    def get_all_quotes(self, quotee: str = None, guild_id: int = DEFAULT_GUILD_ID) -> list[Quote]:
         """
-        Get all quotes in database or for specific quotee
+        Get all quotes of a guild or for specific quotee
 
         :param quotee: Optional quotee to get all quotes for
+        :param guild_id: Guild to get quotes of
         :return: List of Quotes
         """
-        with self.open_connection() as conn:
-            with self.get_cursor(conn) as cur:
+        quotee = None if quotee is None else quotee.lower()
+
+        def load() -> tuple[Quote, ...]:
+            with self.pool.read() as conn:
+                with self.get_cursor(conn) as cur:
+                    cur.row_factory = Quote.from_row  # build Quotes straight from rows
+
+                    # No quotee, get all quotes
+                    if quotee is None:
+                        cur.execute(
+                            "SELECT quote, quotee, pre_context, post_context FROM quote "
+                            "WHERE guild_id = ? AND content_hash IS NOT NULL;",
+                            (guild_id,)
+                        )
+                    # Else get all quotes by person
+                    else:
+                        cur.execute(
+                            "SELECT quote, quotee, pre_context, post_context FROM quote "
+                            "WHERE guild_id = ? AND quotee = ? AND content_hash IS NOT NULL;",
+                            (guild_id, quotee)
+                        )
+                    return tuple(cur)
+
+        # the whole guild can be the whole table, the cache is bounded by entries not size so only cache one quotee
+        if quotee is None:
+            return list(load())
+        return list(self.cache.get_or_load(("quotes", guild_id, quotee), load))
+
+    @timed
+    def get_quote_page(self, quotee: str, page: int = 1, page_size: int = DEFAULT_PAGE_SIZE,
+                       guild_id: int = DEFAULT_GUILD_ID) -> list[Quote]:
+        """
+        Get one page of a quotee's quotes in the order they were added. The in-memory index holds each quotee's ids
+        in ascending order, so the page's first id is looked up by offset there and the rows are read with a ROWID
+        range seek instead of an OFFSET scan
+
+        :param quotee: Quotee to get quotes for
+        :param page: Page number, starting at 1
+        :param page_size: Number of quotes per page
+        :param guild_id: Guild of the quotee
+        :return: List of at most page size Quotes, empty if the page is out of range
+        """
+        quotee = quotee.lower()
+        # offset into the in-memory id list, only correct because ids are indexed in ascending order
+        start_id = self.quote_index.page_start(quotee, page, page_size, guild_id)
+        if start_id is None:
+            return []
 
-                # No quotee, get all quotes
-                if quotee is None:
-                    cur.execute("SELECT quote, quotee, pre_context, post_context FROM quote;")
-                # Else get all quotes by person
-                else:
-                    cur.execute(
-                        "SELECT quote, quotee, pre_context, post_context FROM quote WHERE quotee = ?;",
-                        (quotee.lower(),)
-                    )
-                data = cur.fetchall()
-                return [Quote(q[0], q[1], q[2], q[3]) for q in data]  # convert list of tuples for list of Quotes
+        with self.pool.read() as conn:
+            with self.get_cursor(conn) as cur:
+                cur.row_factory = Quote.from_row
+                cur.execute(
+                    "SELECT quote, quotee, pre_context, post_context FROM quote "
+                    "WHERE guild_id = ? AND quotee = ? AND ROWID >= ? AND content_hash IS NOT NULL "
+                    "ORDER BY ROWID LIMIT ?;",
+                    (guild_id, quotee, start_id, page_size)
+                )
+                return cur.fetchall()
 
-    def get_rand_quote(self, quotee: str = None) -> Quote | None:
+    @timed
+    def get_rand_quote(self, quotee: str = None, guild_id: int = DEFAULT_GUILD_ID) -> Quote | None:
         """
-        Get a random quote from entire database or specific quotee
+        Get a random quote from a guild or specific quotee
 
         :param quotee: Optional quotee to get a random quote from
+        :param guild_id: Guild to get a random quote from
         :return: Quote or None if no quotes from quotee
         """
-        quotes = self.get_all_quotes(quotee)
-        if len(quotes) == 0:
-            return None  # no quotes found
-        # return random quote
-        rand_id = random.randint(0, len(quotes) - 1)
-        return quotes[rand_id]
+        quotee = None if quotee is None else quotee.lower()
+        while True:
+            qid = self.quote_index.pick(quotee, guild_id)
+            if qid is None:
+                return None  # no quotes found
+
+            # return random quote
+            with self.pool.read() as conn:
+                with self.get_cursor(conn) as cur:
+                    cur.row_factory = Quote.from_row
+                    cur.execute("SELECT quote, quotee, pre_context, post_context FROM quote WHERE ROWID = ?;", (qid,))
+                    q = cur.fetchone()
+            if q is not None:
+                return q
+
+            # quote was deleted outside the bot, drop it and pick again so selection stays uniform
+            self.quote_index.discard(qid, quotee, guild_id)
+
+    @timed
+    def search_quotes(self, keywords: str, limit: int = DEFAULT_SEARCH_LIMIT,
+                      guild_id: int = DEFAULT_GUILD_ID) -> list[Quote]:
+        """
+        Full text search the quote and context text of a guild's quotes
 
-    def get_quote_total(self, quotee: str = None) -> int:
+        :param keywords: Words to search for, all must be present
+        :param limit: Max number of quotes to return
+        :param guild_id: Guild to search quotes of
+        :return: List of Quotes ordered by relevance
         """
-        Get the total number of quotes in the database or for a quotee
+        # quote each word so user input is never parsed as fts syntax, allow prefix matches
+        words = re.findall(r"\w+", keywords)
+        if len(words) == 0:
+            return []
+        match = " ".join(f'"{w}"*' for w in words)
+
+        with self.pool.read() as conn:
+            with self.get_cursor(conn) as cur:
+                cur.row_factory = Quote.from_row
+                # weight the quote above its context
+                cur.execute(
+                    "SELECT q.quote, q.quotee, q.pre_context, q.post_context "
+                    "FROM quote_fts JOIN quote q ON q.ROWID = quote_fts.rowid "
+                    "WHERE quote_fts MATCH ? AND q.guild_id = ? AND q.content_hash IS NOT NULL "
+                    "ORDER BY bm25(quote_fts, 0.5, 1.0, 0.5) LIMIT ?;",
+                    (match, guild_id, limit)
+                )
+                return cur.fetchall()
+
+    @timed
+    def get_quote_total(self, quotee: str = None, guild_id: int = DEFAULT_GUILD_ID) -> int:
+        """
+        Get the total number of quotes of a guild or for a quotee
 
         :param quotee: Optional quotee to get a total quotes from
+        :param guild_id: Guild to count quotes of
         :return: Number of quotes
         """
-        with self.open_connection() as conn:
-            with self.get_cursor(conn) as cur:
-                # Not quotee, get all quotes
-                if quotee is None:
-                    cur.execute("SELECT COUNT(ROWID) FROM quote;")
-                # Else get count for specific quotee
-                else:
-                    cur.execute("SELECT COUNT(ROWID) FROM quote WHERE quotee = ?;", (quotee.lower(),))
-                count = cur.fetchall()[0][0]
-                return count
+        return self.quote_index.count(None if quotee is None else quotee.lower(), guild_id)
+
+    def get_quote_total_all_guilds(self) -> int:
+        """
+        Get the total number of quotes in the database across every guild
 
-    def get_quotee_total(self) -> int:
+        :return: Number of quotes
         """
-        Get the total number of quotees in the database
+        return self.quote_index.count_all()
 
-        :return: Number of quotees in the database
+    @timed
+    def get_quotee_total(self, guild_id: int = DEFAULT_GUILD_ID) -> int:
         """
-        with self.open_connection() as conn:
-            with self.get_cursor(conn) as cur:
-                cur.execute("SELECT COUNT(*) FROM quotee;")
-                count = cur.fetchall()[0][0]
-                return count
+        Get the total number of quotees of a guild
+
+        :param guild_id: Guild to count quotees of
+        :return: Number of quotees in the guild
+        """
+        return self.quote_index.count_quotees(guild_id)
 
-    def log(self, user: str, action: str, status: str, add_info=None) -> None:
+    @timed
+    def apply_log_retention(self, days: int, batch_size: int = DEFAULT_RETENTION_BATCH_SIZE,
+                            vacuum_pages: int = DEFAULT_VACUUM_PAGES) -> dict:
         """
-        Save log message to database
+        Roll log rows older than the retention period up into daily counts, delete them and shrink the file.
+        Work is split into small write transactions so quotes can be added in between
+
+        :param days: Number of days of raw log rows to keep
+        :param batch_size: Number of log rows to roll up and delete per transaction
+        :param vacuum_pages: Number of free pages to release per transaction
+        :return: Dictionary of rows deleted and pages freed
+        """
+        cutoff = f"-{days} days"
+        batch = "SELECT ROWID FROM log WHERE time < datetime('now', ?) ORDER BY time, ROWID LIMIT ?"
+        deleted = 0
+        while True:
+            with self.pool.write() as conn:
+                with self.get_cursor(conn) as cur:
+                    # same batch is selected twice, nothing else can write in between
+                    cur.execute(
+                        "INSERT INTO log_daily (day, guild_id, action, status, user, count) "
+                        "SELECT date(time), guild_id, action, status, user, COUNT(*) "
+                        f"FROM log WHERE ROWID IN ({batch}) "
+                        "GROUP BY 1, 2, 3, 4, 5 "
+                        "ON CONFLICT (day, guild_id, action, status, user) DO UPDATE SET count = count + excluded.count;",
+                        (cutoff, batch_size)
+                    )
+                    cur.execute(f"DELETE FROM log WHERE ROWID IN ({batch});", (cutoff, batch_size))
+                    rows = cur.rowcount
+            deleted += rows
+            if rows < batch_size:
+                break
+            time.sleep(RETENTION_PAUSE)
+
+        # give deleted pages back to the file system a step at a time
+        freed = 0
+        previous = None
+        while True:
+            with self.pool.write() as conn:
+                with self.get_cursor(conn) as cur:
+                    cur.execute("PRAGMA freelist_count;")
+                    free = cur.fetchone()[0]
+                    # stop if nothing is left or the file isn't shrinking, e.g. auto vacuum is off
+                    if free == 0 or free == previous:
+                        break
+                    previous = free
+                    cur.execute(f"PRAGMA incremental_vacuum({min(free, vacuum_pages)});").fetchall()
+                    freed += min(free, vacuum_pages)
+            time.sleep(RETENTION_PAUSE)
+
+        return {"deleted": deleted, "freed_pages": freed}
+
+    @timed
+    def backup(self, location: str, pages: int = DEFAULT_BACKUP_PAGES, pause: float = BACKUP_PAUSE) -> dict:
+        """
+        Copy the database to a file with the sqlite backup api a few pages at a time, quotes can be added in between
+        steps and are included in the copy
+
+        :param location: File to write the copy to, replaced in one step once the copy is complete
+        :param pages: Number of pages to copy per step
+        :param pause: Seconds to let waiting writers in between steps
+        :return: Dictionary of the size of the copy in bytes and the steps taken to copy it
+        """
+        tmp = f"{location}.tmp"
+        target = sqlite3.connect(tmp)
+        # the copy is synced once below instead of while holding the writer lock
+        target.execute("PRAGMA synchronous = OFF;")
+        try:
+            steps = self.pool.backup(target, pages, pause)
+        except sqlite3.Error:
+            target.close()
+            os.remove(tmp)  # never leave a partial copy behind
+            raise
+        target.close()
+        with open(tmp, 'rb') as file:
+            os.fsync(file.fileno())
+        os.replace(tmp, location)
+        return {"bytes": os.path.getsize(location), "steps": steps}
+
+    def log(self, user: str, action: str, status: str, add_info=None, guild_id: int = DEFAULT_GUILD_ID) -> None:
+        """
+        Queue log message to be saved to the database by the buffered log writer
 
         :param user: User who performed the action
         :param action: Action perfomred
         :param status: Status / result of action
         :param add_info: Optional additional details to add
+        :param guild_id: Guild the action was performed in
         """
-        with self.open_connection() as conn:
-            with self.get_cursor(conn) as cur:
-                cur.execute(
-                    "INSERT INTO log (user, action, status, additional_info) VALUES (?, ?, ?, ?);",
-                    (user, action, status, add_info)
-                )
+        self.log_sink.put(user, action, status, add_info, guild_id)
+
+    def _write_logs(self, entries: list[tuple]) -> None:
+        """
+        Insert a batch of log messages in a single transaction, called by the buffered log writer
+
+        :param entries: List of (time, user, action, status, additional_info, guild_id) to insert
+        """
+        with self.pool.write() as conn:
+            conn.executemany(
+                "INSERT INTO log (time, user, action, status, additional_info, guild_id) VALUES (?, ?, ?, ?, ?, ?);",
+                entries
+            )
@@ -2,4 +2,4 @@
 CREATE TABLE IF NOT EXISTS quotee
 (
     name TEXT PRIMARY KEY
-)
\ No newline at end of file
+);
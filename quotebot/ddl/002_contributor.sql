@@ -2,4 +2,4 @@
 CREATE TABLE IF NOT EXISTS contributor
 (
     name TEXT PRIMARY KEY
-)
\ No newline at end of file
+);
@@ -10,4 +10,4 @@ CREATE TABLE IF NOT EXISTS quote
     contributor  TEXT                                NOT NULL,
     FOREIGN KEY (quotee) REFERENCES quotee (name),
     FOREIGN KEY (contributor) REFERENCES contributor (name)
-);
\ No newline at end of file
+);
@@ -7,4 +7,4 @@ CREATE TABLE IF NOT EXISTS log
     action          VARCHAR(100)                        NOT NULL,
     status          VARCHAR(50)                         NOT NULL,
     additional_info TEXT
-)
\ No newline at end of file
+);
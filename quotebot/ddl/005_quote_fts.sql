@@ -0,0 +1,38 @@
+-- Create full text search index over quote text, kept in sync with the quote table
+CREATE VIRTUAL TABLE IF NOT EXISTS quote_fts USING fts5
+(
+    pre_context,
+    quote,
+    post_context,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS quote_fts_insert
+    AFTER INSERT
+    ON quote
+BEGIN
+    INSERT INTO quote_fts (rowid, pre_context, quote, post_context)
+    VALUES (new.ROWID, new.pre_context, new.quote, new.post_context);
+END;
+
+CREATE TRIGGER IF NOT EXISTS quote_fts_delete
+    AFTER DELETE
+    ON quote
+BEGIN
+    DELETE FROM quote_fts WHERE rowid = old.ROWID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS quote_fts_update
+    AFTER UPDATE OF pre_context, quote, post_context
+    ON quote
+BEGIN
+    DELETE FROM quote_fts WHERE rowid = old.ROWID;
+    INSERT INTO quote_fts (rowid, pre_context, quote, post_context)
+    VALUES (new.ROWID, new.pre_context, new.quote, new.post_context);
+END;
+
+-- Index any quotes added before the search table existed
+INSERT INTO quote_fts (rowid, pre_context, quote, post_context)
+SELECT ROWID, pre_context, quote, post_context
+FROM quote
+WHERE ROWID > IFNULL((SELECT rowid FROM quote_fts ORDER BY rowid DESC LIMIT 1), 0);
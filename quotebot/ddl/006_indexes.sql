@@ -0,0 +1,4 @@
+-- Create secondary indexes for per quotee, per contributor and time range lookups
+CREATE INDEX IF NOT EXISTS quote_quotee_idx ON quote (quotee);
+CREATE INDEX IF NOT EXISTS quote_contributor_idx ON quote (contributor);
+CREATE INDEX IF NOT EXISTS log_time_idx ON log (time);
@@ -0,0 +1,10 @@
+-- Create daily rollup of log rows that have aged out of the log table
+CREATE TABLE IF NOT EXISTS log_daily
+(
+    day    DATE         NOT NULL,
+    action VARCHAR(100) NOT NULL,
+    status VARCHAR(50)  NOT NULL,
+    user   TEXT         NOT NULL,
+    count  INTEGER      NOT NULL,
+    PRIMARY KEY (day, action, status, user)
+) WITHOUT ROWID;
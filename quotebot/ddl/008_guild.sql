@@ -0,0 +1,68 @@
+-- Partition quotes, quotees and logs by discord guild, existing rows belong to the default guild 0
+-- quote and quotee need a composite key so both tables are rebuilt, quote ids are kept so the search index stays valid
+CREATE TABLE quote_new
+(
+    time         TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    ROWID        INTEGER PRIMARY KEY                 NOT NULL, -- use sqlite rowid as pk instead of redundant auto inc
+    guild_id     INTEGER   DEFAULT 0                 NOT NULL,
+    pre_context  TEXT,
+    quote        TEXT                                NOT NULL,
+    post_context TEXT,
+    quotee       TEXT                                NOT NULL,
+    contributor  TEXT                                NOT NULL,
+    FOREIGN KEY (guild_id, quotee) REFERENCES quotee (guild_id, name),
+    FOREIGN KEY (contributor) REFERENCES contributor (name)
+);
+
+INSERT INTO quote_new (time, ROWID, guild_id, pre_context, quote, post_context, quotee, contributor)
+SELECT time, ROWID, 0, pre_context, quote, post_context, quotee, contributor
+FROM quote;
+
+DROP TABLE quote;
+ALTER TABLE quote_new RENAME TO quote;
+
+CREATE TABLE quotee_new
+(
+    guild_id INTEGER DEFAULT 0 NOT NULL,
+    name     TEXT              NOT NULL,
+    PRIMARY KEY (guild_id, name)
+);
+
+INSERT INTO quotee_new (guild_id, name)
+SELECT 0, name
+FROM quotee;
+
+DROP TABLE quotee;
+ALTER TABLE quotee_new RENAME TO quotee;
+
+ALTER TABLE log ADD COLUMN guild_id INTEGER DEFAULT 0 NOT NULL;
+
+-- Dropping quote dropped its search triggers and indexes, recreate them
+CREATE TRIGGER IF NOT EXISTS quote_fts_insert
+    AFTER INSERT
+    ON quote
+BEGIN
+    INSERT INTO quote_fts (rowid, pre_context, quote, post_context)
+    VALUES (new.ROWID, new.pre_context, new.quote, new.post_context);
+END;
+
+CREATE TRIGGER IF NOT EXISTS quote_fts_delete
+    AFTER DELETE
+    ON quote
+BEGIN
+    DELETE FROM quote_fts WHERE rowid = old.ROWID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS quote_fts_update
+    AFTER UPDATE OF pre_context, quote, post_context
+    ON quote
+BEGIN
+    DELETE FROM quote_fts WHERE rowid = old.ROWID;
+    INSERT INTO quote_fts (rowid, pre_context, quote, post_context)
+    VALUES (new.ROWID, new.pre_context, new.quote, new.post_context);
+END;
+
+-- Lookups are always within a guild, lead every index with the guild
+CREATE INDEX IF NOT EXISTS quote_guild_quotee_idx ON quote (guild_id, quotee);
+CREATE INDEX IF NOT EXISTS quote_contributor_idx ON quote (contributor);
+CREATE INDEX IF NOT EXISTS log_guild_time_idx ON log (guild_id, time);
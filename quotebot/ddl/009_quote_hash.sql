@@ -0,0 +1,7 @@
+-- Hash of the normalized quote text so reposts of the same quote can be rejected by the unique index
+-- existing quotes are hashed in batches by the database on start, duplicates among them are left without a hash
+ALTER TABLE quote ADD COLUMN content_hash INTEGER;
+
+CREATE UNIQUE INDEX IF NOT EXISTS quote_content_hash_idx ON quote (guild_id, quotee, content_hash);
+-- only holds quotes that still need a hash and kept duplicates, so checking for work is nearly free
+CREATE INDEX IF NOT EXISTS quote_unhashed_idx ON quote (guild_id) WHERE content_hash IS NULL;
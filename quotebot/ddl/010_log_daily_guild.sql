@@ -0,0 +1,19 @@
+-- Keep the guild in the daily log rollup, existing counts belong to the default guild 0
+-- the guild is part of the primary key so the table is rebuilt
+CREATE TABLE log_daily_new
+(
+    day      DATE                NOT NULL,
+    guild_id INTEGER DEFAULT 0   NOT NULL,
+    action   VARCHAR(100)        NOT NULL,
+    status   VARCHAR(50)         NOT NULL,
+    user     TEXT                NOT NULL,
+    count    INTEGER             NOT NULL,
+    PRIMARY KEY (day, guild_id, action, status, user)
+) WITHOUT ROWID;
+
+INSERT INTO log_daily_new (day, guild_id, action, status, user, count)
+SELECT day, 0, action, status, user, count
+FROM log_daily;
+
+DROP TABLE log_daily;
+ALTER TABLE log_daily_new RENAME TO log_daily;
@@ -0,0 +1,3 @@
+-- Content hashes now cover the context and no longer reduce emoji or punctuation only quotes to nothing
+-- clear them so the database rehashes every quote in batches on start
+UPDATE quote SET content_hash = NULL;
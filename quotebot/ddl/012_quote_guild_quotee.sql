@@ -0,0 +1,3 @@
+-- Restore the (guild_id, quotee) index for databases that dropped it. Its entries end with the ROWID, so a page of a
+-- quotee's quotes is a range seek in id order. The hash index puts content_hash before the ROWID and has to sort
+CREATE INDEX IF NOT EXISTS quote_guild_quotee_idx ON quote (guild_id, quotee);
@@ -0,0 +1,255 @@
+"""
+File: guilds.py
+Description: Routes each guild to its partition of the quote database, either a guild id in a shared database or a
+separate database file per guild
+
+@author Derek Garcia
+"""
+import asyncio
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from async_database import AsyncDatabase
+from storage import DEFAULT_GUILD_ID, DEFAULT_PAGE_SIZE, DEFAULT_SEARCH_LIMIT
+from quote import Quote
+from quotee_index import DEFAULT_SUGGESTION_LIMIT, Suggestion
+
+
+class GuildDatabase:
+    def __init__(self, database: AsyncDatabase, guild_id: int):
+        """
+        View of a single guild's quotes, same interface as the database without the guild args
+
+        :param database: Database the guild is stored in
+        :param guild_id: Guild to scope every query to
+        """
+        self.database = database
+        self.guild_id = guild_id
+
+    async def add_quote(self, quote: Quote, contributor: str) -> int:
+        """
+        Add a quote to the guild
+
+        :param quote: Quote to add
+        :param contributor: Contributor who added the quote
+        :return: Quote ID in database
+        """
+        return await self.database.add_quote(quote, contributor, self.guild_id)
+
+    async def add_quotes(self, records: list[tuple[Quote, str]]) -> list[int]:
+        """
+        Add a batch of quotes to the guild at once
+
+        :param records: List of (quote, contributor) to add
+        :return: Quote ID of each record in order
+        """
+        return await self.database.add_quotes(records, self.guild_id)
+
+    async def find_similar_quotee(self, quotee: str, limit: int = DEFAULT_SUGGESTION_LIMIT) -> list[Suggestion]:
+        """
+        Get list of quotees in the guild that a similar to the given quotee
+
+        :param quotee: Quotee to attempt to match
+        :param limit: Max number of quotees to return
+        :return: List of similar quotees ordered by most similar, with the spans of each name that matched
+        """
+        return await self.database.find_similar_quotee(quotee, limit, self.guild_id)
+
+    async def get_all_quotees(self) -> list[str]:
+        """
+        Get all quotees in the guild
+
+        :return: List of quotees
+        """
+        return await self.database.get_all_quotees(self.guild_id)
+
+    async def get_all_quotes(self, quotee: str = None) -> list[Quote]:
+        """
+        Get all quotes in the guild or for specific quotee
+
+        :param quotee: Optional quotee to get all quotes for
+        :return: List of Quotes
+        """
+        return await self.database.get_all_quotes(quotee, self.guild_id)
+
+    async def get_quote_page(self, quotee: str, page: int = 1, page_size: int = DEFAULT_PAGE_SIZE) -> list[Quote]:
+        """
+        Get one page of a quotee's quotes in the order they were added
+
+        :param quotee: Quotee to get quotes for
+        :param page: Page number, starting at 1
+        :param page_size: Number of quotes per page
+        :return: List of at most page size Quotes, empty if the page is out of range
+        """
+        return await self.database.get_quote_page(quotee, page, page_size, self.guild_id)
+
+    async def get_rand_quote(self, quotee: str = None) -> Quote | None:
+        """
+        Get a random quote from the guild or specific quotee
+
+        :param quotee: Optional quotee to get a random quote from
+        :return: Quote or None if no quotes from quotee
+        """
+        return await self.database.get_rand_quote(quotee, self.guild_id)
+
+    async def search_quotes(self, keywords: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[Quote]:
+        """
+        Full text search the quote and context text of the guild's quotes
+
+        :param keywords: Words to search for, all must be present
+        :param limit: Max number of quotes to return
+        :return: List of Quotes ordered by relevance
+        """
+        return await self.database.search_quotes(keywords, limit, self.guild_id)
+
+    async def get_quote_total(self, quotee: str = None) -> int:
+        """
+        Get the total number of quotes in the guild or for a quotee
+
+        :param quotee: Optional quotee to get a total quotes from
+        :return: Number of quotes
+        """
+        return await self.database.get_quote_total(quotee, self.guild_id)
+
+    async def get_quotee_total(self) -> int:
+        """
+        Get the total number of quotees in the guild
+
+        :return: Number of quotees in the guild
+        """
+        return await self.database.get_quotee_total(self.guild_id)
+
+    def log(self, user: str, action: str, status: str, add_info=None) -> None:
+        """
+        Queue log message for the guild to be saved to the database
+
+        :param user: User who performed the action
+        :param action: Action performed
+        :param status: Status / result of action
+        :param add_info: Optional additional details to add
+        """
+        self.database.log(user, action, status, add_info, self.guild_id)
+
+
+class GuildRouter:
+    def __init__(self, database: AsyncDatabase, partitioned: bool = False, guild_db_path: str = None):
+        """
+        Create a new guild router
+
+        :param database: Default database, used for every guild if not partitioned and for direct messages
+        :param partitioned: Give each guild its own quotes instead of sharing one global set
+        :param guild_db_path: Optional path template with a {guild_id} field to store each guild in its own file,
+        implies partitioned
+        """
+        self.database = database
+        self.partitioned = partitioned or guild_db_path is not None
+        self.guild_db_path = guild_db_path
+        self._guild_databases: dict[int, AsyncDatabase] = {}
+        self._open_lock = asyncio.Lock()
+        self._unopened_totals: dict[int, int] | None = None  # guild -> quotes in files on disk when first counted
+        # every guild file shares one set of threads so open guilds don't each add more
+        self._executor = None
+        if self.guild_db_path is not None and database.database.concurrency > 0:
+            self._executor = ThreadPoolExecutor(max_workers=database.database.concurrency,
+                                                thread_name_prefix="quotebot-guild-db")
+
+    async def get(self, guild_id: int | None) -> GuildDatabase:
+        """
+        Get the partition of a guild, opening its database file if needed
+
+        :param guild_id: ID of the guild, None for direct messages
+        :return: View of the guild's quotes
+        """
+        if not self.partitioned or guild_id is None:
+            return GuildDatabase(self.database, DEFAULT_GUILD_ID)
+        if self.guild_db_path is None:
+            return GuildDatabase(self.database, guild_id)
+
+        database = self._guild_databases.get(guild_id)
+        if database is None:
+            async with self._open_lock:
+                database = self._guild_databases.get(guild_id)
+                if database is None:
+                    # opening builds the indexes, keep it off the event loop
+                    database = await asyncio.get_running_loop().run_in_executor(None, self._open, guild_id)
+                    self._guild_databases[guild_id] = database
+        return GuildDatabase(database, guild_id)
+
+    def _open(self, guild_id: int) -> AsyncDatabase:
+        """
+        Open the database file of a guild with the same backend as the default database, creating it if it does not
+        exist
+
+        :param guild_id: ID of the guild
+        :return: Guild database
+        """
+        path = self.guild_db_path.format(guild_id=guild_id)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        return AsyncDatabase(self.database.database.open_partition(path), self._executor)
+
+    def databases(self) -> list[AsyncDatabase]:
+        """
+        Get every open database
+
+        :return: List of databases, default database first
+        """
+        return [self.database, *self._guild_databases.values()]
+
+    def _count_guild_files(self) -> dict[int, int]:
+        """
+        Count the quotes in every guild database file on disk
+
+        :return: Dictionary of guild ID to number of quotes
+        """
+        prefix, _, suffix = self.guild_db_path.partition("{guild_id}")
+        totals = {}
+        for path in glob.glob(f"{glob.escape(prefix)}*{glob.escape(suffix)}"):
+            guild_id = path[len(prefix):len(path) - len(suffix)]
+            if guild_id.isdigit():
+                totals[int(guild_id)] = self.database.database.count_partition(path)
+        return totals
+
+    async def get_quote_total(self) -> int:
+        """
+        Get the total number of quotes across every guild, including guild files that haven't been opened yet
+
+        :return: Number of quotes
+        """
+        total = sum([await d.get_quote_total_all_guilds() for d in self.databases()])
+        if self.guild_db_path is None:
+            return total
+
+        # files are only counted once, open guilds are counted live and new files are always opened
+        if self._unopened_totals is None:
+            self._unopened_totals = await asyncio.get_running_loop().run_in_executor(None, self._count_guild_files)
+        return total + sum(count for guild_id, count in self._unopened_totals.items()
+                           if guild_id not in self._guild_databases)
+
+    async def flush_logs(self) -> int:
+        """
+        Write all buffered log messages of every open database now
+
+        :return: Number of log messages written
+        """
+        return sum([await d.flush_logs() for d in self.databases()])
+
+    async def apply_log_retention(self, days: int) -> dict:
+        """
+        Roll up and delete log rows older than the retention period in every open database
+
+        :param days: Number of days of raw log rows to keep
+        :return: Dictionary of rows deleted and pages freed across every database
+        """
+        results = [await d.apply_log_retention(days) for d in self.databases()]
+        return {key: sum(r[key] for r in results) for key in ("deleted", "freed_pages")}
+
+    def close(self) -> None:
+        """
+        Close every open database
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        for database in self.databases():
+            database.close()
+        self._guild_databases.clear()
@@ -0,0 +1,264 @@
+"""
+File: ingest.py
+Description: Background queue that parses messages and writes quote-like adds in batches so message handlers never
+wait on the database
+
+@author Derek Garcia
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, NamedTuple
+
+from guilds import GuildDatabase
+from logger import Status, log
+from metrics import Metrics
+from quote import Quote, match_quote
+from storage import DUPLICATE_QUOTE
+
+DEFAULT_MAX_QUEUED = 10000  # handlers wait for room past this
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_BATCH_DELAY = 0.05  # seconds to let a burst build up before writing it
+FAILED_QUOTE = -1  # quote ID result when the batch could not be written
+
+
+class PendingMessage(NamedTuple):
+    """
+    Message waiting to be parsed and, if quote-like, written
+    """
+    message: Any  # discord message
+    queued: float  # perf counter time it was queued
+    result: asyncio.Future  # quote ID once written, None if not added
+
+
+class PendingQuote(NamedTuple):
+    """
+    Quote-like message waiting to be written
+    """
+    database: GuildDatabase
+    quote: Quote
+    pending: PendingMessage
+
+    @property
+    def contributor(self) -> str:
+        """
+        :return: Author of the message
+        """
+        return str(self.pending.message.author)
+
+    @property
+    def content(self) -> str:
+        """
+        :return: Original message, for the log
+        """
+        return self.pending.message.content
+
+
+class IngestQueue:
+    def __init__(self, metrics: Metrics, get_database: Callable[[Any], Awaitable[GuildDatabase]],
+                 allow: Callable[[Any], Awaitable[bool]] = None, on_added: Callable[[], None] = None,
+                 max_queued: int = DEFAULT_MAX_QUEUED, batch_size: int = DEFAULT_BATCH_SIZE,
+                 batch_delay: float = DEFAULT_BATCH_DELAY):
+        """
+        Create a new ingestion queue, the worker starts with the first queued message
+
+        :param metrics: Metrics registry to record the time from queued to written in
+        :param get_database: Callback to get the quotes of the guild a message was sent in
+        :param allow: Optional callback to check a quote-like message against the throttle, False drops it
+        :param on_added: Optional callback after a batch added at least one quote, e.g. to update the presence
+        :param max_queued: Max number of messages to hold before queueing waits
+        :param batch_size: Max number of messages to handle at once
+        :param batch_delay: Seconds to wait for more messages after the first before handling them
+        """
+        self.metrics = metrics
+        self.get_database = get_database
+        self.allow = allow
+        self.on_added = on_added
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self._queue: asyncio.Queue[PendingMessage] = asyncio.Queue(maxsize=max_queued)
+        self._lock = asyncio.Lock()  # held while a batch is handled so batches are written in the order queued
+        self._next = None  # message the worker took from the queue but hasn't handled yet
+        self._task = None
+        self._closed = False
+
+        # stats
+        self.skipped = 0  # not quote-like or throttled
+        self.added = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self) -> None:
+        """
+        Start writing in the background if not already running
+        """
+        if not self._closed and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run(), name="quotebot-ingest")
+
+    async def put(self, message) -> asyncio.Future:
+        """
+        Queue a message to be parsed and added if it is quote-like. Only waits if the queue is full, handled right
+        away once closed
+
+        :param message: Message to add
+        :return: Future of the quote ID, DUPLICATE_QUOTE if the quotee already has it, FAILED_QUOTE on error or None if
+        the message isn't quote-like or was throttled
+        """
+        pending = PendingMessage(message, time.perf_counter(), asyncio.get_running_loop().create_future())
+        if self._closed:
+            async with self._lock:
+                await self._handle([pending])
+        else:
+            self.start()
+            await self._queue.put(pending)
+        return pending.result
+
+    def _take(self, first: PendingMessage = None) -> list[PendingMessage]:
+        """
+        Take up to a batch of queued messages without waiting
+
+        :param first: Optional message already taken from the queue to start the batch with
+        :return: List of pending messages, empty if none are queued
+        """
+        batch = [] if first is None else [first]
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _parse(self, pending: PendingMessage) -> PendingQuote | None:
+        """
+        Parse a message and find the guild to add it to, resolving it right away if it won't be added
+
+        :param pending: Message to parse
+        :return: Quote to write, None if the message was resolved
+        """
+        quote = match_quote(pending.message.content)
+        if quote is None or (self.allow is not None and not await self.allow(pending.message)):
+            self.skipped += 1
+            pending.result.set_result(None)
+            return None
+        return PendingQuote(await self.get_database(pending.message.guild), quote, pending)
+
+    async def _write(self, batch: list[PendingMessage]) -> None:
+        """
+        Parse a batch of messages and add the quote-like ones, one call per guild, then log and resolve each. A
+        failure only fails the quotes of its own guild
+
+        :param batch: Messages to handle
+        """
+        guilds: dict[tuple[int, int], list[PendingQuote]] = {}
+        for pending in batch:
+            try:
+                quote = await self._parse(pending)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                log(str(pending.message.author), "quote-like add", Status.ERROR, f"Failed to parse: {e}")
+                self.failed += 1
+                pending.result.set_result(FAILED_QUOTE)
+                continue
+            if quote is not None:
+                guilds.setdefault((id(quote.database.database), quote.database.guild_id), []).append(quote)
+
+        added = False
+        for pendings in guilds.values():
+            database = pendings[0].database
+            try:
+                qids = await database.add_quotes([(p.quote, p.contributor) for p in pendings])
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # anything else queued still has to be written, only fail this guild's quotes
+                log("admin", "quote-like add", Status.ERROR, f"Failed to add {len(pendings)} quotes: {e}")
+                qids = [FAILED_QUOTE] * len(pendings)
+
+            now = time.perf_counter()
+            for pending, qid in zip(pendings, qids):
+                self.metrics.observe("command", "quote-like add", now - pending.pending.queued, qid == FAILED_QUOTE)
+                if qid == DUPLICATE_QUOTE:
+                    # reposts and edits of a quote already saved
+                    self.duplicates += 1
+                    log(pending.contributor, "quote-like add", Status.WARN, f"Duplicate: {pending.content}",
+                        database=database)
+                elif qid == FAILED_QUOTE:
+                    self.failed += 1
+                    log(pending.contributor, "quote-like add", Status.ERROR, f"Failed to upload: {pending.content}",
+                        database=database)
+                else:
+                    self.added += 1
+                    added = True
+                    log(pending.contributor, "quote-like add", Status.SUCCESS, f"{qid} | {pending.content}",
+                        database=database)
+                if not pending.pending.result.done():
+                    pending.pending.result.set_result(qid)
+
+        self.batches += 1
+        if added and self.on_added is not None:
+            self.on_added()
+
+    async def _run(self) -> None:
+        """
+        Wait for a message, give the burst a moment to build up, then handle everything queued in batches
+        """
+        while True:
+            self._next = await self._queue.get()
+            async with self._lock:
+                if self._next is None:
+                    continue  # a flush handled it while the lock was held
+                if self._queue.qsize() + 1 < self.batch_size:
+                    await asyncio.sleep(self.batch_delay)
+                first, self._next = self._next, None
+                await self._handle(self._take(first))
+
+    async def _handle(self, batch: list[PendingMessage]) -> None:
+        """
+        Handle a batch of messages. Never raises so the worker keeps running, anything left unresolved fails
+
+        :param batch: Messages to handle
+        """
+        try:
+            await self._write(batch)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            log("admin", "quote-like add", Status.ERROR, f"Failed to handle {len(batch)} messages: {e}")
+            for pending in batch:
+                if not pending.result.done():
+                    pending.result.set_result(FAILED_QUOTE)
+
+    async def flush(self) -> int:
+        """
+        Wait for any batch already being handled, then handle every queued message now
+
+        :return: Number of messages handled by this call
+        """
+        total = 0
+        async with self._lock:
+            # the worker's next message was queued before everything still in the queue, so it goes first
+            first, self._next = self._next, None
+            while batch := self._take(first):
+                first = None
+                await self._handle(batch)
+                total += len(batch)
+        return total
+
+    def stats(self) -> dict:
+        """
+        Get ingestion stats
+
+        :return: Dictionary of ingestion stats
+        """
+        return {
+            "queued": self._queue.qsize(),
+            "skipped": self.skipped,
+            "added": self.added,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
+
+    async def close(self) -> None:
+        """
+        Stop taking new messages into the queue, handle everything queued and stop the worker
+        """
+        if self._closed:
+            return
+        self._closed = True
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,202 @@
+"""
+File: log_sink.py
+Description: Buffered background writer for audit logs
+
+@author Derek Garcia
+"""
+import atexit
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+DEFAULT_MAX_QUEUED = 10000
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 2.0  # seconds
+
+
+class _Flusher:
+    def __init__(self):
+        """
+        Single background thread that flushes every open log sink, so opening more databases doesn't add threads
+        """
+        self._sinks: set["LogSink"] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def register(self, sink: "LogSink") -> None:
+        """
+        Start flushing a sink, starting the thread if it isn't running
+
+        :param sink: Log sink to flush
+        """
+        with self._lock:
+            self._sinks.add(sink)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="quotebot-log-sink", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def unregister(self, sink: "LogSink") -> None:
+        """
+        Stop flushing a sink, the thread stops once no sinks are left
+
+        :param sink: Log sink to stop flushing
+        """
+        with self._lock:
+            self._sinks.discard(sink)
+        self._wake.set()
+
+    def wake(self) -> None:
+        """
+        Check the sinks now instead of waiting for the next flush to be due
+        """
+        self._wake.set()
+
+    def _run(self) -> None:
+        """
+        Flush each sink on its timer or once it holds a full batch until no sinks are left
+        """
+        while True:
+            with self._lock:
+                if len(self._sinks) == 0:
+                    self._thread = None
+                    return
+                sinks = list(self._sinks)
+
+            now = time.monotonic()
+            for sink in sinks:
+                if sink.due(now):
+                    sink.flush()
+            # sleep until the next sink is due or one is woken by a full batch
+            now = time.monotonic()
+            self._wake.wait(max(0.0, min(sink.next_flush - now for sink in sinks)))
+            self._wake.clear()
+
+
+_FLUSHER = _Flusher()
+
+
+class LogSink:
+    def __init__(self, write: Callable[[list[tuple]], None], max_queued: int = DEFAULT_MAX_QUEUED,
+                 batch_size: int = DEFAULT_BATCH_SIZE, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        """
+        Create a new log sink and register it with the shared background writer
+
+        :param write: Function that saves a batch of (time, user, action, status, additional_info, guild_id) entries
+        :param max_queued: Max number of log entries to hold before new entries are dropped
+        :param batch_size: Number of queued entries that triggers an early flush
+        :param flush_interval: Max seconds an entry waits before being flushed
+        """
+        self.write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._stopped = threading.Event()
+        self.next_flush = time.monotonic() + flush_interval
+        self._flush_lock = threading.Lock()  # only one flush at a time
+
+        # stats
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+
+        _FLUSHER.register(self)
+        atexit.register(self.close)  # flush even if the process exits without closing
+
+    def put(self, user: str, action: str, status: str, add_info=None, guild_id: int = 0) -> bool:
+        """
+        Queue a log entry to be written. Never blocks, entries are dropped and counted if the queue is full
+
+        :param user: User who performed the action
+        :param action: Action performed
+        :param status: Status / result of action
+        :param add_info: Optional additional details to add
+        :param guild_id: Guild the action was performed in
+        :return: True if queued, False if dropped
+        """
+        if self._stopped.is_set():
+            self.dropped += 1
+            return False
+        # same format as CURRENT_TIMESTAMP so time is when logged, not when flushed
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            self._queue.put_nowait(
+                (timestamp, user, action, status, None if add_info is None else str(add_info), guild_id))
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+        if self._queue.qsize() >= self.batch_size:
+            _FLUSHER.wake()
+        return True
+
+    def flush(self) -> int:
+        """
+        Write all queued entries in a single transaction
+
+        :return: Number of entries written
+        """
+        with self._flush_lock:
+            self.next_flush = time.monotonic() + self.flush_interval
+            entries = []
+            while True:
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if len(entries) == 0:
+                return 0
+
+            try:
+                self.write(entries)
+            except (sqlite3.Error, OSError) as e:
+                # can't log to the database about the database, report to console
+                self.failed += len(entries)
+                print(f"Failed to flush {len(entries)} log entries: {e}", file=sys.stderr)
+                return 0
+
+            self.written += len(entries)
+            self.flushes += 1
+            return len(entries)
+
+    def due(self, now: float) -> bool:
+        """
+        Check if the sink should be flushed
+
+        :param now: Current monotonic time
+        :return: True if the flush interval is up or a full batch is queued
+        """
+        return now >= self.next_flush or self._queue.qsize() >= self.batch_size
+
+    def stats(self) -> dict:
+        """
+        Get sink usage stats
+
+        :return: Dictionary of sink stats
+        """
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flushes": self.flushes,
+        }
+
+    def close(self) -> None:
+        """
+        Stop the background writer and flush any remaining entries
+        """
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        _FLUSHER.unregister(self)
+        # waits for a flush already running on the background writer
+        self.flush()
+        atexit.unregister(self.close)
@@ -0,0 +1,696 @@
+"""
+File: memory_storage.py
+Description: In-memory storage backend that keeps quotes in columns and persists through an append log compacted
+into periodic snapshots. Meant for small deployments and tests
+
+@author Derek Garcia
+"""
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from itertools import batched
+from typing import Iterable, Iterator
+
+from log_sink import LogSink
+from logger import Status, log
+from metrics import Metrics, timed
+from quote import Quote, content_hash
+from quote_index import QuoteIndex
+from quotee_index import DEFAULT_SUGGESTION_LIMIT, QuoteeIndex, Suggestion
+from storage import (DEFAULT_GUILD_ID, DEFAULT_IMPORT_BATCH_SIZE, DEFAULT_PAGE_SIZE, DEFAULT_SEARCH_LIMIT,
+                     DUPLICATE_QUOTE, EXPORT_FIELDS, Storage)
+
+DEFAULT_SNAPSHOT_PATH = "data/db/quotes.snapshot"
+DEFAULT_SNAPSHOT_EVERY = 10000  # appended quotes before the append log is compacted into a snapshot
+MEMORY_LOCATION = ":memory:"  # keep nothing on disk
+SNAPSHOT_VERSION = 1
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"  # same as sqlite CURRENT_TIMESTAMP
+WORD_REGEX = re.compile(r"\w+")
+CONTEXT_WEIGHT = 0.5  # context matches count half as much as quote matches, same as the sqlite search
+
+
+def now() -> str:
+    """
+    :return: Current UTC time formatted like sqlite timestamps
+    """
+    return datetime.now(timezone.utc).strftime(TIME_FORMAT)
+
+
+class MemoryStorage(Storage):
+    def __init__(self, location: str = DEFAULT_SNAPSHOT_PATH, snapshot_every: int = DEFAULT_SNAPSHOT_EVERY,
+                 metrics: Metrics = None, fsync: bool = False, warm: bool = True):
+        """
+        Load or create a new in-memory store
+
+        :param location: Path to the snapshot, the append log is kept next to it. ':memory:' to keep nothing on disk
+        :param snapshot_every: Number of appended quotes before compacting into a snapshot
+        :param metrics: Optional metrics registry to share with other stores
+        :param fsync: Sync the append log to disk after every write instead of leaving it to the OS
+        :param warm: Load the snapshot now, else warm_up must be called before querying
+        """
+        self.db_location = DEFAULT_SNAPSHOT_PATH if location is None or not location else location
+        self.log_location = f"{self.db_location}.log"
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.metrics = Metrics() if metrics is None else metrics
+        # writes, snapshots and backups touch the disk and take turns on the lock, reads never take it. Two threads
+        # so a read can run while a write holds the lock, the executor doesn't reserve either thread for one kind
+        self.concurrency = 2
+
+        self._lock = threading.RLock()  # writers only, columns are append only so reads don't lock
+
+        # one entry per quote, quote id is the position + 1. Text is kept as plain strings, only guild ids are packed
+        # into an array
+        self._time: list[str] = []
+        self._guild = array('q')
+        self._pre_context: list[str | None] = []
+        self._quote: list[str] = []
+        self._post_context: list[str | None] = []
+        self._quotee: list[str] = []  # names are interned so repeats share one string
+        self._contributor: list[str] = []  # interned like quotee names
+
+        # lookups
+        self._quotees: dict[int, dict[str, None]] = {}  # guild -> quotee names in the order added
+        self.quote_index = QuoteIndex()
+        self.quotee_indexes: dict[int, QuoteeIndex] = {}
+        self._words: dict[str, array] = {}  # lowercase word -> quote ids containing it
+        self._vocab: list[str] | None = None  # sorted words for prefix search, rebuilt when new words are added
+        self._hashes: set[int] = set()  # hash of (guild, quotee, quote content hash) of every quote
+        self._duplicates = 0  # duplicates loaded from before duplicate detection, kept but not indexed
+
+        # audit logs
+        self._logs: list[tuple] = []  # (time, user, action, status, additional_info, guild_id)
+        self._log_daily: Counter = Counter()  # (day, guild_id, action, status, user) -> count
+
+        # persistence
+        self._seq = 0  # sequence number of the last change
+        self._appended = 0  # quotes in the append log since the last snapshot, logs don't count
+        self._snapshots = 0
+        self._snapshot_seconds = 0.0
+        self._file = None
+        # buffer audit logs so logging never writes to disk on the caller's thread
+        self.log_sink = LogSink(self._write_logs)
+        self.warmed = self.db_location == MEMORY_LOCATION  # nothing to load
+        if warm:
+            self.warm_up()
+
+    def warm_up(self) -> None:
+        """
+        Load the snapshot and append log. Only the first call does anything
+        """
+        with self._lock:
+            if self.warmed:
+                return
+            changed = self._load()
+            self.warmed = True
+            # compact now so a torn record is never followed by new ones, they would be lost on the next load
+            if changed:
+                self.snapshot()
+            if self._file is None:
+                self._file = open(self.log_location, 'a', encoding='utf-8')
+
+    def _load(self) -> bool:
+        """
+        Load the last snapshot and replay any changes appended after it
+
+        :return: True if the append log has to be compacted, anything was replayed or it ends in a partial record
+        """
+        os.makedirs(os.path.dirname(self.db_location) or ".", exist_ok=True)
+        if os.path.exists(self.db_location):
+            with open(self.db_location, 'r', encoding='utf-8') as file:
+                snapshot = json.load(file)
+            quotes = snapshot["quotes"]
+            for row in zip(*(quotes[column] for column in ("time", "guild_id", *EXPORT_FIELDS[1:]))):
+                self._insert(*row, keep_duplicate=True)
+            self._logs = [tuple(entry) for entry in snapshot["logs"]]
+            # snapshots from before guilds were rolled up have no guild, count them under the default guild
+            self._log_daily = Counter({
+                tuple(row[:5]) if len(row) == 6 else (row[0], DEFAULT_GUILD_ID, *row[1:4]): row[-1]
+                for row in snapshot["log_daily"]
+            })
+            self._seq = snapshot["seq"]
+
+        replayed = 0
+        partial = False
+        if os.path.exists(self.log_location):
+            with open(self.log_location, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # torn write from a crash, nothing after it was acknowledged
+                        log("database", "load", Status.WARN, f"Ignoring partial record in {self.log_location}")
+                        partial = True
+                        break
+                    # already in the snapshot if a crash happened between snapshotting and truncating
+                    if record["seq"] <= self._seq:
+                        continue
+                    self._apply(record)
+                    self._seq = record["seq"]
+                    replayed += 1
+
+        if self._duplicates > 0:
+            log("database", "dedupe", Status.WARN,
+                f"Kept {self._duplicates} duplicate quotes from before duplicate detection, they are not indexed")
+        return replayed > 0 or partial
+
+    def _apply(self, record: dict) -> None:
+        """
+        Apply a change from the append log
+
+        :param record: Change to apply
+        """
+        match record["op"]:
+            case "quote":
+                # accepted when it was added, keep it even if the hash has changed since
+                self._insert(record["time"], record["guild_id"], record["pre_context"], record["quote"],
+                             record["post_context"], record["quotee"], record["contributor"], keep_duplicate=True)
+            case "log":
+                self._logs.append((record["time"], record["user"], record["action"], record["status"],
+                                   record["additional_info"], record["guild_id"]))
+            case "retention":
+                self._roll_up(record["cutoff"])
+
+    def _append(self, *records: dict) -> None:
+        """
+        Write changes to the append log with a single flush, compacting into a snapshot when the log gets long. Must
+        hold the lock
+
+        :param records: Changes to write
+        """
+        if self._file is None:
+            self._seq += len(records)
+            return
+        for record in records:
+            self._seq += 1
+            record["seq"] = self._seq
+            self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        # only quotes count, so busy logging doesn't cause snapshots of a store that hasn't changed
+        self._appended += sum(1 for record in records if record["op"] == "quote")
+        if self._appended >= self.snapshot_every:
+            self.snapshot()
+
+    def _dump(self, location: str) -> None:
+        """
+        Write the whole store to a file, replaced in one step so a crash never leaves a partial file. Must hold the lock
+
+        :param location: File to write to
+        """
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "seq": self._seq,
+            "quotes": {
+                "time": self._time,
+                "guild_id": self._guild.tolist(),
+                "pre_context": self._pre_context,
+                "quote": self._quote,
+                "post_context": self._post_context,
+                "quotee": self._quotee,
+                "contributor": self._contributor
+            },
+            "logs": self._logs,
+            "log_daily": [[*key, count] for key, count in self._log_daily.items()]
+        }
+        tmp = f"{location}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as file:
+            json.dump(snapshot, file, separators=(",", ":"))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, location)
+
+    def snapshot(self) -> None:
+        """
+        Write the whole store to the snapshot and empty the append log
+        """
+        # never overwrite a snapshot that hasn't been loaded yet
+        if self.db_location == MEMORY_LOCATION or not self.warmed:
+            return
+        start = time.perf_counter()
+        with self._lock:
+            self._dump(self.db_location)
+            # changes are in the snapshot now, start a new append log
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.log_location, 'w', encoding='utf-8')
+            self._appended = 0
+            self._snapshots += 1
+        self._snapshot_seconds = time.perf_counter() - start
+
+    def _insert(self, time_added: str, guild_id: int, pre_context: str | None, quote: str, post_context: str | None,
+                quotee: str, contributor: str, keep_duplicate: bool = False) -> int:
+        """
+        Add a quote to the columns and indexes. Must hold the lock
+
+        :param time_added: Time the quote was added
+        :param guild_id: Guild of the quote
+        :param pre_context: Optional context before the quote
+        :param quote: Quote text
+        :param post_context: Optional context after the quote
+        :param quotee: Lowercase quotee
+        :param contributor: Contributor who added the quote
+        :param keep_duplicate: Keep the quote even if the quotee already has it, for quotes that were already saved. The
+            copy is stored but not indexed
+        :return: Quote ID, DUPLICATE_QUOTE if the quotee already has the same quote and it isn't kept
+        """
+        key = hash((guild_id, quotee, content_hash(quote, pre_context, post_context)))
+        duplicate = key in self._hashes
+        if duplicate and not keep_duplicate:
+            return DUPLICATE_QUOTE
+        self._hashes.add(key)
+
+        quotee = sys.intern(quotee)
+        # columns first, readers only find an id through the indexes
+        self._time.append(time_added)
+        self._guild.append(guild_id)
+        self._pre_context.append(pre_context)
+        self._quote.append(quote)
+        self._post_context.append(post_context)
+        self._quotee.append(quotee)
+        self._contributor.append(sys.intern(contributor))
+        qid = len(self._quote)
+        if duplicate:
+            # kept in the columns so snapshots still have it, but left out of the indexes like the sqlite backend
+            # leaves unhashed duplicates out of its counts, picks and results
+            self._duplicates += 1
+            return qid
+
+        names = self._quotees.setdefault(guild_id, {})
+        new_quotee = quotee not in names
+        names[quotee] = None
+        self.quote_index.add(qid, quotee, new_quotee, guild_id)
+        if new_quotee:
+            self.get_quotee_index(guild_id).add(quotee)
+
+        for word in {w.lower() for text in (pre_context, quote, post_context) if text
+                     for w in WORD_REGEX.findall(text)}:
+            ids = self._words.get(word)
+            if ids is None:
+                ids = self._words[word] = array('q')
+                self._vocab = None
+            ids.append(qid)
+        return qid
+
+    def _row(self, qid: int) -> Quote:
+        """
+        Get a quote by id
+
+        :param qid: Quote ID
+        :return: Quote
+        """
+        i = qid - 1
+        return Quote.from_row(None, (self._quote[i], self._quotee[i], self._pre_context[i], self._post_context[i]))
+
+    def get_quotee_index(self, guild_id: int) -> QuoteeIndex:
+        """
+        Get the quotee name index of a guild, creating it if the guild has no quotees yet
+
+        :param guild_id: Guild to get the index for
+        :return: Quotee index
+        """
+        index = self.quotee_indexes.get(guild_id)
+        if index is None:
+            index = self.quotee_indexes.setdefault(guild_id, QuoteeIndex())
+        return index
+
+    @timed
+    def add_quote(self, quote: Quote, contributor: str, guild_id: int = DEFAULT_GUILD_ID) -> int:
+        """
+        Add a quote
+
+        :param quote: Quote to add
+        :param contributor: Contributor who added the quote
+        :param guild_id: Guild the quote was added in
+        :return: Quote ID, DUPLICATE_QUOTE if the quotee already has the same quote
+        """
+        record = {"op": "quote", "time": now(), "guild_id": guild_id, "pre_context": quote.pre_context,
+                  "quote": quote.quote, "post_context": quote.post_context, "quotee": quote.quotee.lower(),
+                  "contributor": contributor}
+        with self._lock:
+            qid = self._insert(record["time"], guild_id, quote.pre_context, quote.quote, quote.post_context,
+                               record["quotee"], contributor)
+            if qid != DUPLICATE_QUOTE:
+                self._append(record)
+        return qid
+
+    @timed
+    def add_quotes(self, records: list[tuple[Quote, str]], guild_id: int = DEFAULT_GUILD_ID) -> list[int]:
+        """
+        Add a batch of quotes with a single write to the append log
+
+        :param records: List of (quote, contributor) to add
+        :param guild_id: Guild the quotes were added in
+        :return: Quote ID of each record in order, DUPLICATE_QUOTE for each the quotee already has
+        """
+        time_added = now()
+        qids = []
+        added = []
+        with self._lock:
+            for quote, contributor in records:
+                quotee = quote.quotee.lower()
+                qid = self._insert(time_added, guild_id, quote.pre_context, quote.quote, quote.post_context, quotee,
+                                   contributor)
+                qids.append(qid)
+                if qid != DUPLICATE_QUOTE:
+                    added.append({"op": "quote", "time": time_added, "guild_id": guild_id,
+                                  "pre_context": quote.pre_context, "quote": quote.quote,
+                                  "post_context": quote.post_context, "quotee": quotee, "contributor": contributor})
+            if added:
+                self._append(*added)
+        return qids
+
+    @timed
+    def import_quotes(self, records: Iterable[tuple[Quote, str, str | None]],
+                      batch_size: int = DEFAULT_IMPORT_BATCH_SIZE, guild_id: int = DEFAULT_GUILD_ID) -> int:
+        """
+        Bulk add quotes, skipping duplicates. Saved with a single snapshot at the end instead of through the append log
+
+        :param records: Iterable of (quote, contributor, optional time) to add
+        :param batch_size: Number of quotes to add per lock
+        :param guild_id: Guild to add the quotes to
+        :return: Number of quotes added
+        """
+        total = 0
+        for batch in batched(records, batch_size):
+            with self._lock:
+                for q, contributor, time_added in batch:
+                    if self._insert(time_added or now(), guild_id, q.pre_context, q.quote, q.post_context,
+                                    q.quotee.lower(), contributor) != DUPLICATE_QUOTE:
+                        self._seq += 1
+                        total += 1
+        self.snapshot()
+        return total
+
+    def export_quotes(self, guild_id: int = DEFAULT_GUILD_ID) -> Iterator[dict]:
+        """
+        Stream every quote of a guild
+
+        :param guild_id: Guild to export quotes from
+        :return: Iterator of quote records
+        """
+        for qid in self.quote_index.ids(guild_id=guild_id):
+            i = qid - 1
+            yield dict(zip(EXPORT_FIELDS, (self._time[i], self._pre_context[i], self._quote[i],
+                                           self._post_context[i], self._quotee[i], self._contributor[i])))
+
+    @timed
+    def find_similar_quotee(self, quotee: str, limit: int = DEFAULT_SUGGESTION_LIMIT,
+                            guild_id: int = DEFAULT_GUILD_ID) -> list[Suggestion]:
+        """
+        Get list of quotees that a similar to the given quotee
+
+        :param quotee: Quotee to attempt to match
+        :param limit: Max number of quotees to return
+        :param guild_id: Guild to search quotees of
+        :return: List of similar quotees ordered by most similar, with the spans of each name that matched
+        """
+        return self.get_quotee_index(guild_id).search(quotee.lower(), limit)
+
+    @timed
+    def get_all_quotees(self, guild_id: int = DEFAULT_GUILD_ID) -> list[str]:
+        """
+        Get all quotees of a guild
+
+        :param guild_id: Guild to get quotees of
+        :return: List of quotees
+        """
+        return list(self._quotees.get(guild_id, ()))
+
+    @timed
+    def get_all_quotes(self, quotee: str = None, guild_id: int = DEFAULT_GUILD_ID) -> list[Quote]:
+        """
+        Get all quotes of a guild or for specific quotee
+
+        :param quotee: Optional quotee to get all quotes for
+        :param guild_id: Guild to get quotes of
+        :return: List of Quotes
+        """
+        ids = self.quote_index.ids(None if quotee is None else quotee.lower(), guild_id)
+        return [self._row(qid) for qid in ids]
+
+    @timed
+    def get_quote_page(self, quotee: str, page: int = 1, page_size: int = DEFAULT_PAGE_SIZE,
+                       guild_id: int = DEFAULT_GUILD_ID) -> list[Quote]:
+        """
+        Get one page of a quotee's quotes in the order they were added
+
+        :param quotee: Quotee to get quotes for
+        :param page: Page number, starting at 1
+        :param page_size: Number of quotes per page
+        :param guild_id: Guild of the quotee
+        :return: List of at most page size Quotes, empty if the page is out of range
+        """
+        if page < 1:
+            return []
+        start = (page - 1) * page_size
+        return [self._row(qid) for qid in self.quote_index.ids(quotee.lower(), guild_id, start, start + page_size)]
+
+    @timed
+    def get_rand_quote(self, quotee: str = None, guild_id: int = DEFAULT_GUILD_ID) -> Quote | None:
+        """
+        Get a random quote from a guild or specific quotee
+
+        :param quotee: Optional quotee to get a random quote from
+        :param guild_id: Guild to get a random quote from
+        :return: Quote or None if no quotes from quotee
+        """
+        qid = self.quote_index.pick(None if quotee is None else quotee.lower(), guild_id)
+        return None if qid is None else self._row(qid)
+
+    def _prefix_ids(self, prefix: str) -> set[int]:
+        """
+        Get the ids of every quote with a word starting with the prefix
+
+        :param prefix: Lowercase word prefix
+        :return: Set of quote ids
+        """
+        vocab = self._vocab
+        if vocab is None:
+            vocab = self._vocab = sorted(self._words)
+        ids = set()
+        for i in range(bisect_left(vocab, prefix), len(vocab)):
+            if not vocab[i].startswith(prefix):
+                break
+            ids.update(self._words[vocab[i]])
+        return ids
+
+    def _score(self, qid: int, prefixes: list[str]) -> float:
+        """
+        Score how relevant a quote is, matches in the quote count more than the context and shorter text ranks higher
+
+        :param qid: Quote ID
+        :param prefixes: Lowercase word prefixes searched for
+        :return: Relevance score
+        """
+        i = qid - 1
+        score = 0.0
+        for text, weight in ((self._quote[i], 1.0), (self._pre_context[i], CONTEXT_WEIGHT),
+                             (self._post_context[i], CONTEXT_WEIGHT)):
+            if not text:
+                continue
+            words = WORD_REGEX.findall(text.lower())
+            hits = sum(1 for w in words for p in prefixes if w.startswith(p))
+            score += weight * hits / math.sqrt(len(words))
+        return score
+
+    @timed
+    def search_quotes(self, keywords: str, limit: int = DEFAULT_SEARCH_LIMIT,
+                      guild_id: int = DEFAULT_GUILD_ID) -> list[Quote]:
+        """
+        Full text search the quote and context text of a guild's quotes
+
+        :param keywords: Words to search for, all must be present as words or word prefixes
+        :param limit: Max number of quotes to return
+        :param guild_id: Guild to search quotes of
+        :return: List of Quotes ordered by relevance
+        """
+        prefixes = [w.lower() for w in WORD_REGEX.findall(keywords)]
+        if len(prefixes) == 0:
+            return []
+
+        # every word must match, start from the rarest
+        matches = sorted((self._prefix_ids(p) for p in prefixes), key=len)
+        ids = matches[0].intersection(*matches[1:])
+        ids = [qid for qid in ids if self._guild[qid - 1] == guild_id]
+        ids.sort(key=lambda qid: (-self._score(qid, prefixes), qid))
+        return [self._row(qid) for qid in ids[:limit]]
+
+    @timed
+    def get_quote_total(self, quotee: str = None, guild_id: int = DEFAULT_GUILD_ID) -> int:
+        """
+        Get the total number of quotes of a guild or for a quotee
+
+        :param quotee: Optional quotee to get a total quotes from
+        :param guild_id: Guild to count quotes of
+        :return: Number of quotes
+        """
+        return self.quote_index.count(None if quotee is None else quotee.lower(), guild_id)
+
+    def get_quote_total_all_guilds(self) -> int:
+        """
+        Get the total number of quotes across every guild
+
+        :return: Number of quotes
+        """
+        return self.quote_index.count_all()
+
+    @timed
+    def get_quotee_total(self, guild_id: int = DEFAULT_GUILD_ID) -> int:
+        """
+        Get the total number of quotees of a guild
+
+        :param guild_id: Guild to count quotees of
+        :return: Number of quotees in the guild
+        """
+        return self.quote_index.count_quotees(guild_id)
+
+    def log(self, user: str, action: str, status: str, add_info=None, guild_id: int = DEFAULT_GUILD_ID) -> None:
+        """
+        Queue a log message to be saved by the buffered log writer
+
+        :param user: User who performed the action
+        :param action: Action performed
+        :param status: Status / result of action
+        :param add_info: Optional additional details to add
+        :param guild_id: Guild the action was performed in
+        """
+        self.log_sink.put(user, action, status, add_info, guild_id)
+
+    def _write_logs(self, entries: list[tuple]) -> None:
+        """
+        Save a batch of log messages with a single append log write, called by the buffered log writer
+
+        :param entries: List of (time, user, action, status, additional_info, guild_id) to save
+        """
+        fields = ("time", "user", "action", "status", "additional_info", "guild_id")
+        with self._lock:
+            self._logs.extend(entries)
+            self._append(*({"op": "log", **dict(zip(fields, entry))} for entry in entries))
+
+    def flush_logs(self) -> int:
+        """
+        Write all buffered log messages now
+
+        :return: Number of log messages written
+        """
+        return self.log_sink.flush()
+
+    def _roll_up(self, cutoff: str) -> int:
+        """
+        Roll log messages older than the cutoff up into daily counts and delete them. Must hold the lock
+
+        :param cutoff: Time to keep log messages from
+        :return: Number of log messages deleted
+        """
+        kept = []
+        for entry in self._logs:
+            if entry[0] < cutoff:
+                self._log_daily[(entry[0][:10], entry[5], entry[2], entry[3], entry[1])] += 1
+            else:
+                kept.append(entry)
+        deleted = len(self._logs) - len(kept)
+        self._logs = kept
+        return deleted
+
+    @timed
+    def apply_log_retention(self, days: int) -> dict:
+        """
+        Roll log messages older than the retention period up into daily counts, delete them and shrink the snapshot
+
+        :param days: Number of days of raw log messages to keep
+        :return: Dictionary of rows deleted and pages freed
+        """
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime(TIME_FORMAT)
+        with self._lock:
+            deleted = self._roll_up(cutoff)
+            self._append({"op": "retention", "cutoff": cutoff})
+        if deleted > 0:
+            self.snapshot()
+        return {"deleted": deleted, "freed_pages": 0}
+
+    @timed
+    def backup(self, location: str) -> dict:
+        """
+        Write a snapshot of the whole store to another file, adds wait until it is written
+
+        :param location: File to write the snapshot to
+        :return: Dictionary of the size of the snapshot in bytes and the steps taken to write it
+        """
+        with self._lock:
+            self._dump(location)
+        return {"bytes": os.path.getsize(location), "steps": 1}
+
+    def get_stats(self) -> dict[str, dict]:
+        """
+        Get store size and persistence stats
+
+        :return: Dictionary of stat group name to stats
+        """
+        return {
+            "memory storage": {
+                "quotes": len(self._quote),
+                "words": len(self._words),
+                "logs": len(self._logs),
+                "duplicates": self._duplicates,
+                "appended": self._appended,
+                "snapshots": self._snapshots,
+                "last_snapshot_seconds": round(self._snapshot_seconds, 3)
+            },
+            "log writer": self.log_sink.stats()
+        }
+
+    def open_partition(self, location: str) -> "MemoryStorage":
+        """
+        Open another store for a guild partition, sharing this store's metrics
+
+        :param location: Path to the partition's snapshot
+        :return: Storage for the partition
+        """
+        return MemoryStorage(location, self.snapshot_every, self.metrics, self.fsync)
+
+    def count_partition(self, location: str) -> int:
+        """
+        Count the quotes of a guild store from its snapshot and append log without building its indexes
+
+        :param location: Path to the partition's snapshot
+        :return: Number of quotes in the partition
+        """
+        total = 0
+        seq = 0
+        if os.path.exists(location):
+            with open(location, 'r', encoding='utf-8') as file:
+                snapshot = json.load(file)
+            total = len(snapshot["quotes"]["quote"])
+            seq = snapshot["seq"]
+        if os.path.exists(f"{location}.log"):
+            with open(f"{location}.log", 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    if record["seq"] > seq and record["op"] == "quote":
+                        total += 1
+        return total
+
+    def close(self) -> None:
+        """
+        Flush pending logs, snapshot any appended changes and close the append log
+        """
+        self.log_sink.close()
+        with self._lock:
+            if self._appended > 0:
+                self.snapshot()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
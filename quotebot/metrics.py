@@ -0,0 +1,317 @@
+"""
+File: metrics.py
+Description: Latency histograms, counts and error rates for commands and database queries, exported in Prometheus
+text format
+
+@author Derek Garcia
+"""
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_METRICS_HOST = "127.0.0.1"
+DEFAULT_METRICS_INTERVAL = 15.0  # seconds
+# upper bounds in seconds, same spread as the prometheus client defaults with finer steps under 1ms for cache hits
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+KINDS = {
+    "command": ("quotebot_command", "command"),
+    "query": ("quotebot_query", "method")
+}  # kind -> (metric prefix, label name)
+COUNTERS = {
+    "throttled": ("quotebot_throttled_total", "scope", "Messages dropped by each throttle scope"),
+    "backups": ("quotebot_backups_total", "status", "Backups run by result")
+}  # counter -> (metric name, label name, help)
+GAUGES = {
+    "startup": ("quotebot_startup_seconds", "phase", "Seconds spent in each phase of the last startup"),
+    "backup_seconds": ("quotebot_backup_seconds", "database", "Seconds the last backup of each database took"),
+    "backup_bytes": ("quotebot_backup_bytes", "database", "Size of the last backup of each database"),
+    "backup_time": ("quotebot_backup_timestamp_seconds", "database", "Unix time of the last backup of each database")
+}  # gauge -> (metric name, label name, help)
+
+
+class Histogram:
+    def __init__(self):
+        """
+        Create a new empty latency histogram
+        """
+        self.buckets = [0] * (len(BUCKETS) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        """
+        Record a latency
+
+        :param seconds: Latency in seconds
+        :param error: True if the call failed
+        """
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if error:
+            self.errors += 1
+
+    def quantile(self, fraction: float) -> float:
+        """
+        Estimate a quantile by interpolating inside the bucket it falls in
+
+        :param fraction: Quantile as a fraction, e.g. 0.99
+        :return: Estimated latency in seconds
+        """
+        if self.count == 0:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if n and seen + n >= rank:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                # nothing better to report past the largest bound
+                if i == len(BUCKETS):
+                    return lower
+                return lower + (BUCKETS[i] - lower) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+class Metrics:
+    def __init__(self):
+        """
+        Create a new empty metrics registry
+        """
+        self._lock = threading.Lock()
+        self._histograms: dict[tuple[str, str], Histogram] = {}  # (kind, name) -> histogram
+        self._counters: dict[tuple[str, str], int] = {}  # (counter, label) -> count
+        self._gauges: dict[tuple[str, str], float] = {}  # (gauge, label) -> value
+        self.started = time.time()
+
+    def observe(self, kind: str, name: str, seconds: float, error: bool = False) -> None:
+        """
+        Record the latency of a call
+
+        :param kind: Kind of call, one of KINDS
+        :param name: Name of the command or method
+        :param seconds: Latency in seconds
+        :param error: True if the call failed
+        """
+        with self._lock:
+            histogram = self._histograms.get((kind, name))
+            if histogram is None:
+                histogram = self._histograms[(kind, name)] = Histogram()
+            histogram.observe(seconds, error)
+
+    def count(self, counter: str, label: str, amount: int = 1) -> None:
+        """
+        Increment a counter
+
+        :param counter: Counter to increment, one of COUNTERS
+        :param label: Label value to count under
+        :param amount: Amount to add
+        """
+        with self._lock:
+            self._counters[(counter, label)] = self._counters.get((counter, label), 0) + amount
+
+    def counts(self, counter: str) -> dict[str, int]:
+        """
+        Get the counts of a counter
+
+        :param counter: Counter to get, one of COUNTERS
+        :return: Dictionary of label value to count
+        """
+        with self._lock:
+            return {label: n for (c, label), n in sorted(self._counters.items()) if c == counter}
+
+    def set_gauge(self, gauge: str, label: str, value: float) -> None:
+        """
+        Set a gauge
+
+        :param gauge: Gauge to set, one of GAUGES
+        :param label: Label value to set under
+        :param value: New value
+        """
+        with self._lock:
+            self._gauges[(gauge, label)] = value
+
+    @contextmanager
+    def time(self, kind: str, name: str):
+        """
+        Record the latency of the wrapped block, counting it as an error if it raises
+
+        :param kind: Kind of call, one of KINDS
+        :param name: Name of the command or method
+        """
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(kind, name, time.perf_counter() - start, error)
+
+    def summary(self, kind: str) -> list[dict]:
+        """
+        Get a summary of every call of a kind
+
+        :param kind: Kind of call, one of KINDS
+        :return: List of summaries ordered by total time spent, slowest first
+        """
+        with self._lock:
+            summaries = [{
+                "name": name,
+                "count": h.count,
+                "errors": h.errors,
+                "avg": h.sum / h.count if h.count else 0.0,
+                "p50": h.quantile(0.5),
+                "p99": h.quantile(0.99),
+                "total": h.sum
+            } for (k, name), h in self._histograms.items() if k == kind]
+        return sorted(summaries, key=lambda s: -s["total"])
+
+    def to_prometheus(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format
+
+        :return: Metrics text
+        """
+        lines = []
+        with self._lock:
+            for kind, (prefix, label) in KINDS.items():
+                histograms = sorted((name, h) for (k, name), h in self._histograms.items() if k == kind)
+                lines.append(f"# HELP {prefix}_duration_seconds Latency of each {label}")
+                lines.append(f"# TYPE {prefix}_duration_seconds histogram")
+                for name, h in histograms:
+                    cumulative = 0
+                    for bound, n in zip((*BUCKETS, "+Inf"), h.buckets):
+                        cumulative += n
+                        lines.append(f'{prefix}_duration_seconds_bucket{{{label}="{name}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{prefix}_duration_seconds_sum{{{label}="{name}"}} {h.sum}')
+                    lines.append(f'{prefix}_duration_seconds_count{{{label}="{name}"}} {h.count}')
+                lines.append(f"# HELP {prefix}_errors_total Failed calls of each {label}")
+                lines.append(f"# TYPE {prefix}_errors_total counter")
+                for name, h in histograms:
+                    lines.append(f'{prefix}_errors_total{{{label}="{name}"}} {h.errors}')
+            for counter, (metric, label, description) in COUNTERS.items():
+                lines.append(f"# HELP {metric} {description}")
+                lines.append(f"# TYPE {metric} counter")
+                for (c, value), n in sorted(self._counters.items()):
+                    if c == counter:
+                        lines.append(f'{metric}{{{label}="{value}"}} {n}')
+            for gauge, (metric, label, description) in GAUGES.items():
+                lines.append(f"# HELP {metric} {description}")
+                lines.append(f"# TYPE {metric} gauge")
+                for (g, value), n in self._gauges.items():
+                    if g == gauge:
+                        lines.append(f'{metric}{{{label}="{value}"}} {n}')
+        lines.append("# HELP quotebot_start_time_seconds Unix time metrics started being recorded")
+        lines.append("# TYPE quotebot_start_time_seconds gauge")
+        lines.append(f"quotebot_start_time_seconds {self.started}")
+        return "\n".join(lines) + "\n"
+
+
+def timed(method):
+    """
+    Record the latency of a method in the owning object's metrics registry under the method name
+
+    :param method: Method of an object with a metrics attribute
+    :return: Wrapped method
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.metrics.time("query", method.__name__):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class MetricsExporter:
+    def __init__(self, metrics: Metrics, port: int = None, path: str = None,
+                 interval: float = DEFAULT_METRICS_INTERVAL, host: str = DEFAULT_METRICS_HOST):
+        """
+        Create a new exporter, does nothing if neither a port nor a path is given
+
+        :param metrics: Metrics to export
+        :param port: Optional port to serve /metrics on
+        :param path: Optional file to periodically write metrics to
+        :param interval: Seconds between file writes
+        :param host: Host to serve on, local only by default
+        """
+        self.metrics = metrics
+        self.port = port
+        self.path = path
+        self.interval = interval
+        self.host = host
+        self._server = None
+        self._task = None
+
+    async def start(self) -> None:
+        """
+        Start serving and writing metrics in the background if not already running
+        """
+        if self.port is not None and self._server is None:
+            self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        if self.path is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run(), name="quotebot-metrics")
+
+    def stop(self) -> None:
+        """
+        Stop serving and writing metrics
+        """
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def write(self) -> None:
+        """
+        Write metrics to the file, replacing it in one step so scrapers never read a partial file
+        """
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as file:
+            file.write(self.metrics.to_prometheus())
+        os.replace(tmp, self.path)
+
+    async def _run(self) -> None:
+        """
+        Write metrics to the file every interval
+        """
+        while True:
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Failed to write metrics: {e}", file=sys.stderr)
+            await asyncio.sleep(self.interval)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Answer a single HTTP request, only GET /metrics is supported
+
+        :param reader: Request stream
+        :param writer: Response stream
+        """
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            # drain headers
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            parts = request.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.metrics.to_prometheus().encode()
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
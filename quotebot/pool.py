@@ -0,0 +1,227 @@
+"""
+File: pool.py
+Description: Long-lived SQLite connection manager with a single writer and a pool of readers
+
+@author Derek Garcia
+"""
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_READERS = 4
+DEFAULT_STATEMENT_CACHE = 128
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+
+# Applied to every connection when opened
+PRAGMAS = (
+    "PRAGMA auto_vacuum = INCREMENTAL;",  # only takes effect on a new database or with a full vacuum
+    "PRAGMA journal_mode = WAL;",  # readers do not block the writer and vice versa
+    "PRAGMA synchronous = NORMAL;",  # safe with WAL, avoids an fsync per commit
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA cache_size = -8000;",  # ~8MB page cache per connection
+    "PRAGMA mmap_size = 67108864;",  # 64MB memory mapped reads
+    f"PRAGMA busy_timeout = {DEFAULT_BUSY_TIMEOUT_MS};",
+)
+
+
+class ConnectionPool:
+    def __init__(self, db_location: str, readers: int = DEFAULT_READERS,
+                 statement_cache: int = DEFAULT_STATEMENT_CACHE):
+        """
+        Create a new connection pool. Connections are opened lazily and kept open until the pool is closed
+
+        :param db_location: Location of the sqlite database
+        :param readers: Max number of reader connections to keep open
+        :param statement_cache: Number of prepared statements to cache per connection
+        """
+        self.db_location = db_location
+        self.max_readers = max(1, readers)
+        self.statement_cache = statement_cache
+
+        self._closed = False
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._writer_thread = None  # thread holding the writer lock, so a nested write fails instead of deadlocking
+        self._readers = queue.LifoQueue()  # lifo keeps the warmest connection in use
+        self._readers_lock = threading.Lock()
+        self._readers_opened = 0
+
+        # stats
+        self._stats_lock = threading.Lock()
+        self._connections_opened = 0
+        self._reads = 0
+        self._writes = 0
+        self._read_wait = 0.0
+        self._write_wait = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Open a new tuned connection to the database
+
+        :return: Database connection
+        """
+        conn = sqlite3.connect(self.db_location, check_same_thread=False, cached_statements=self.statement_cache)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        with self._stats_lock:
+            self._connections_opened += 1
+        return conn
+
+    def _get_writer(self) -> sqlite3.Connection:
+        """
+        Get the writer connection, opening it if needed. Must hold the writer lock
+
+        :return: Writer connection
+        """
+        if self._closed:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed connection pool")
+        if self._writer is None:
+            self._writer = self._connect()
+        return self._writer
+
+    def _get_reader(self) -> sqlite3.Connection:
+        """
+        Checkout a reader connection, opening a new one if the pool is not full, otherwise wait for one to be released
+
+        :return: Reader connection
+        """
+        if self._closed:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed connection pool")
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        # open new reader if room
+        with self._readers_lock:
+            if self._readers_opened < self.max_readers:
+                self._readers_opened += 1
+                try:
+                    return self._connect()
+                except sqlite3.Error:
+                    self._readers_opened -= 1
+                    raise
+        # else wait for one to be returned
+        return self._readers.get()
+
+    @contextmanager
+    def write(self) -> sqlite3.Connection:
+        """
+        Get exclusive access to the writer connection. Commits on exit and rolls back on error
+
+        :return: Writer connection
+        """
+        # a nested write would share the connection and commit the outer transaction part way through
+        if self._writer_thread == threading.get_ident():
+            raise RuntimeError("Nested write, the writer connection is already in use by this thread")
+        start = time.perf_counter()
+        with self._writer_lock:
+            self._writer_thread = threading.get_ident()
+            waited = time.perf_counter() - start
+            try:
+                conn = self._get_writer()
+                with self._stats_lock:
+                    self._writes += 1
+                    self._write_wait += waited
+                try:
+                    yield conn
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+            finally:
+                self._writer_thread = None
+
+    @contextmanager
+    def read(self) -> sqlite3.Connection:
+        """
+        Checkout a reader connection that is returned to the pool on exit
+
+        :return: Reader connection
+        """
+        start = time.perf_counter()
+        conn = self._get_reader()
+        waited = time.perf_counter() - start
+        with self._stats_lock:
+            self._reads += 1
+            self._read_wait += waited
+        try:
+            yield conn
+        finally:
+            # end any implicit transaction so the reader does not pin an old WAL snapshot
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                conn.close()
+            else:
+                self._readers.put(conn)
+
+    def backup(self, target: sqlite3.Connection, pages: int, pause: float) -> int:
+        """
+        Copy the database to another connection a few pages at a time from the writer connection. The writer lock is
+        let go between steps so writes are only held up for one step. Writes in between go through the same
+        connection, so sqlite copies them into the backup as well instead of restarting it
+
+        :param target: Connection to copy the database into
+        :param pages: Number of pages to copy per step
+        :param pause: Seconds to let other writers in between steps
+        :return: Number of steps taken
+        """
+        steps = 0
+
+        def step(status: int, remaining: int, total: int) -> None:
+            nonlocal steps
+            steps += 1
+            self._writer_thread = None
+            self._writer_lock.release()
+            try:
+                time.sleep(pause)
+            finally:
+                self._writer_lock.acquire()
+                self._writer_thread = threading.get_ident()
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool was closed during the backup")
+
+        with self._writer_lock:
+            self._writer_thread = threading.get_ident()
+            try:
+                self._get_writer().backup(target, pages=pages, progress=step)
+            finally:
+                self._writer_thread = None
+        return steps
+
+    def stats(self) -> dict:
+        """
+        Get usage stats for the pool
+
+        :return: Dictionary of pool stats
+        """
+        with self._stats_lock:
+            return {
+                "connections_opened": self._connections_opened,
+                "readers_open": self._readers_opened,
+                "readers_idle": self._readers.qsize(),
+                "reads": self._reads,
+                "writes": self._writes,
+                "avg_read_wait_ms": round(1000 * self._read_wait / self._reads, 3) if self._reads else 0.0,
+                "avg_write_wait_ms": round(1000 * self._write_wait / self._writes, 3) if self._writes else 0.0,
+            }
+
+    def close(self) -> None:
+        """
+        Close all open connections
+        """
+        with self._writer_lock:
+            self._closed = True
+            if self._writer is not None:
+                self._writer.commit()
+                self._writer.close()
+                self._writer = None
+        with self._readers_lock:
+            while True:
+                try:
+                    self._readers.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._readers_opened = 0
@@ -0,0 +1,82 @@
+"""
+File: presence.py
+Description: Coalesces quote count presence updates so the gateway is updated at most once per interval
+
+@author Derek Garcia
+"""
+import asyncio
+
+from guilds import GuildRouter
+from logger import Status, log
+
+DEFAULT_PRESENCE_INTERVAL = 60.0  # seconds
+
+
+class PresenceScheduler:
+    def __init__(self, bot: "commands.Bot", database: GuildRouter, interval: float = DEFAULT_PRESENCE_INTERVAL):
+        """
+        Create a new presence scheduler
+
+        :param bot: Bot to update the presence of
+        :param database: Guild databases to get the quote total across
+        :param interval: Min seconds between presence updates
+        """
+        self.bot = bot
+        self.database = database
+        self.interval = interval
+        self.last_total = None
+        self._dirty = asyncio.Event()
+        self._task = None
+
+    def mark_dirty(self) -> None:
+        """
+        Flag that the quote total may have changed
+        """
+        self._dirty.set()
+
+    def start(self) -> None:
+        """
+        Start pushing updates in the background if not already running
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="quotebot-presence")
+
+    def stop(self) -> None:
+        """
+        Stop pushing updates
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def push(self, force: bool = False, **kwargs) -> bool:
+        """
+        Update the presence with the latest quote total if it changed
+
+        :param force: Update even if the total is unchanged
+        :param kwargs: Additional args to pass to change_presence
+        :return: True if the presence was updated
+        """
+        # imported here so main can read the default interval without waiting on discord.py
+        import discord  # pylint: disable=import-outside-toplevel
+
+        total = await self.database.get_quote_total()
+        if not force and total == self.last_total:
+            return False
+        await self.bot.change_presence(activity=discord.Game(f"{total} quotes and counting!"), **kwargs)
+        self.last_total = total
+        return True
+
+    async def _run(self) -> None:
+        """
+        Wait for the total to change then push, sleeping between pushes so bursts are coalesced. A failed push is
+        logged and retried on the next change so updates never stop
+        """
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            try:
+                await self.push()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                log("admin", "presence", Status.ERROR, f"Failed to update presence: {e}")
+            await asyncio.sleep(self.interval)
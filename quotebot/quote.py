@@ -4,76 +4,191 @@ Description: Util quote object to hold quote information
 
 @author Derek Garcia
 """
+import functools
+import hashlib
 import re
+import sqlite3
 import string
+from dataclasses import dataclass, field
 
 # Matches: (pre-context) "quote" (post-context) - quotee
 QUOTE_REGEX = re.compile('(?:\\((.*)\\)|).*?\\"(.*)\"(?:.*?\\((.*)\\)|).*?-(.*)')
+QUOTEE_FORMAT_CACHE_SIZE = 4096  # distinct quotee names to keep display names for
+NORMALIZE_REGEX = re.compile(r"[\W_]+")  # punctuation, symbols and whitespace runs
 
 
+@dataclass(slots=True, frozen=True)
 class Quote:
-    def __init__(self, quote: str, quotee: str, pre_context: str = None, post_context: str = None):
+    """
+    Immutable quote, no per instance __dict__. Display strings are built on first use then cached
+    """
+    quote: str
+    quotee: str
+    pre_context: str | None = None
+    post_context: str | None = None
+    _formatted_quote: str | None = field(default=None, init=False, repr=False, compare=False)
+    _formatted: str | None = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # frozen, so cleaned up values are set on the object directly. Stored values are already clean, keep those
+        # strings so repeated quotee names stay shared
+        quote = self.quote.strip()
+        quotee = self.quotee.strip().lower()
+        if quote != self.quote:
+            object.__setattr__(self, "quote", quote)
+        if quotee != self.quotee:
+            object.__setattr__(self, "quotee", quotee)
+
+    @classmethod
+    def from_row(cls, cursor: sqlite3.Cursor | None, row: tuple) -> "Quote":
         """
-        Create a new Quote
+        Row factory for stored quotes
 
-        :param quote: Quote message
-        :param quotee: Quotee
-        :param pre_context: Optional pre context to quote
-        :param post_context: Option post context to quote
+        :param cursor: Cursor the row came from, unused
+        :param row: (quote, quotee, pre_context, post_context) row
+        :return: Quote
         """
-        self.pre_context = pre_context
-        self.quote = quote.strip()
-        self.post_context = post_context
-        self.quotee = quotee.strip().lower()
+        return cls(*row)
 
-    def format_quote(self) -> str:
+    def content_hash(self) -> int:
+        """
+        :return: Hash of the normalized quote and context text, same for reposts that only differ in case, spacing or
+        punctuation
+        """
+        return content_hash(self.quote, self.pre_context, self.post_context)
+
+    def _format_quote(self) -> str:
         """
-        Format quote portion
         :return: (pre-context) "quote" (post-context)
         """
         pre_context = f"({self.pre_context}) " if self.pre_context is not None else ""
         post_context = f" ({self.post_context})" if self.post_context is not None else ""
         return f'{pre_context}"{self.quote}"{post_context}'
 
+    def format_quote(self) -> str:
+        """
+        Format quote portion, built on first use then cached
+        :return: (pre-context) "quote" (post-context)
+        """
+        if self._formatted_quote is None:
+            object.__setattr__(self, "_formatted_quote", self._format_quote())
+        return self._formatted_quote
+
     def __str__(self):
         """
-        Pre and post only if present
+        Pre and post only if present, built on first use then cached
         :return: (pre-context) "quote" (post-context) - quotee
         """
-
-        return f'{self.format_quote()} - {format_quotee(self.quotee)}'
+        if self._formatted is None:
+            # don't cache the quote portion too, most quotes are only ever shown one way
+            formatted_quote = self._formatted_quote if self._formatted_quote is not None else self._format_quote()
+            object.__setattr__(self, "_formatted", f'{formatted_quote} - {format_quotee(self.quotee)}')
+        return self._formatted
 
 
+@functools.lru_cache(maxsize=QUOTEE_FORMAT_CACHE_SIZE)
 def format_quotee(quotee: str) -> str:
     """
-    Converts the quotee to a display format
+    Converts the quotee to a display format. The same few names are shown over and over so results are cached
 
     :return: Formatted quotee name
     """
     return string.capwords(quotee)
 
 
-def parse_quote(message: str) -> Quote:
+def normalize_quote(text: str) -> str:
     """
-    Use regex to parse a message
+    Reduce quote text to lowercase words separated by single spaces. Text without any words, e.g. only emoji or
+    punctuation, keeps its symbols so it isn't normalized to nothing
+
+    :param text: Quote text
+    :return: Normalized quote text
+    """
+    normalized = NORMALIZE_REGEX.sub(" ", text.casefold()).strip()
+    return normalized if normalized else " ".join(text.casefold().split())
+
+
+def content_hash(quote: str, pre_context: str = None, post_context: str = None) -> int:
+    """
+    Hash quote text for duplicate detection
+
+    :param quote: Quote text
+    :param pre_context: Optional context before the quote
+    :param post_context: Optional context after the quote
+    :return: Signed 64 bit hash of the normalized text and context, fits a sqlite integer
+    """
+    # separator can't be typed in discord, so text moved between the context and quote hashes differently
+    text = "\x1f".join(normalize_quote(part or "") for part in (pre_context, quote, post_context))
+    digest = hashlib.blake2b(text.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def match_quote(message: str) -> Quote | None:
+    """
+    Parse a message in a single linear pass. Gives the same result as QUOTE_REGEX without its backtracking
 
     :param message: Message to parse
-    :return: Quote object extracted from message
+    :return: Quote object extracted from message or None if not a quote
     """
-    match = QUOTE_REGEX.match(message.strip())
+    # regex can't match across lines, only the first line is ever used
+    text = message.strip().partition('\n')[0]
+
+    # cheap rejection, needs two quotation marks followed by a dash
+    last_dash = text.rfind('-')
+    if last_dash == -1:
+        return None
+    close_quote = text.rfind('"', 0, last_dash)
+    second_last_quote = text.rfind('"', 0, close_quote) if close_quote > 0 else -1
+    if second_last_quote == -1:
+        return None
+
+    # pre-context is the widest (...) at the start that leaves a quoted string after it
+    pre_context = None
+    start = 0
+    if text.startswith('('):
+        close_paren = text.rfind(')', 1, second_last_quote)
+        if close_paren != -1:
+            pre_context = text[1:close_paren]
+            start = close_paren + 1
+
+    # quote is from the first quotation mark to the last before the dash
+    open_quote = text.find('"', start)
+    quote = text[open_quote + 1:close_quote]
+
+    # post-context is the first ( to the last ) before the dash, quotee is after the next dash
+    post_context = None
+    after_quote = close_quote + 1
+    dash = text.find('-', after_quote)
+    close_paren = text.rfind(')', after_quote, last_dash)
+    if close_paren != -1:
+        open_paren = text.find('(', after_quote, close_paren)
+        if open_paren != -1:
+            post_context = text[open_paren + 1:close_paren]
+            dash = text.find('-', close_paren + 1)
+
     return Quote(
-        pre_context=match.group(1),
-        quote=match.group(2),
-        post_context=match.group(3),
-        quotee=match.group(4)
+        pre_context=pre_context,
+        quote=quote,
+        post_context=post_context,
+        quotee=text[dash + 1:]
     )
 
 
+def parse_quote(message: str) -> Quote | None:
+    """
+    Parse a message
+
+    :param message: Message to parse
+    :return: Quote object extracted from message or None if not a quote
+    """
+    return match_quote(message)
+
+
 def is_quote(message: str) -> bool:
     """
-    Use regex to attempt to match
+    Attempt to parse a message as a quote
 
     :param message: Message to parse
     :return: True if match, false otherwise
     """
-    return bool(re.search(QUOTE_REGEX, message.strip()))
+    return match_quote(message) is not None
@@ -0,0 +1,150 @@
+"""
+File: quote_index.py
+Description: In-memory index of quote ids per guild used for constant time random selection and counts
+
+@author Derek Garcia
+"""
+import random
+import threading
+from array import array
+from typing import Iterable
+
+
+class QuoteIndex:
+    def __init__(self):
+        """
+        Create a new empty quote id index
+        """
+        self._lock = threading.Lock()
+        self._all: dict[int, array] = {}  # guild -> every quote id
+        self._by_quotee: dict[tuple[int, str], array] = {}  # (guild, quotee) -> quote ids
+        self._quotee_total: dict[int, int] = {}  # guild -> rows in quotee table, may include quotees with no quotes
+
+    def load(self, rows: Iterable[tuple[int, int, str]], quotee_totals: Iterable[tuple[int, int]]) -> None:
+        """
+        Replace the index contents
+
+        :param rows: Iterable of (quote id, guild id, quotee) in ascending id order
+        :param quotee_totals: Iterable of (guild id, number of quotees)
+        """
+        all_ids: dict[int, array] = {}
+        by_quotee: dict[tuple[int, str], array] = {}
+        for qid, guild_id, quotee in rows:
+            all_ids.setdefault(guild_id, array('q')).append(qid)
+            by_quotee.setdefault((guild_id, quotee), array('q')).append(qid)
+        with self._lock:
+            self._all = all_ids
+            self._by_quotee = by_quotee
+            self._quotee_total = dict(quotee_totals)
+
+    def add(self, qid: int, quotee: str, new_quotee: bool = False, guild_id: int = 0) -> None:
+        """
+        Add a quote id to the index
+
+        :param qid: ID of the quote
+        :param quotee: Quotee of the quote
+        :param new_quotee: True if the quotee was added to the database with this quote
+        :param guild_id: Guild of the quote
+        """
+        with self._lock:
+            if new_quotee:
+                self._quotee_total[guild_id] = self._quotee_total.get(guild_id, 0) + 1
+            self._all.setdefault(guild_id, array('q')).append(qid)
+            self._by_quotee.setdefault((guild_id, quotee), array('q')).append(qid)
+
+    def discard(self, qid: int, quotee: str = None, guild_id: int = 0) -> None:
+        """
+        Remove a quote id from the index if present. Only used when a quote was deleted outside the bot
+
+        :param qid: ID of the quote
+        :param quotee: Optional quotee of the quote, searches every quotee in the guild if not given
+        :param guild_id: Guild of the quote
+        """
+        with self._lock:
+            all_ids = self._all.get(guild_id)
+            if all_ids is not None and qid in all_ids:
+                all_ids.remove(qid)
+            keys = [(guild_id, quotee)] if quotee is not None else [k for k in self._by_quotee if k[0] == guild_id]
+            for key in keys:
+                ids = self._by_quotee.get(key)
+                if ids is None or qid not in ids:
+                    continue
+                ids.remove(qid)
+                if len(ids) == 0:
+                    del self._by_quotee[key]
+
+    def pick(self, quotee: str = None, guild_id: int = 0) -> int | None:
+        """
+        Pick a random quote id, uniform over all quotes of a guild or all quotes of a quotee
+
+        :param quotee: Optional quotee to pick from
+        :param guild_id: Guild to pick from
+        :return: Quote id or None if there are no quotes
+        """
+        with self._lock:
+            ids = self._all.get(guild_id) if quotee is None else self._by_quotee.get((guild_id, quotee))
+            if not ids:
+                return None
+            return ids[random.randrange(len(ids))]
+
+    def ids(self, quotee: str = None, guild_id: int = 0, start: int = 0, stop: int = None) -> array:
+        """
+        Get a copy of a range of quote ids of a guild or quotee in ascending order
+
+        :param quotee: Optional quotee to get quote ids of
+        :param guild_id: Guild to get quote ids of
+        :param start: Position of the first id to get
+        :param stop: Position to stop at, defaults to the end
+        :return: Array of quote ids
+        """
+        with self._lock:
+            ids = self._all.get(guild_id) if quotee is None else self._by_quotee.get((guild_id, quotee))
+            return array('q') if ids is None else ids[start:stop]
+
+    def count(self, quotee: str = None, guild_id: int = 0) -> int:
+        """
+        Get the number of quotes of a guild in the index
+
+        :param quotee: Optional quotee to count quotes for
+        :param guild_id: Guild to count quotes for
+        :return: Number of quotes
+        """
+        with self._lock:
+            ids = self._all.get(guild_id) if quotee is None else self._by_quotee.get((guild_id, quotee))
+            return 0 if ids is None else len(ids)
+
+    def count_all(self) -> int:
+        """
+        Get the number of quotes across every guild
+
+        :return: Number of quotes
+        """
+        with self._lock:
+            return sum(len(ids) for ids in self._all.values())
+
+    def count_quotees(self, guild_id: int = 0) -> int:
+        """
+        Get the number of quotees of a guild
+
+        :param guild_id: Guild to count quotees for
+        :return: Number of quotees
+        """
+        with self._lock:
+            return self._quotee_total.get(guild_id, 0)
+
+    def page_start(self, quotee: str, page: int, page_size: int, guild_id: int = 0) -> int | None:
+        """
+        Get the first quote id of a page of a quotee's quotes, ids are kept in ascending order
+
+        :param quotee: Quotee to page through
+        :param page: Page number, starting at 1
+        :param page_size: Number of quotes per page
+        :param guild_id: Guild of the quotee
+        :return: Quote id to start the page at or None if the page is out of range
+        """
+        with self._lock:
+            ids = self._by_quotee.get((guild_id, quotee))
+            offset = (page - 1) * page_size
+            if ids is None or page < 1 or offset >= len(ids):
+                return None
+            return ids[offset]
@@ -4,31 +4,125 @@ Description: Collection of Commands for the Discord Bot
 
 @author Derek Garcia
 """
+import asyncio
+import math
 import re
+import time
+from concurrent.futures import Future
 
 import discord
 from discord.ext import commands
 
-from database import Database
+from async_database import AsyncDatabase
+from backup import DEFAULT_BACKUP_INTERVAL, DEFAULT_BACKUP_KEEP, Backups
+from guilds import GuildDatabase, GuildRouter
+from ingest import DEFAULT_BATCH_SIZE, IngestQueue
 from logger import Status, log
-from quote import format_quotee, is_quote, parse_quote
+from metrics import DEFAULT_METRICS_INTERVAL, MetricsExporter
+from presence import DEFAULT_PRESENCE_INTERVAL, PresenceScheduler
+from quote import format_quotee, match_quote
+from quotee_index import Suggestion
+from retention import DEFAULT_RETENTION_INTERVAL, LogRetention
+from startup import StartupTimer
+from storage import DEFAULT_PAGE_SIZE, DUPLICATE_QUOTE, Storage
+from throttle import DEFAULT_MAX_BUCKETS, Limit, Throttle
 
 VERSION = "2.5.2"
 SOURCE_CODE = "github.com/dlg1206/discord-quote-bot"
-COMMANDS_REGEX = re.compile("!qadd|!q|!qall|!qrand|!qsearch|!qstat|!qhelp|!qkill")  # list of commands
+DISCORD_MESSAGE_LIMIT = 2000
+PAGE_REGEX = re.compile(r"^(.+?)\s+page\s+(\d+)$", flags=re.IGNORECASE)  # Matches: <name> page <number>
+COMMANDS_REGEX = re.compile("!qadd|!q|!qall|!qrand|!qsearch|!qfind|!qstat|!qhelp|!qmetrics|!qkill")  # list of commands
+
+
+def pack_messages(lines: list[str], limit: int = DISCORD_MESSAGE_LIMIT) -> list[str]:
+    """
+    Pack lines into as few messages as possible without going over the discord message limit
+
+    :param lines: Lines to pack
+    :param limit: Max characters per message
+    :return: List of messages
+    """
+    messages = []
+    current = ""
+    for line in lines:
+        # a single line can't go over the limit either
+        if len(line) > limit:
+            line = line[:limit - 3] + "..."
+        if current and len(current) + 1 + len(line) > limit:
+            messages.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        messages.append(current)
+    return messages
+
+
+def bold_spans(suggestion: Suggestion) -> str:
+    """
+    Format a suggested quotee with the matched spans in discord bold
+
+    :param suggestion: Suggested quotee
+    :return: Formatted quotee name
+    """
+    formatted = format_quotee(suggestion.name)
+    # formatting collapsed whitespace so spans no longer line up, skip bolding
+    if len(formatted) != len(suggestion.name):
+        return formatted
+    # insert from the end so earlier spans stay valid
+    for start, end in reversed(suggestion.spans):
+        formatted = f"{formatted[:start]}**{formatted[start:end]}**{formatted[end:]}"
+    return formatted
 
 
 class QuoteBot(commands.Bot):
 
-    def __init__(self, database: Database, blacklist_channels: str = None):
+    def __init__(self, database: Storage, blacklist_channels: str = None,
+                 presence_interval: float = DEFAULT_PRESENCE_INTERVAL, metrics_port: int = None,
+                 metrics_file: str = None, metrics_interval: float = DEFAULT_METRICS_INTERVAL,
+                 log_retention_days: int = None, log_retention_interval: float = DEFAULT_RETENTION_INTERVAL,
+                 guild_partitions: bool = False, guild_db_path: str = None,
+                 throttle_limits: dict[str, Limit | None] = None, throttle_max_buckets: int = DEFAULT_MAX_BUCKETS,
+                 startup: StartupTimer = None, warm_up: Future = None,
+                 ingest_batch_size: int = DEFAULT_BATCH_SIZE, backup_path: str = None,
+                 backup_keep: int = DEFAULT_BACKUP_KEEP, backup_interval: float = DEFAULT_BACKUP_INTERVAL, **options):
         """
         Create new Quote Bot
 
         :param database: Quote database to use
         :param blacklist_channels: optional string list of black listed channels to ignore for 'quote-like' add
+        :param presence_interval: Min seconds between quote count presence updates
+        :param metrics_port: optional local port to serve Prometheus metrics on
+        :param metrics_file: optional file to periodically write Prometheus metrics to
+        :param metrics_interval: Seconds between metrics file writes
+        :param log_retention_days: optional days of raw log rows to keep before rolling them up into daily counts
+        :param log_retention_interval: Seconds between log retention runs
+        :param guild_partitions: Give each guild its own quotes instead of sharing one global set
+        :param guild_db_path: optional path template with a {guild_id} field to store each guild in its own file
+        :param throttle_limits: optional limit of each throttle scope, None disables a scope. Uses the default limits
+        if not given
+        :param throttle_max_buckets: Max number of throttle buckets to keep in memory
+        :param startup: optional timer started with the process to report time to ready with, else starts now
+        :param warm_up: optional future of the database warming up in the background, messages wait for it. The
+        database must already be warm if not given
+        :param ingest_batch_size: Max number of quote-like adds to write in one transaction
+        :param backup_path: optional directory to periodically write database backups to
+        :param backup_keep: Number of backups to keep per database
+        :param backup_interval: Seconds between backups
+        :param options: Additional args to pass to the discord bot, e.g. shard ids
         """
-        super().__init__(command_prefix="!", intents=discord.Intents.all())
-        self.database = database
+        super().__init__(command_prefix="!", intents=discord.Intents.all(), **options)
+        self.database = AsyncDatabase(database)  # queries run off the event loop
+        self.partitions = GuildRouter(self.database, guild_partitions, guild_db_path)
+        self.presence = PresenceScheduler(self, self.partitions, presence_interval)
+        self.metrics = self.database.metrics  # commands share the registry with the database queries
+        self.metrics_exporter = MetricsExporter(self.metrics, metrics_port, metrics_file, metrics_interval)
+        self.log_retention = LogRetention(self.partitions, log_retention_days, log_retention_interval)
+        self.backups = Backups(self.partitions, self.metrics, backup_path, backup_keep, backup_interval)
+        self.throttle = Throttle(self.metrics, throttle_limits, throttle_max_buckets)
+        self.ingest = IngestQueue(self.metrics, self.get_guild_database, self.allow_quote, self.presence.mark_dirty,
+                                  batch_size=ingest_batch_size)
+        self.startup = StartupTimer() if startup is None else startup
+        self.warm_up = warm_up
         self.version = VERSION
         self.source_code = SOURCE_CODE
         self.blacklist_channels = {} if blacklist_channels is None else set(blacklist_channels.split(","))
@@ -36,6 +130,10 @@ class QuoteBot(commands.Bot):
         # Init custom commands
         self.init_commands()
 
+        # Time every command
+        self.before_invoke(self.start_command_timer)
+        self.after_invoke(self.record_command_time)
+
     def init_commands(self) -> None:
         """
         Register custom commands to the bot
@@ -49,33 +147,38 @@ class QuoteBot(commands.Bot):
             :param ctx: command prefix
             :param prompt: Entire quote/author
             """
+            database = await self.get_guild_database(ctx.guild)
             # Check if prompt was given
             if prompt is None:
                 await ctx.channel.send('Proper Usage: `!qadd "[quote]" -[Quotee]`')
-                log(str(ctx.message.author), "!qadd", Status.ERROR, "No args", database=self.database)
+                log(str(ctx.message.author), "!qadd", Status.ERROR, "No args", database=database)
                 return
 
             # Check if quote
-            if not is_quote(prompt):
+            quote = match_quote(prompt)
+            if quote is None:
                 await ctx.channel.send('Sorry, I didn\'t get that :(\nCommand: `!qadd "[quote]" -[Quotee]`')
                 log(str(ctx.message.author), "!qadd", Status.ERROR, f"Failed to parse: {prompt}",
-                    database=self.database)
+                    database=database)
                 return
 
             # Upload to db
-            code = self.database.add_quote(parse_quote(prompt), str(str(ctx.message.author)))
+            code = await database.add_quote(quote, str(str(ctx.message.author)))
 
             # Confirmation
             if code > 0:
                 await ctx.channel.send("Quote added! :)")
-                log(str(ctx.message.author), "!qadd", Status.SUCCESS, code, database=self.database)
+                log(str(ctx.message.author), "!qadd", Status.SUCCESS, code, database=database)
+            elif code == DUPLICATE_QUOTE:
+                await ctx.channel.send(f"I already have that quote from {format_quotee(quote.quotee)}!")
+                log(str(ctx.message.author), "!qadd", Status.WARN, f"Duplicate: {prompt}", database=database)
+                return
             else:
                 # error
                 log(str(ctx.message.author), "!qadd", Status.ERROR, f"Failed to upload: {prompt}",
-                    database=self.database)
+                    database=database)
 
-            await self.change_presence(
-                activity=discord.Game(f"{self.database.get_quote_total()} quotes and counting!"))
+            self.presence.mark_dirty()
 
         @self.command()
         async def q(ctx, *, quotee=None) -> None:
@@ -85,22 +188,23 @@ class QuoteBot(commands.Bot):
             :param ctx: command
             :param quotee: name to search quotes for
             """
+            database = await self.get_guild_database(ctx.guild)
 
             # check if quotee was given
             if quotee is None:
                 await ctx.channel.send("Proper Usage: `!q [Name]`")
-                log(str(ctx.message.author), "!q", Status.ERROR, "No args", database=self.database)
+                log(str(ctx.message.author), "!q", Status.ERROR, "No args", database=database)
                 return
 
             # Print random quote if one exits
-            rand_quote = self.database.get_rand_quote(quotee)
+            rand_quote = await database.get_rand_quote(quotee)
             if rand_quote is not None:
                 await ctx.channel.send(rand_quote)
-                log(str(ctx.message.author), "!q", Status.SUCCESS, quotee, database=self.database)
+                log(str(ctx.message.author), "!q", Status.SUCCESS, quotee, database=database)
                 return
 
             # If name not in QUOTES, print not found
-            log(str(ctx.message.author), "!q", Status.WARN, f"No quotes found for {quotee}", database=self.database)
+            log(str(ctx.message.author), "!q", Status.WARN, f"No quotes found for {quotee}", database=database)
             await self.list_similar(ctx, quotee)
 
         @self.command()
@@ -111,29 +215,47 @@ class QuoteBot(commands.Bot):
             :param ctx: command
             :param quotee: name to search quotes for
             """
+            database = await self.get_guild_database(ctx.guild)
 
             # Invalid usage
             if quotee is None:
-                await ctx.channel.send("Proper Usage: `!qall [Name]`")
-                log(str(ctx.message.author), "!qall", Status.ERROR, "No args", database=self.database)
+                await ctx.channel.send("Proper Usage: `!qall [Name]` or `!qall [Name] page [Number]`")
+                log(str(ctx.message.author), "!qall", Status.ERROR, "No args", database=database)
                 return
 
-            # Search for quotes
-            quotes = self.database.get_all_quotes(quotee)
+            # Check for page number
+            page = 1
+            match = PAGE_REGEX.match(quotee)
+            if match is not None:
+                quotee, page = match.group(1), int(match.group(2))
 
             # If no quotes, check for similar
-            if len(quotes) == 0:
+            total = await database.get_quote_total(quotee)
+            if total == 0:
                 log(str(ctx.message.author), "!qall", Status.WARN, f"No quotes found for {quotee}",
-                    database=self.database)
+                    database=database)
                 await self.list_similar(ctx, quotee)
                 return
 
-            # Format and display all quotes
-            only_quotes = [f'> - {q.format_quote()}' for q in quotes]
-            log(str(ctx.message.author), "!qall", Status.SUCCESS, f"Found {len(quotes)} for {quotee}",
-                database=self.database)
-            await ctx.channel.send(f"{'\n'.join(only_quotes)}\n"
-                                   f"**{format_quotee(quotee)} has {len(quotes)} quote{'' if len(quotes) == 1 else 's'}!**")
+            # Check page exists
+            pages = math.ceil(total / DEFAULT_PAGE_SIZE)
+            if not 1 <= page <= pages:
+                await ctx.channel.send(f"{format_quotee(quotee)} only has {pages} page{'' if pages == 1 else 's'}")
+                log(str(ctx.message.author), "!qall", Status.ERROR, f"Page {page} out of range for {quotee}",
+                    database=database)
+                return
+
+            # Format and display page of quotes
+            quotes = await database.get_quote_page(quotee, page)
+            lines = [f'> - {q.format_quote()}' for q in quotes]
+            lines.append(f"**{format_quotee(quotee)} has {total} quote{'' if total == 1 else 's'}!**")
+            if pages > 1:
+                lines.append(f"Page {page} of {pages}" +
+                             (f", next: `!qall {quotee} page {page + 1}`" if page < pages else ""))
+            log(str(ctx.message.author), "!qall", Status.SUCCESS, f"Found {total} for {quotee}, page {page}",
+                database=database)
+            for message in pack_messages(lines):
+                await ctx.channel.send(message)
 
         @self.command()
         async def qrand(ctx) -> None:
@@ -142,9 +264,10 @@ class QuoteBot(commands.Bot):
 
             :param ctx: Command
             """
-            rand_quote = self.database.get_rand_quote()
+            database = await self.get_guild_database(ctx.guild)
+            rand_quote = await database.get_rand_quote()
             await ctx.channel.send(rand_quote)
-            log(str(ctx.message.author), "!qrand", Status.SUCCESS, database=self.database)
+            log(str(ctx.message.author), "!qrand", Status.SUCCESS, database=database)
 
         @self.command()
         async def qsearch(ctx, *, keywords=None) -> None:
@@ -154,17 +277,48 @@ class QuoteBot(commands.Bot):
             :param ctx: command
             :param keywords: optional keywords to look for
             """
+            database = await self.get_guild_database(ctx.guild)
             # Get all quotees if no keywords
             if keywords is None:
-                all_quotees = [f"> {format_quotee(q)}" for q in self.database.get_all_quotees()]
+                all_quotees = [f"> {format_quotee(q)}" for q in await database.get_all_quotees()]
                 await ctx.channel.send(f"**I have quotes from all these people!**\n{'\n'.join(all_quotees)}")
                 log(str(ctx.message.author), "!qsearch", Status.SUCCESS,
-                    f"Found {len(all_quotees)} quotees", database=self.database)
+                    f"Found {len(all_quotees)} quotees", database=database)
             # Search for quotees that match the keywords
             else:
                 await self.list_similar(ctx, keywords, "Here's what I could find")
                 log(str(ctx.message.author), "!qsearch [keywords]", Status.SUCCESS,
-                    f"keywords={keywords}", database=self.database)
+                    f"keywords={keywords}", database=database)
+
+        @self.command()
+        async def qfind(ctx, *, keywords=None) -> None:
+            """
+            Full text search the quotes for keywords
+
+            :param ctx: command
+            :param keywords: words to search the quotes for
+            """
+            database = await self.get_guild_database(ctx.guild)
+            # Invalid usage
+            if keywords is None:
+                await ctx.channel.send("Proper Usage: `!qfind [words]`")
+                log(str(ctx.message.author), "!qfind", Status.ERROR, "No args", database=database)
+                return
+
+            # Search quote text
+            quotes = await database.search_quotes(keywords)
+            if len(quotes) == 0:
+                await ctx.channel.send(f"I couldn't find any quotes with \"{keywords}\" :(")
+                log(str(ctx.message.author), "!qfind", Status.WARN, f"No quotes found for {keywords}",
+                    database=database)
+                return
+
+            # Display best matches
+            lines = [f"**Here's what I could find for \"{keywords}\"**", *(f"> - {q}" for q in quotes)]
+            log(str(ctx.message.author), "!qfind", Status.SUCCESS, f"Found {len(quotes)} for {keywords}",
+                database=database)
+            for message in pack_messages(lines):
+                await ctx.channel.send(message)
 
         @self.command()
         async def qstat(ctx, *, quotee=None) -> None:
@@ -174,23 +328,25 @@ class QuoteBot(commands.Bot):
             :param ctx: Command
             :param quotee: optional quotee field
             """
+            database = await self.get_guild_database(ctx.guild)
             # Get total number of quotes and quotees if no quotee
             if quotee is None:
-                await ctx.channel.send(
-                    f"I have {self.database.get_quote_total()} quotes from {self.database.get_quotee_total()} people!")
-                log(str(ctx.message.author), "!qstat", Status.SUCCESS, database=self.database)
+                quote_total = await database.get_quote_total()
+                quotee_total = await database.get_quotee_total()
+                await ctx.channel.send(f"I have {quote_total} quotes from {quotee_total} people!")
+                log(str(ctx.message.author), "!qstat", Status.SUCCESS, database=database)
                 return
 
             # Check for quotes from given quotee
-            num_quotes = self.database.get_quote_total(quotee)
+            num_quotes = await database.get_quote_total(quotee)
             if num_quotes != 0:
                 await ctx.channel.send(f"{format_quotee(quotee)} has {num_quotes} quotes!")
-                log(str(ctx.message.author), "!qstat [quotee]", Status.SUCCESS, quotee, database=self.database)
+                log(str(ctx.message.author), "!qstat [quotee]", Status.SUCCESS, quotee, database=database)
 
             # If none found, list similar
             else:
                 # Print not found
-                log(str(ctx.message.author), "!qstat", Status.WARN, f"No quotes from {quotee}", database=self.database)
+                log(str(ctx.message.author), "!qstat", Status.WARN, f"No quotes from {quotee}", database=database)
                 await self.list_similar(ctx, quotee)
 
         @self.command()
@@ -200,14 +356,17 @@ class QuoteBot(commands.Bot):
 
             :param ctx: Command
             """
+            database = await self.get_guild_database(ctx.guild)
             await ctx.channel.send(f"__**QuoteBoi Version: {self.version}**__\n" +
                                    f"Source Code: {self.source_code}\n" +
                                    "> - Add quote: `!qadd \"quote\" -Quotee`\n" +
                                    "> - Get Quote: `!q Name`\n" +
                                    "> - Get All quotes: `!qall Name`\n" +
+                                   "> - More quotes: `!qall Name page Number`\n" +
                                    "> - Random Quote: `!qrand`\n" +
                                    "> - All People list: `!qsearch`\n" +
                                    "> - Keyword Search: `!qsearch keyword`\n" +
+                                   "> - Quote Text Search: `!qfind words`\n" +
                                    "> - Total Quote Stats: `!qstat`\n" +
                                    "> - Person Quote Stats: `!qstat Name`\n" +
                                    "> - Help: `!qhelp`")
@@ -216,7 +375,33 @@ class QuoteBot(commands.Bot):
                                    "> `(pre-context) \"quote\" (post-context) -quotee`\n" +
                                    "> There's no guarantee, but it's good at detecting them. `!qadd` is the only way\n" +
                                    "> to add quotes for sure")
-            log(str(ctx.message.author), "!qhelp", Status.SUCCESS, database=self.database)
+            log(str(ctx.message.author), "!qhelp", Status.SUCCESS, database=database)
+
+        @self.command()
+        @commands.is_owner()
+        async def qmetrics(ctx) -> None:
+            """
+            Latency, counts and errors of commands and database queries
+
+            :param ctx: command
+            """
+            database = await self.get_guild_database(ctx.guild)
+            lines = []
+            for kind, title in (("command", "Commands"), ("query", "Database Queries")):
+                lines.append(f"**{title}**")
+                for s in self.metrics.summary(kind):
+                    lines.append(f"> - `{s['name']}`: {s['count']} calls, {s['errors']} errors, "
+                                 f"avg {s['avg'] * 1e3:.2f}ms, p50 {s['p50'] * 1e3:.2f}ms, p99 {s['p99'] * 1e3:.2f}ms")
+            for name, stats in self.database.get_stats().items():
+                lines.append(f"**{name.capitalize()}:** {stats}")
+            lines.append(f"**Throttle:** {self.throttle.stats()}")
+            lines.append(f"**Ingest:** {self.ingest.stats()}")
+            if self.backups.directory is not None:
+                lines.append(f"**Backups:** {self.backups.stats()}")
+            lines.append(f"**Startup:** {self.startup.summary()}")
+            for message in pack_messages(lines):
+                await ctx.channel.send(message)
+            log(str(ctx.message.author), "!qmetrics", Status.SUCCESS, database=database)
 
         @self.command()
         @commands.is_owner()
@@ -226,60 +411,141 @@ class QuoteBot(commands.Bot):
 
             :param ctx: command
             """
-            quote = self.database.get_rand_quote()
+            database = await self.get_guild_database(ctx.guild)
+            quote = await database.get_rand_quote()
             await ctx.channel.send(f'Goodbye, and in the words of {format_quotee(quote.quotee)}: {quote}')
-            log(str(ctx.message.author), "!qkill", Status.SUCCESS, database=self.database)
+            log(str(ctx.message.author), "!qkill", Status.SUCCESS, database=database)
+            # exit skips shutdown, save queued quotes and logs now
+            await self.ingest.flush()
+            await self.partitions.flush_logs()
             exit(0)
 
+    async def setup_hook(self) -> None:
+        """
+        Called once logged in, before connecting to the gateway
+        """
+        self.startup.lap("login")
+        self.ingest.start()
+
+    async def close(self) -> None:
+        """
+        Write queued quote-like adds before disconnecting
+        """
+        await self.ingest.close()
+        await super().close()
+
+    async def wait_warm_up(self) -> None:
+        """
+        Wait for the database to finish warming up if it still is, raises if the warm up failed
+        """
+        if self.warm_up is not None:
+            await asyncio.wrap_future(self.warm_up)
+            self.warm_up = None  # only wait once
+
+    async def start_command_timer(self, ctx: commands.Context) -> None:
+        """
+        Mark when a command started
+
+        :param ctx: command
+        """
+        ctx.metrics_start = time.perf_counter()
+
+    async def record_command_time(self, ctx: commands.Context) -> None:
+        """
+        Record the latency of a finished command, called even if the command failed
+
+        :param ctx: command
+        """
+        start = getattr(ctx, "metrics_start", None)
+        if start is not None:
+            self.metrics.observe("command", ctx.command.qualified_name, time.perf_counter() - start,
+                                 ctx.command_failed)
+
+    async def get_guild_database(self, guild: discord.Guild | None) -> GuildDatabase:
+        """
+        Get the quotes of the guild a message was sent in
+
+        :param guild: Guild of the message, None for direct messages
+        :return: View of the guild's quotes
+        """
+        return await self.partitions.get(None if guild is None else guild.id)
+
     async def list_similar(self, ctx: discord.channel, quotee: str, prompt: str = "Did you mean anyone here?") -> None:
         """
-        List quotees that are a partial match to the given quotee
+        List quotees that are similar to the given quotee, tolerating partial names and typos
 
         :param ctx: command
         :param quotee: Quotee to attempt to match
         :param prompt: Prompt message to pair list with
         """
+        database = await self.get_guild_database(ctx.guild)
         # Print not found
         await ctx.channel.send("I don't have any quotes from " + f"{format_quotee(quotee)}" + " :(")
 
         # print similar if any, bold matches
-        similar = []
-        pattern = re.compile(quotee, flags=re.IGNORECASE)
-        for q in self.database.find_similar_quotee(quotee):
-            # surround the matched pattern with discord bold pattern
-            formatted_quotee = format_quotee(q)
-            match = pattern.search(formatted_quotee)
-            similar.append(f"> - {formatted_quotee.replace(match.group(0), f"**{match.group(0)}**")}")
+        similar = [f"> - {bold_spans(s)}" for s in await database.find_similar_quotee(quotee)]
 
         if len(similar) != 0:
             await ctx.channel.send(f"{prompt}\n{'\n'.join(similar)}\n")
             log(str(ctx.message.author), "list_similar", Status.SUCCESS, f"{quotee} matches {len(similar)}",
-                database=self.database)
+                database=database)
         # Else just log none found
         else:
             log(str(ctx.message.author), "list_similar", Status.WARN, f"Nothing similar to {quotee}",
-                database=self.database)
+                database=database)
+
+    async def allow(self, message, is_command: bool) -> bool:
+        """
+        Check a command or quote-like message against the throttle, replying once per burst if a command is rejected
+
+        :param message: message to check
+        :param is_command: True if the message is a command
+        :return: True if the message can be handled
+        """
+        guild_id = None if message.guild is None else message.guild.id
+        rejection = self.throttle.check(message.author.id, message.channel.id, guild_id)
+        if rejection is None:
+            return True
+
+        # stay quiet for the rest of the burst so rejections can't be spammed either
+        if rejection.notify:
+            if is_command:
+                await message.channel.send(f"Slow down! Try again in {math.ceil(rejection.retry_after)}s")
+            log(str(message.author), "throttle", Status.WARN,
+                f"{rejection.scope} limit reached, retry in {rejection.retry_after:.1f}s")
+        return False
 
     async def on_message(self, message) -> None:
         """
-        Parses message and determines if it is 'quote like' and attempts to add it
+        Runs commands and queues any other message to be checked for a 'quote like' add
 
-        :param message: message to parse
+        :param message: message to handle
         """
+        # ignore any commands or messages from self
+        ignore = bool(re.search(COMMANDS_REGEX, message.content.strip())) or message.author.bot
+
+        # throttle commands before doing any work, quote-like messages are throttled by the worker once parsed
+        is_command = not message.author.bot and COMMANDS_REGEX.match(message.content) is not None
+        if is_command and self.throttle.enabled and not await self.allow(message, is_command):
+            return
+        await self.wait_warm_up()
 
         # exe any commands first
         await self.process_commands(message)
 
-        # ignore any commands or messages from self
-        if bool(re.search(COMMANDS_REGEX, message.content.strip())) or message.author.bot:
-            return
+        # "quote-like" add, not explicit command and in a valid channel. Parsed and written in batches in the
+        # background, the worker logs the result and updates the presence
+        if not ignore and message.channel.id not in self.blacklist_channels:
+            await self.ingest.put(message)
 
-        # "quote-like" add, not explicit command and in a valid channel
-        if is_quote(message.content) and message.channel.id not in self.blacklist_channels:
-            qid = self.database.add_quote(parse_quote(message.content), str(message.author))
-            log(str(message.author), "quote-like add", Status.SUCCESS, f"{qid} | {message.content}",
-                database=self.database)
-            await self.change_presence(activity=discord.Game(f"{self.database.get_quote_total()} quotes and counting!"))
+    async def allow_quote(self, message) -> bool:
+        """
+        Check a quote-like message against the throttle, other chatter is never throttled
+
+        :param message: quote-like message to check
+        :return: True if the quote can be added
+        """
+        return not self.throttle.enabled or await self.allow(message, False)
 
     async def on_ready(self) -> None:
         """
@@ -288,8 +554,47 @@ class QuoteBot(commands.Bot):
         :return:
         """
         log("admin", "start", Status.INFO, "Starting bot. . .")
-        await self.change_presence(status=discord.Status.online,
-                                   activity=discord.Game(f"{self.database.get_quote_total()} quotes and counting!"))
+        first_ready = self.startup.ready is None
+        if first_ready:
+            self.startup.lap("gateway")
+        # counts for the presence come from the indexes
+        await self.wait_warm_up()
+        if first_ready:
+            self.startup.lap("warm up wait")
+        await self.presence.push(force=True, status=discord.Status.online)
+        self.presence.start()
+        self.log_retention.start()
+        self.backups.start()
+        try:
+            await self.metrics_exporter.start()
+        except OSError as e:
+            log("admin", "start", Status.ERROR, f"Failed to start metrics exporter: {e}")
 
         log("admin", "start", Status.INFO, '{0.user}'.format(self) + " is online")
         log("admin", "start", Status.SUCCESS, f"database: {self.database.db_location}")
+        for name, stats in self.database.get_stats().items():
+            log("admin", "start", Status.INFO, f"{name}: {stats}")
+        log("admin", "start", Status.INFO, f"throttle: {self.throttle.limits}")
+        if self.backups.directory is not None:
+            log("admin", "start", Status.INFO,
+                f"backups: {self.backups.directory} every {self.backups.interval:g}s, keeping {self.backups.keep}")
+        if self.partitions.partitioned:
+            log("admin", "start", Status.INFO,
+                f"guild partitions: {self.partitions.guild_db_path or 'shared database'}")
+        if self.shard_count is not None:
+            shard_ids = getattr(self, "shard_ids", None)  # only auto sharded bots run more than one shard
+            log("admin", "start", Status.INFO, f"shards: {shard_ids or 'all'} of {self.shard_count}")
+
+        # only the first ready after the process starts, reconnects fire this again
+        if self.startup.mark_ready("on ready"):
+            for phase, seconds in {**self.startup.phases, **self.startup.background,
+                                   "ready": self.startup.ready}.items():
+                self.metrics.set_gauge("startup", phase, seconds)
+            log("admin", "start", Status.INFO, f"startup: {self.startup.summary()}")
+
+
+class ShardedQuoteBot(QuoteBot, commands.AutoShardedBot):
+    """
+    Quote Bot that splits its guilds across gateway shards. Pass shard_ids and shard_count to run a subset of the
+    shards in each process
+    """
@@ -0,0 +1,169 @@
+"""
+File: quotee_index.py
+Description: In-memory trigram index for fuzzy matching quotee names
+
+@author Derek Garcia
+"""
+import threading
+from collections import Counter
+from typing import Iterable, NamedTuple
+
+DEFAULT_SUGGESTION_LIMIT = 10
+DEFAULT_MIN_SCORE = 0.5
+
+
+class Suggestion(NamedTuple):
+    """
+    Quotee that matched a search and the spans of the name that matched
+    """
+    name: str
+    score: float
+    spans: tuple[tuple[int, int], ...]
+
+
+def trigrams(text: str) -> set[str]:
+    """
+    Split text into trigrams, padding each word so short words and word starts still match
+
+    :param text: Text to split
+    :return: Set of trigrams
+    """
+    grams = set()
+    for word in text.lower().split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _merge(spans: list[tuple[int, int]]) -> tuple[tuple[int, int], ...]:
+    """
+    Merge overlapping or touching spans
+
+    :param spans: List of (start, end) spans
+    :return: Sorted merged spans
+    """
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return tuple(merged)
+
+
+class QuoteeIndex:
+    def __init__(self):
+        """
+        Create a new empty quotee index
+        """
+        self._lock = threading.Lock()
+        self._names: list[str] = []
+        self._grams: list[int] = []  # number of trigrams per name
+        self._postings: dict[str, list[int]] = {}  # trigram -> name ids
+
+    def __len__(self) -> int:
+        """
+        :return: Number of indexed names
+        """
+        return len(self._names)
+
+    def load(self, names: Iterable[str]) -> None:
+        """
+        Replace the index contents
+
+        :param names: Quotee names to index
+        """
+        with self._lock:
+            self._names = []
+            self._grams = []
+            self._postings = {}
+            for name in names:
+                self._add(name)
+
+    def add(self, name: str) -> None:
+        """
+        Add a quotee name to the index
+
+        :param name: Name to add
+        """
+        with self._lock:
+            self._add(name)
+
+    def _add(self, name: str) -> None:
+        """
+        Add a name to the index. Must hold the lock
+
+        :param name: Name to add
+        """
+        name_id = len(self._names)
+        grams = trigrams(name)
+        self._names.append(name)
+        self._grams.append(len(grams))
+        for gram in grams:
+            self._postings.setdefault(gram, []).append(name_id)
+
+    def search(self, query: str, limit: int = DEFAULT_SUGGESTION_LIMIT,
+               min_score: float = DEFAULT_MIN_SCORE) -> list[Suggestion]:
+        """
+        Find the quotees most similar to the query
+
+        :param query: Name or partial name to match
+        :param limit: Max number of suggestions to return
+        :param min_score: Min fraction of the query's trigrams a name must share to be returned
+        :return: Suggestions ordered by most similar
+        """
+        query = " ".join(query.lower().split())
+        if len(query) == 0:
+            return []
+        query_grams = trigrams(query)
+
+        with self._lock:
+            # count shared trigrams per name
+            shared = Counter()
+            for gram in query_grams:
+                shared.update(self._postings.get(gram, ()))
+            # too short to share trigrams mid word, fall back to a substring scan
+            if len(query) < 3:
+                for name_id, name in enumerate(self._names):
+                    if query in name and name_id not in shared:
+                        shared[name_id] = 0
+
+            scored = []
+            for name_id, count in shared.items():
+                name = self._names[name_id]
+                score = count / len(query_grams)
+                # exact substrings always match, e.g. part of a word
+                if query in name:
+                    score = 1.0
+                if score < min_score:
+                    continue
+                # prefer names where the match is most of the name
+                dice = 2 * count / (len(query_grams) + self._grams[name_id])
+                scored.append((score, dice, name))
+
+        scored.sort(key=lambda s: (-s[0], -s[1], s[2]))
+        return [Suggestion(name, round(score, 3), self._highlight(name, query)) for score, _, name in scored[:limit]]
+
+    @staticmethod
+    def _highlight(name: str, query: str) -> tuple[tuple[int, int], ...]:
+        """
+        Get the spans of a name that match the query
+
+        :param name: Name that was matched
+        :param query: Normalized query
+        :return: Merged (start, end) spans
+        """
+        start = name.find(query)
+        if start != -1:
+            return (start, start + len(query)),
+
+        # else mark every place a query trigram appears in the name
+        spans = []
+        for word in query.split():
+            for i in range(max(1, len(word) - 2)):
+                gram = word[i:i + 3]
+                pos = name.find(gram)
+                while pos != -1:
+                    spans.append((pos, pos + len(gram)))
+                    pos = name.find(gram, pos + 1)
+        return _merge(spans)
@@ -0,0 +1,58 @@
+"""
+File: retention.py
+Description: Periodically rolls up and deletes old log rows so the database doesn't grow without bound
+
+@author Derek Garcia
+"""
+import asyncio
+import sqlite3
+
+from guilds import GuildRouter
+from logger import Status, log
+
+DEFAULT_RETENTION_INTERVAL = 6 * 60 * 60.0  # seconds
+
+
+class LogRetention:
+    def __init__(self, database: GuildRouter, days: int = None, interval: float = DEFAULT_RETENTION_INTERVAL):
+        """
+        Create a new log retention task, does nothing if no retention period is given
+
+        :param database: Guild databases to prune
+        :param days: Number of days of raw log rows to keep, keeps everything if None
+        :param interval: Seconds between runs
+        """
+        self.database = database
+        self.days = days
+        self.interval = interval
+        self._task = None
+
+    def start(self) -> None:
+        """
+        Start pruning in the background if enabled and not already running
+        """
+        if self.days is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run(), name="quotebot-log-retention")
+
+    def stop(self) -> None:
+        """
+        Stop pruning
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        """
+        Prune on start then every interval
+        """
+        while True:
+            try:
+                result = await self.database.apply_log_retention(self.days)
+                log("admin", "log retention", Status.SUCCESS,
+                    f"Rolled up {result['deleted']} log rows older than {self.days} days, "
+                    f"freed {result['freed_pages']} pages")
+            except (sqlite3.Error, OSError) as e:
+                # try again next interval
+                log("admin", "log retention", Status.ERROR, str(e))
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,102 @@
+"""
+File: startup.py
+Description: Times each phase of startup from process start until the bot is ready
+
+@author Derek Garcia
+"""
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from storage import Storage
+
+
+def process_age() -> float:
+    """
+    Get how long ago the process started, so interpreter startup before any of our code runs is counted too
+
+    :return: Seconds since the process started, 0 if unknown on this platform
+    """
+    try:
+        with open("/proc/self/stat", 'r') as stat:
+            # process name can contain spaces, fields after it are fixed, start time is the 22nd field in clock ticks
+            started = int(stat.read().rpartition(")")[2].split()[19]) / os.sysconf("SC_CLK_TCK")
+        with open("/proc/uptime", 'r') as uptime:
+            return max(0.0, float(uptime.read().split()[0]) - started)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+class StartupTimer:
+    def __init__(self):
+        """
+        Start timing, the first phase covers everything since the process started
+        """
+        now = time.perf_counter()
+        self.start = now - process_age()
+        self._last = now
+        self.phases: dict[str, float] = {"python": now - self.start}  # phase -> seconds, in order
+        self.background: dict[str, float] = {}  # work done alongside the phases, phase -> seconds
+        self.ready: float | None = None  # seconds from process start until ready
+
+    def lap(self, phase: str) -> float:
+        """
+        End a phase, it covers the time since the previous phase ended
+
+        :param phase: Name of the phase
+        :return: Seconds the phase took
+        """
+        now = time.perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+        return self.phases[phase]
+
+    def record_background(self, phase: str, seconds: float) -> None:
+        """
+        Record work that ran alongside the other phases instead of in between them
+
+        :param phase: Name of the work
+        :param seconds: Seconds the work took
+        """
+        self.background[phase] = seconds
+
+    def mark_ready(self, phase: str) -> bool:
+        """
+        End the last phase and stop timing, only the first call counts
+
+        :param phase: Name of the last phase
+        :return: True if this was the first call
+        """
+        if self.ready is not None:
+            return False
+        self.lap(phase)
+        self.ready = time.perf_counter() - self.start
+        return True
+
+    def summary(self) -> str:
+        """
+        :return: Phase breakdown, e.g. python 0.05s | imports 0.40s | ... | ready 3.10s
+        """
+        phases = [f"{name} {seconds:.2f}s" for name, seconds in self.phases.items()]
+        background = [f"{name} {seconds:.2f}s in background" for name, seconds in self.background.items()]
+        total = [] if self.ready is None else [f"ready {self.ready:.2f}s"]
+        return " | ".join(phases + total + background)
+
+
+def warm_up_in_background(storage: Storage, timer: StartupTimer) -> Future:
+    """
+    Warm up a storage backend on its own thread so loading overlaps importing discord.py, logging in and connecting
+
+    :param storage: Storage backend opened without warming up
+    :param timer: Startup timer to record the warm up time in
+    :return: Future that is done once the backend is warm
+    """
+    def run() -> None:
+        start = time.perf_counter()
+        storage.warm_up()
+        timer.record_background("warm up", time.perf_counter() - start)
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="quotebot-warm-up")
+    future = executor.submit(run)
+    executor.shutdown(wait=False)  # thread exits once the warm up is done
+    return future
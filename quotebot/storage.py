@@ -0,0 +1,237 @@
+"""
+File: storage.py
+Description: Interface every quote storage backend implements
+
+@author Derek Garcia
+"""
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator
+
+from metrics import Metrics
+from quote import Quote
+from quotee_index import DEFAULT_SUGGESTION_LIMIT, Suggestion
+
+DEFAULT_GUILD_ID = 0  # direct messages, unpartitioned bots and quotes added before guilds were tracked
+DUPLICATE_QUOTE = 0  # add_quote result when the quotee already has the same quote
+DEFAULT_SEARCH_LIMIT = 5
+DEFAULT_PAGE_SIZE = 20
+DEFAULT_IMPORT_BATCH_SIZE = 50000
+EXPORT_FIELDS = ("time", "pre_context", "quote", "post_context", "quotee", "contributor")
+
+
+class Storage(ABC):
+    db_location: str  # where the backend keeps its data
+    metrics: Metrics  # latency of each query method
+    concurrency: int  # worker threads to run queries on, 0 if queries never block and can run on the event loop
+
+    @abstractmethod
+    def warm_up(self) -> None:
+        """
+        Load anything kept in memory, queries are only correct after this. Safe to call more than once and from another
+        thread, only the first call does any work
+        """
+
+    @abstractmethod
+    def add_quote(self, quote: Quote, contributor: str, guild_id: int = DEFAULT_GUILD_ID) -> int:
+        """
+        Add a quote
+
+        :param quote: Quote to add
+        :param contributor: Contributor who added the quote
+        :param guild_id: Guild the quote was added in
+        :return: Quote ID, DUPLICATE_QUOTE if the quotee already has the same quote
+        """
+
+    @abstractmethod
+    def add_quotes(self, records: list[tuple[Quote, str]], guild_id: int = DEFAULT_GUILD_ID) -> list[int]:
+        """
+        Add a batch of quotes at once, e.g. in a single transaction
+
+        :param records: List of (quote, contributor) to add
+        :param guild_id: Guild the quotes were added in
+        :return: Quote ID of each record in order, DUPLICATE_QUOTE for each the quotee already has
+        """
+
+    @abstractmethod
+    def import_quotes(self, records: Iterable[tuple[Quote, str, str | None]],
+                      batch_size: int = DEFAULT_IMPORT_BATCH_SIZE, guild_id: int = DEFAULT_GUILD_ID) -> int:
+        """
+        Bulk add quotes, skipping duplicates
+
+        :param records: Iterable of (quote, contributor, optional time) to add
+        :param batch_size: Number of quotes to write at a time
+        :param guild_id: Guild to add the quotes to
+        :return: Number of quotes added
+        """
+
+    @abstractmethod
+    def export_quotes(self, guild_id: int = DEFAULT_GUILD_ID) -> Iterator[dict]:
+        """
+        Stream every quote of a guild
+
+        :param guild_id: Guild to export quotes from
+        :return: Iterator of quote records with the EXPORT_FIELDS keys
+        """
+
+    @abstractmethod
+    def find_similar_quotee(self, quotee: str, limit: int = DEFAULT_SUGGESTION_LIMIT,
+                            guild_id: int = DEFAULT_GUILD_ID) -> list[Suggestion]:
+        """
+        Get list of quotees that a similar to the given quotee
+
+        :param quotee: Quotee to attempt to match
+        :param limit: Max number of quotees to return
+        :param guild_id: Guild to search quotees of
+        :return: List of similar quotees ordered by most similar, with the spans of each name that matched
+        """
+
+    @abstractmethod
+    def get_all_quotees(self, guild_id: int = DEFAULT_GUILD_ID) -> list[str]:
+        """
+        Get all quotees of a guild
+
+        :param guild_id: Guild to get quotees of
+        :return: List of quotees
+        """
+
+    @abstractmethod
+    def get_all_quotes(self, quotee: str = None, guild_id: int = DEFAULT_GUILD_ID) -> list[Quote]:
+        """
+        Get all quotes of a guild or for specific quotee
+
+        :param quotee: Optional quotee to get all quotes for
+        :param guild_id: Guild to get quotes of
+        :return: List of Quotes
+        """
+
+    @abstractmethod
+    def get_quote_page(self, quotee: str, page: int = 1, page_size: int = DEFAULT_PAGE_SIZE,
+                       guild_id: int = DEFAULT_GUILD_ID) -> list[Quote]:
+        """
+        Get one page of a quotee's quotes in the order they were added
+
+        :param quotee: Quotee to get quotes for
+        :param page: Page number, starting at 1
+        :param page_size: Number of quotes per page
+        :param guild_id: Guild of the quotee
+        :return: List of at most page size Quotes, empty if the page is out of range
+        """
+
+    @abstractmethod
+    def get_rand_quote(self, quotee: str = None, guild_id: int = DEFAULT_GUILD_ID) -> Quote | None:
+        """
+        Get a random quote from a guild or specific quotee
+
+        :param quotee: Optional quotee to get a random quote from
+        :param guild_id: Guild to get a random quote from
+        :return: Quote or None if no quotes from quotee
+        """
+
+    @abstractmethod
+    def search_quotes(self, keywords: str, limit: int = DEFAULT_SEARCH_LIMIT,
+                      guild_id: int = DEFAULT_GUILD_ID) -> list[Quote]:
+        """
+        Full text search the quote and context text of a guild's quotes
+
+        :param keywords: Words to search for, all must be present as words or word prefixes
+        :param limit: Max number of quotes to return
+        :param guild_id: Guild to search quotes of
+        :return: List of Quotes ordered by relevance
+        """
+
+    @abstractmethod
+    def get_quote_total(self, quotee: str = None, guild_id: int = DEFAULT_GUILD_ID) -> int:
+        """
+        Get the total number of quotes of a guild or for a quotee
+
+        :param quotee: Optional quotee to get a total quotes from
+        :param guild_id: Guild to count quotes of
+        :return: Number of quotes
+        """
+
+    @abstractmethod
+    def get_quote_total_all_guilds(self) -> int:
+        """
+        Get the total number of quotes across every guild
+
+        :return: Number of quotes
+        """
+
+    @abstractmethod
+    def get_quotee_total(self, guild_id: int = DEFAULT_GUILD_ID) -> int:
+        """
+        Get the total number of quotees of a guild
+
+        :param guild_id: Guild to count quotees of
+        :return: Number of quotees in the guild
+        """
+
+    @abstractmethod
+    def log(self, user: str, action: str, status: str, add_info=None, guild_id: int = DEFAULT_GUILD_ID) -> None:
+        """
+        Queue log message to be saved. Must not block
+
+        :param user: User who performed the action
+        :param action: Action performed
+        :param status: Status / result of action
+        :param add_info: Optional additional details to add
+        :param guild_id: Guild the action was performed in
+        """
+
+    @abstractmethod
+    def flush_logs(self) -> int:
+        """
+        Save all queued log messages now
+
+        :return: Number of log messages saved
+        """
+
+    @abstractmethod
+    def apply_log_retention(self, days: int) -> dict:
+        """
+        Roll log messages older than the retention period up into daily counts and delete them
+
+        :param days: Number of days of raw log messages to keep
+        :return: Dictionary of rows deleted and pages freed
+        """
+
+    @abstractmethod
+    def backup(self, location: str) -> dict:
+        """
+        Write a consistent copy of the store while it stays in use
+
+        :param location: File to write the copy to, replaced in one step once the copy is complete
+        :return: Dictionary of the size of the copy in bytes and the steps taken to copy it
+        """
+
+    @abstractmethod
+    def get_stats(self) -> dict[str, dict]:
+        """
+        Get backend specific usage stats
+
+        :return: Dictionary of stat group name to stats
+        """
+
+    @abstractmethod
+    def open_partition(self, location: str) -> "Storage":
+        """
+        Open another store of the same kind for a guild partition, sharing this store's metrics
+
+        :param location: Where the partition keeps its data
+        :return: Storage for the partition
+        """
+
+    @abstractmethod
+    def count_partition(self, location: str) -> int:
+        """
+        Count the quotes of a guild partition without opening it
+
+        :param location: Where the partition keeps its data
+        :return: Number of quotes in the partition
+        """
+
+    @abstractmethod
+    def close(self) -> None:
+        """
+        Save anything pending and release resources
+        """
@@ -0,0 +1,143 @@
+"""
+File: throttle.py
+Description: Token bucket rate limits on commands and quote-like adds per user, channel and guild
+
+@author Derek Garcia
+"""
+import time
+from collections import OrderedDict
+from typing import Hashable, NamedTuple
+
+from metrics import Metrics
+
+SCOPES = ("user", "channel", "guild")
+DEFAULT_LIMITS = {"user": "5/10", "channel": "20/10", "guild": "60/10"}  # scope -> <burst>/<seconds to refill>
+DEFAULT_MAX_BUCKETS = 10000  # least recently used buckets past this are forgotten and start full again
+DISABLED = ("", "0", "off", "none")
+
+
+class Limit(NamedTuple):
+    """
+    Max number of messages in a burst and the seconds it takes to refill the whole burst
+    """
+    burst: float
+    period: float
+
+
+class Rejection(NamedTuple):
+    """
+    Scope that throttled a message and how long until it would be allowed
+    """
+    scope: str
+    retry_after: float
+    notify: bool  # first rejection since the bucket last allowed a message, so only one reply is sent per burst
+
+
+def parse_limit(text: str | None) -> Limit | None:
+    """
+    Parse a limit
+
+    :param text: Limit as <burst>/<seconds>, e.g. 5/10 for 5 messages at once refilled over 10 seconds
+    :return: Limit or None if disabled
+    """
+    if text is None or text.strip().lower() in DISABLED:
+        return None
+    burst, _, period = text.partition("/")
+    limit = Limit(float(burst), float(period or 1))
+    if limit.burst <= 0 or limit.period <= 0:
+        raise ValueError(f"Invalid limit '{text}', expected <burst>/<seconds> with both above 0")
+    return limit
+
+
+class Throttle:
+    def __init__(self, metrics: Metrics, limits: dict[str, Limit | None] = None,
+                 max_buckets: int = DEFAULT_MAX_BUCKETS):
+        """
+        Create a new throttle. Only used from the event loop so nothing is locked
+
+        :param metrics: Metrics registry to count throttled messages in
+        :param limits: Limit of each scope, None disables a scope. Uses DEFAULT_LIMITS if not given
+        :param max_buckets: Max number of buckets to keep across every scope
+        """
+        if limits is None:
+            limits = {scope: parse_limit(text) for scope, text in DEFAULT_LIMITS.items()}
+        self.limits = {scope: limits.get(scope) for scope in SCOPES}
+        self.metrics = metrics
+        self.max_buckets = max_buckets
+        self._buckets: OrderedDict[tuple[str, Hashable], list] = OrderedDict()  # key -> [tokens, updated, notified]
+        self._clock = time.monotonic
+
+        # stats
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        """
+        :return: True if any scope is limited
+        """
+        return any(limit is not None for limit in self.limits.values())
+
+    def _bucket(self, key: tuple[str, Hashable], limit: Limit, now: float) -> list:
+        """
+        Get a bucket refilled up to now, creating a full one if it doesn't exist
+
+        :param key: (scope, id) of the bucket
+        :param limit: Limit of the bucket's scope
+        :param now: Current clock time
+        :return: Bucket
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [limit.burst, now, False]
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+            return bucket
+
+        self._buckets.move_to_end(key)
+        bucket[0] = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.burst / limit.period)
+        bucket[1] = now
+        return bucket
+
+    def check(self, user_id: Hashable, channel_id: Hashable, guild_id: Hashable | None,
+              cost: float = 1.0) -> Rejection | None:
+        """
+        Take tokens for a message from the user, channel and guild buckets. Tokens are only taken if every bucket has
+        enough
+
+        :param user_id: ID of the author
+        :param channel_id: ID of the channel
+        :param guild_id: ID of the guild, None for direct messages
+        :param cost: Tokens the message costs
+        :return: None if allowed, else the scope that rejected it
+        """
+        now = self._clock()
+        buckets = []
+        for scope, key in zip(SCOPES, (user_id, channel_id, guild_id)):
+            limit = self.limits[scope]
+            if limit is None or key is None:
+                continue
+            bucket = self._bucket((scope, key), limit, now)
+            if bucket[0] < cost:
+                notify = not bucket[2]
+                bucket[2] = True
+                self.metrics.count("throttled", scope)
+                return Rejection(scope, (cost - bucket[0]) * limit.period / limit.burst, notify)
+            buckets.append(bucket)
+
+        for bucket in buckets:
+            bucket[0] -= cost
+            bucket[2] = False
+        return None
+
+    def stats(self) -> dict:
+        """
+        Get throttle stats
+
+        :return: Dictionary of throttle stats
+        """
+        return {
+            "buckets": len(self._buckets),
+            "evictions": self.evictions,
+            "throttled": self.metrics.counts("throttled"),
+        }
@@ -0,0 +1,71 @@
+"""
+File: test_ingest.py
+Description: Ordering and shutdown tests for the quote-like ingestion queue
+
+@author Derek Garcia
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "quotebot"))
+
+from ingest import FAILED_QUOTE, IngestQueue  # noqa: E402
+from metrics import Metrics  # noqa: E402
+
+
+class Message:
+    def __init__(self, content: str, guild=None):
+        self.content = content
+        self.guild = guild
+        self.author = "user"
+
+
+class RecordingDatabase:
+    """
+    Guild database that records the order quotes are written in
+    """
+    guild_id = 0
+
+    def __init__(self):
+        self.database = self
+        self.written = []
+
+    async def add_quotes(self, records: list) -> list[int]:
+        await asyncio.sleep(0)  # let other tasks run mid write like a real executor call
+        self.written.extend(q.quote for q, _ in records)
+        return list(range(len(self.written) - len(records) + 1, len(self.written) + 1))
+
+    def log(self, *args, **kwargs) -> None:
+        pass
+
+
+class IngestQueueTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.database = RecordingDatabase()
+
+        async def get_database(guild):
+            # a database without the guild database interface fails past the per message and per guild handling
+            return object() if guild == "broken" else self.database
+
+        self.ingest = IngestQueue(Metrics(), get_database, batch_size=10, batch_delay=0.05)
+
+    async def test_flush_keeps_queued_order(self):
+        for i in range(5):
+            await self.ingest.put(Message(f'"quote {i}" -Frank'))
+        await asyncio.sleep(0)  # worker takes the first message and waits out the batch delay
+        await self.ingest.flush()
+        self.assertEqual(self.database.written, [f"quote {i}" for i in range(5)])
+        await self.ingest.close()
+
+    async def test_put_after_close_never_raises(self):
+        await self.ingest.close()
+        result = await self.ingest.put(Message('"lost" -Frank', "broken"))
+        self.assertEqual(result.result(), FAILED_QUOTE)
+        result = await self.ingest.put(Message('"kept" -Frank'))
+        self.assertEqual(result.result(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+"""
+File: test_memory_storage.py
+Description: Recovery and duplicate tests for the memory storage append log
+
+@author Derek Garcia
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "quotebot"))
+
+from memory_storage import MemoryStorage  # noqa: E402
+from quote import Quote  # noqa: E402
+
+
+def crash(store: MemoryStorage) -> None:
+    """
+    Stop a store without the snapshot close takes, like the process dying
+
+    :param store: Store to stop
+    """
+    store.log_sink.close()
+    store._file.close()  # pylint: disable=protected-access
+
+
+class TornRecordTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.directory.name, "quotes.snapshot")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_write_after_torn_final_record_survives_reload(self):
+        store = MemoryStorage(self.location)
+        self.assertEqual(store.add_quote(Quote("one", "frank"), "user"), 1)
+        store.snapshot()
+        crash(store)
+        # torn write is the only record after the snapshot
+        with open(f"{self.location}.log", 'a', encoding='utf-8') as file:
+            file.write('{"op": "quote", "time": "2026-01-01 00:00:00", "gui')
+
+        store = MemoryStorage(self.location)
+        self.assertEqual(store.add_quote(Quote("two", "frank"), "user"), 2)
+        crash(store)
+
+        store = MemoryStorage(self.location)
+        self.assertEqual([q.quote for q in store.get_all_quotes("frank")], ["one", "two"])
+        store.close()
+
+
+class KeptDuplicateTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.directory.name, "quotes.snapshot")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_duplicate_from_log_is_kept_but_not_counted(self):
+        store = MemoryStorage(self.location)
+        store.add_quote(Quote("Same words", "frank"), "user")
+        crash(store)
+        # copy saved by a version without duplicate detection
+        with open(f"{self.location}.log", 'a', encoding='utf-8') as file:
+            file.write(json.dumps({"op": "quote", "time": "2026-01-01 00:00:00", "guild_id": 0, "pre_context": None,
+                                   "quote": "same words!", "post_context": None, "quotee": "frank",
+                                   "contributor": "user", "seq": 2}) + "\n")
+
+        store = MemoryStorage(self.location)
+        self.assertEqual(store.get_quote_total("frank"), 1)
+        self.assertEqual(len(store.get_all_quotes("frank")), 1)
+        self.assertEqual(len(store.search_quotes("same")), 1)
+        store.close()
+
+        # still on disk after the snapshot close takes
+        store = MemoryStorage(self.location)
+        self.assertEqual(store.get_stats()["memory storage"]["duplicates"], 1)
+        self.assertEqual(store.get_quote_total("frank"), 1)
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()